@@ -2,9 +2,10 @@ import logging
 from aiogram import Bot
 
 from keyboards import create_keyboard_answer
+from save_media import send_media
+from send_scheduler import send_priority, PRIORITY_HIGH
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
@@ -23,22 +24,23 @@ async def notify_admins_about_request(bot: Bot, request_id, user_data, request_d
         f"Описание: <b>{request_data['description']}</b>"
     )
 
-    logger.info(f"Отправка уведомления админу {admin_id} о заявке {request_id}")
+    logger.info("Отправка уведомления админу %s о заявке %s", admin_id, request_id)
 
+    # Уведомления администраторов отправляются раньше остальных сообщений в очереди
+    with send_priority(PRIORITY_HIGH):
+        await _send_notification(bot, request_id, request_text, request_data, admin_id)
+
+
+async def _send_notification(bot: Bot, request_id, request_text, request_data, admin_id):
     try:
         if request_data.get("media"):
-            file_path = request_data["media"].split('.')[0]
-            try:
-                logger.info(f"Отправка фото админу {admin_id} для заявки {request_id}")
-                await bot.send_photo(chat_id=admin_id, photo=file_path, caption=request_text,
-                                     reply_markup=create_keyboard_answer(request_id), parse_mode="html")
-            except Exception:
-                logger.warning(f"Ошибка при отправке фото, пробуем отправить видео админу {admin_id}")
-                await bot.send_video(chat_id=admin_id, video=file_path, caption=request_text,
-                                     reply_markup=create_keyboard_answer(request_id), parse_mode="html")
+            # Медиафайл пересылается по file_id, с диска загружается только при ошибке
+            logger.info("Отправка медиафайла админу %s для заявки %s", admin_id, request_id)
+            await send_media(bot, admin_id, request_data["media"], caption=request_text,
+                             reply_markup=create_keyboard_answer(request_id), parse_mode="html")
         else:
-            logger.info(f"Отправка текстового сообщения админу {admin_id} для заявки {request_id}")
+            logger.info("Отправка текстового сообщения админу %s для заявки %s", admin_id, request_id)
             await bot.send_message(chat_id=admin_id, text=request_text,
                                    reply_markup=create_keyboard_answer(request_id), parse_mode="html")
     except Exception as e:
-        logger.error(f"Ошибка при отправке уведомления админу {admin_id}: {e}")
+        logger.error("Ошибка при отправке уведомления админу %s: %s", admin_id, e)
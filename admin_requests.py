@@ -0,0 +1,231 @@
+import html
+import logging
+import re
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+
+import config
+from cache import TTLCache, MISSING
+from keyboards import requests_menu_admins, requests_page_keyboard, search_page_keyboard
+from states import AdminRequestsStates
+from work_database import get_user_data, get_open_requests_page, search_requests, search_terms
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+REQUESTS_PAGE_SIZE = getattr(config, "REQUESTS_PAGE_SIZE", 5)  # Заявок на одной странице списка
+REQUESTS_CURSOR_TTL = getattr(config, "REQUESTS_CURSOR_TTL", 600)  # Время жизни позиции просмотра в секундах
+SEARCH_MAX_MATCHES = getattr(config, "SEARCH_MAX_MATCHES", 1000)  # Сколько самых новых совпадений ранжируется
+
+SCOPE_TITLES = {"my": "Мои открытые заявки", "all": "Все открытые заявки"}
+DESCRIPTION_PREVIEW = 100  # Длина описания заявки в списке
+
+# Позиция просмотра списка по Telegram ID администратора:
+# ключи начала уже открытых страниц (для перехода назад без повторного обхода) и ключ конца текущей
+queue_cursors = TTLCache(maxsize=256, ttl=REQUESTS_CURSOR_TTL)
+# Текст последнего поиска по Telegram ID администратора (не помещается в callback_data кнопок)
+search_queries = TTLCache(maxsize=256, ttl=REQUESTS_CURSOR_TTL)
+
+STATUS_TITLES = {"open": "🕓 В работе", "closed": "✅ Закрыта"}
+
+
+def format_requests_page(title, requests, page):
+    """Формирует текст страницы списка заявок"""
+    if not requests:
+        return f"<b>{title}</b>\nОткрытых заявок нет."
+
+    lines = [f"<b>{title}</b>, страница {page + 1}"]
+    for request in requests:
+        description = request["description"] or "—"
+        if len(description) > DESCRIPTION_PREVIEW:
+            description = description[:DESCRIPTION_PREVIEW] + "…"
+        lines.append(
+            f"\n<b>№{request['request_id']}</b> · {html.escape(request['category'] or '—')} · {request['created_at']}\n"
+            f"От: {html.escape(request['user_fio'] or '—')}, "
+            f"исполнитель: {html.escape(request['admin_fio'] or 'не назначен')}\n"
+            f"Адрес: {html.escape(request['address'] or '—')}\n"
+            f"{html.escape(description)}"
+        )
+    return "\n".join(lines)
+
+
+def highlight(text, words):
+    """Экранирует текст для HTML и выделяет жирным слова, начинающиеся с одного из префиксов words, и числа из words."""
+    if not words:
+        return html.escape(text)
+    alternatives = (re.escape(word) + (r"(?!\w)" if word.isdigit() else r"\w*") for word in words)
+    pattern = re.compile(r"\b(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+    parts = []
+    position = 0
+    for found in pattern.finditer(text):
+        parts.append(html.escape(text[position:found.start()]))
+        parts.append(f"<b>{html.escape(found.group())}</b>")
+        position = found.end()
+    parts.append(html.escape(text[position:]))
+    return "".join(parts)
+
+
+def format_search_page(query, requests, page):
+    """Формирует текст страницы результатов поиска"""
+    title = f"Поиск «{html.escape(query)}»"
+    if not requests:
+        return f"<b>{title}</b>\nНичего не найдено." if page == 0 else f"<b>{title}</b>\nБольше результатов нет."
+
+    words = search_terms(query)
+    lines = [f"<b>{title}</b>, страница {page + 1}"]
+    for request in requests:
+        description = request["description"] or "—"
+        if len(description) > DESCRIPTION_PREVIEW:
+            description = description[:DESCRIPTION_PREVIEW] + "…"
+        status = STATUS_TITLES.get(request["status"], request["status"] or "—")
+        lines.append(
+            f"\n<b>№{request['request_id']}</b> · {status} · {html.escape(request['category'] or '—')} · "
+            f"{request['created_at']}\n"
+            f"Адрес: {highlight(request['address'] or '—', words)}\n"
+            f"{highlight(description, words)}"
+        )
+    return "\n".join(lines)
+
+
+async def get_admin(telegram_id):
+    """Возвращает профиль пользователя, если он администратор, иначе None."""
+    user_data = await get_user_data(telegram_id)
+    if not user_data or user_data["role"] != "admin":
+        logger.warning("Пользователь %s не является администратором.", telegram_id)
+        return None
+    return user_data
+
+
+async def _load_page(telegram_id, admin, scope, direction):
+    """
+    Сдвигает позицию просмотра администратора в направлении direction ("first", "next", "prev")
+    и возвращает текст и клавиатуру страницы.
+    """
+    cursor = queue_cursors.get(telegram_id)
+    if cursor is MISSING or cursor["scope"] != scope or direction == "first":
+        # Позиция устарела или список открыт заново — начинаем с первой страницы
+        cursor = {"scope": scope, "starts": [None], "page": 0, "last": None}
+    elif direction == "next" and cursor["last"] is not None:
+        cursor["page"] += 1
+        del cursor["starts"][cursor["page"]:]
+        cursor["starts"].append(cursor["last"])
+    elif direction == "prev" and cursor["page"] > 0:
+        cursor["page"] -= 1
+
+    requests, has_next = await get_open_requests_page(
+        after=cursor["starts"][cursor["page"]], limit=REQUESTS_PAGE_SIZE,
+        admin_id=admin["id"] if scope == "my" else None)
+
+    cursor["last"] = (requests[-1]["admin_id"], requests[-1]["request_id"]) if has_next else None
+    queue_cursors.set(telegram_id, cursor)
+
+    text = format_requests_page(SCOPE_TITLES[scope], requests, cursor["page"])
+    markup = requests_page_keyboard(scope, [request["request_id"] for request in requests],
+                                    has_prev=cursor["page"] > 0, has_next=has_next)
+    return text, markup
+
+
+async def handle_requests_menu(message: types.Message, state: FSMContext):
+    """Обработчик для кнопки '📋 Заявки'"""
+    await state.set_state(AdminRequestsStates.requests_menu)
+    await message.answer("Выберите, какие заявки показать:", reply_markup=requests_menu_admins())
+
+
+async def handle_open_requests(message: types.Message, state: FSMContext):
+    """Обработчик для кнопок '📋 Мои открытые заявки' и '📋 Все открытые заявки': первая страница списка"""
+    admin = await get_admin(message.from_user.id)
+    if not admin:
+        await message.answer("У вас нет прав для выполнения этой операции.")
+        return
+
+    scope = "my" if message.text == "📋 Мои открытые заявки" else "all"
+    logger.info("Администратор %s открыл список заявок %s.", message.from_user.id, scope)
+
+    text, markup = await _load_page(message.from_user.id, admin, scope, "first")
+    await message.answer(text, parse_mode="html", reply_markup=markup)
+
+
+async def handle_requests_page(query: types.CallbackQuery):
+    """Обработчик кнопок перехода между страницами списка заявок (callback_data вида queue:<вид>:<направление>)"""
+    admin = await get_admin(query.from_user.id)
+    if not admin:
+        await query.answer("У вас нет прав для выполнения этой операции.", show_alert=True)
+        return
+
+    _, scope, direction = query.data.split(":")
+    if scope not in SCOPE_TITLES:
+        await query.answer()
+        return
+
+    text, markup = await _load_page(query.from_user.id, admin, scope, direction)
+    try:
+        await query.message.edit_text(text, parse_mode="html", reply_markup=markup)
+    except TelegramBadRequest as e:
+        # Страница не изменилась (например, повторное нажатие «🔄»)
+        logger.debug("Страница списка заявок не обновлена: %s", e)
+    await query.answer()
+
+
+async def _search_page(query, page):
+    """Возвращает текст и клавиатуру страницы результатов поиска."""
+    requests, has_next = await search_requests(query, page=page, limit=REQUESTS_PAGE_SIZE,
+                                               max_matches=SEARCH_MAX_MATCHES)
+    text = format_search_page(query, requests, page)
+    markup = search_page_keyboard([request["request_id"] for request in requests if request["status"] == "open"],
+                                  page, has_next)
+    return text, markup
+
+
+async def handle_search_prompt(message: types.Message, state: FSMContext):
+    """Обработчик для кнопки '🔍 Поиск': запрашивает слова для поиска"""
+    await state.set_state(AdminRequestsStates.search)
+    await message.answer("Введите слова из описания или адреса заявки:", reply_markup=requests_menu_admins())
+
+
+async def handle_search(message: types.Message, state: FSMContext):
+    """
+    Ищет заявки по словам в описании и адресе: команда /search <слова>
+    или текст, введённый после кнопки '🔍 Поиск'.
+    """
+    admin = await get_admin(message.from_user.id)
+    if not admin:
+        await message.answer("У вас нет прав для выполнения этой операции.")
+        return
+
+    query = message.text or ""
+    if query.startswith("/search"):
+        query = query[len("/search"):]
+    query = query.strip()
+    if not re.search(r"\w", query):
+        await message.answer("Укажите слова для поиска, например: /search Ленина 5")
+        return
+
+    logger.info("Администратор %s ищет заявки: %s", message.from_user.id, query)
+    search_queries.set(message.from_user.id, query)
+
+    text, markup = await _search_page(query, 0)
+    await state.set_state(AdminRequestsStates.requests_menu)
+    await message.answer(text, parse_mode="html", reply_markup=markup)
+
+
+async def handle_search_page(query: types.CallbackQuery):
+    """Обработчик кнопок перехода между страницами результатов поиска (callback_data вида search:<страница>)"""
+    admin = await get_admin(query.from_user.id)
+    if not admin:
+        await query.answer("У вас нет прав для выполнения этой операции.", show_alert=True)
+        return
+
+    search_text = search_queries.get(query.from_user.id)
+    if search_text is MISSING:
+        await query.answer("Результаты поиска устарели, повторите поиск.", show_alert=True)
+        return
+
+    text, markup = await _search_page(search_text, max(int(query.data.split(":")[1]), 0))
+    try:
+        await query.message.edit_text(text, parse_mode="html", reply_markup=markup)
+    except TelegramBadRequest as e:
+        logger.debug("Страница результатов поиска не обновлена: %s", e)
+    await query.answer()
@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import work_database
+from benchmarks.generate_database import generate_database, ADMINS, USERS_PER_REQUEST, STREETS
+from benchmarks.webhook_benchmark import percentile
+from db_connection import ConnectionManager
+from export_requests import fetch_data_from_db
+from migrations import check_query_plans
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "data_baseline.json")
+REGRESSION_RATIO = 1.5  # Во сколько раз медиана может вырасти относительно эталона
+REGRESSION_MIN_MS = 0.2  # Рост меньше этого значения, мс, считается шумом
+
+
+def _summary(timings):
+    """Сводка замеров в миллисекундах."""
+    timings = sorted(timings)
+    return {
+        "calls": len(timings),
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+        "mean_ms": round(sum(timings) / len(timings) * 1000, 3),
+    }
+
+
+async def _measure(call, arguments):
+    """Вызывает call(*args) для каждого набора аргументов и возвращает сводку задержек."""
+    timings = []
+    for args in arguments:
+        started = time.perf_counter()
+        await call(*args)
+        timings.append(time.perf_counter() - started)
+    return _summary(timings)
+
+
+async def _run_functions(database_path, requests_count, iterations, rnd):
+    """Замеряет функции work_database на базе database_path."""
+    users_count = max(int(requests_count * USERS_PER_REQUEST), 1)
+    request_ids = [(rnd.randint(1, requests_count),) for _ in range(iterations)]
+    telegram_ids = [(10_000_000 + rnd.randint(1, users_count + ADMINS),) for _ in range(iterations)]
+    user_ids = [rnd.randint(ADMINS + 1, users_count + ADMINS) for _ in range(iterations)]
+    searches = [(f"{rnd.choice(STREETS)} {rnd.randint(1, 120)}",) for _ in range(iterations)]
+    request_data = {"category": "Вывоз ТКО", "address": "г. Петрозаводск, ул. Ленина, д. 1",
+                    "description": "Контейнерная площадка не убрана", "status": "open"}
+
+    def uncached(function):
+        # Кэш профилей сбрасывается, чтобы замерять запрос к БД, а не словарь
+        async def call(*args):
+            work_database.user_cache.clear()
+            return await function(*args)
+        return call
+
+    results = {
+        "get_request_details": await _measure(work_database.get_request_details, request_ids),
+        "get_available_admin_id": await _measure(work_database.get_available_admin_id, [()] * iterations),
+        "get_admins": await _measure(work_database.get_admins, [()] * iterations),
+        "user_exists": await _measure(uncached(work_database.user_exists), telegram_ids),
+        "get_user_data": await _measure(uncached(work_database.get_user_data), telegram_ids),
+        "search_requests": await _measure(work_database.search_requests, searches),
+        "save_request_data": await _measure(
+            work_database.save_request_data, [(user_id, request_data, 1) for user_id in user_ids]),
+        "submit_request": await _measure(
+            work_database.submit_request, [(user_id, request_data, ()) for user_id in user_ids]),
+        "save_media_to_db": await _measure(
+            work_database.save_media_to_db, [(request_id, f"sources/requests/bench/{i}.jpg")
+                                             for i, (request_id,) in enumerate(request_ids)]),
+    }
+    return results
+
+
+def _run_export(database_path, rounds):
+    """Замеряет чтение заявок за последние 30 дней через fetch_data_from_db."""
+    timings = []
+    rows = 0
+    for _ in range(rounds):
+        conn = sqlite3.connect(database_path)
+        started = time.perf_counter()
+        rows = sum(len(chunk) for chunk in fetch_data_from_db(
+            conn, "r.created_at >= DATETIME('now', '-30 days')"))
+        timings.append(time.perf_counter() - started)
+        conn.close()
+    result = _summary(timings)
+    result["rows"] = rows
+    return result
+
+
+def run_size(requests_count, workdir, iterations, export_rounds, seed=42):
+    """Замеряет слой данных на базе с requests_count заявками (база создаётся один раз и переиспользуется)."""
+    database_path = os.path.join(workdir, f"data_{requests_count}.db")
+    if not os.path.exists(database_path):
+        generate_database(database_path, requests_count, seed)
+
+    with sqlite3.connect(database_path) as conn:
+        max_request_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM requests").fetchone()[0]
+        max_media_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM media").fetchone()[0]
+        try:
+            check_query_plans(conn)
+            plans_ok = True
+        except RuntimeError as e:
+            logger.error(str(e))
+            plans_ok = False
+
+    manager = ConnectionManager(database_path)
+    saved_db, work_database.db = work_database.db, manager
+    try:
+        results = asyncio.run(_run_functions(database_path, requests_count, iterations, random.Random(seed)))
+    finally:
+        work_database.db = saved_db
+        manager.close()
+        # Удаляем строки, добавленные замерами записи, чтобы повторные прогоны шли на той же базе
+        with sqlite3.connect(database_path) as conn:
+            conn.execute("DELETE FROM media WHERE id > ?", (max_media_id,))
+            conn.execute("DELETE FROM requests WHERE id > ?", (max_request_id,))
+
+    results["fetch_data_from_db"] = _run_export(database_path, export_rounds)
+    results["query_plans_ok"] = plans_ok
+    return results
+
+
+def compare(results, baseline, ratio=REGRESSION_RATIO, min_ms=REGRESSION_MIN_MS):
+    """Возвращает список регрессий: медиана выросла больше чем в ratio раз и больше чем на min_ms."""
+    regressions = []
+    for size, functions in results["sizes"].items():
+        for name, result in functions.items():
+            reference = baseline.get("sizes", {}).get(size, {}).get(name)
+            if reference is None:
+                continue
+            if name == "query_plans_ok":
+                if reference and not result:
+                    regressions.append(f"{size}: планы горячих запросов перешли к полному сканированию")
+                continue
+            if result["p50_ms"] > reference["p50_ms"] * ratio and result["p50_ms"] - reference["p50_ms"] > min_ms:
+                regressions.append(f"{size}/{name}: p50 {reference['p50_ms']} -> {result['p50_ms']} мс")
+    return regressions
+
+
+def run_data_benchmark(sizes, workdir, iterations, export_rounds):
+    """Прогоняет замеры на всех размерах баз и возвращает результаты с описанием окружения."""
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "machine": platform.machine(),
+        "iterations": iterations,
+        "sizes": {},
+    }
+    for size in sizes:
+        started = time.perf_counter()
+        results["sizes"][str(size)] = run_size(size, workdir, iterations, export_rounds)
+        logger.info(f"База с {size} заявками: замеры заняли {time.perf_counter() - started:.1f} с")
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Бенчмарк функций слоя данных на синтетических базах")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--iterations", type=int, default=200, help="Вызовов каждой функции")
+    parser.add_argument("--export-rounds", type=int, default=3)
+    parser.add_argument("--workdir", default=None, help="Папка для баз (по умолчанию временная)")
+    parser.add_argument("--output", default="data_benchmark.json", help="Файл результатов")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Файл эталонных результатов")
+    parser.add_argument("--save-baseline", action="store_true", help="Сохранить результаты как эталон")
+    parser.add_argument("--compare", action="store_true",
+                        help="Обязательно сравнить с эталоном: без файла эталона завершиться с ошибкой")
+    args = parser.parse_args()
+
+    if args.compare and args.save_baseline:
+        parser.error("--compare и --save-baseline нельзя использовать вместе")
+    if args.compare and not os.path.exists(args.baseline):
+        # Проверяем до замеров, чтобы не ждать прогона на больших базах впустую
+        logger.error(f"Эталон {args.baseline} не найден: сохраните его на этой машине флагом --save-baseline")
+        sys.exit(1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run_data_benchmark(args.sizes, args.workdir or tmp, args.iterations, args.export_rounds)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    logger.info(f"Результаты записаны в {args.output}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        logger.info(f"Эталон сохранён в {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f))
+        for regression in regressions:
+            logger.error(f"Регрессия: {regression}")
+        if regressions:
+            sys.exit(1)
+        logger.info("Регрессий относительно эталона нет")
+    else:
+        logger.warning(f"Эталон {args.baseline} не найден, сравнение пропущено (создаётся флагом --save-baseline)")
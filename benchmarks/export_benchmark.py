@@ -0,0 +1,63 @@
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks.generate_database import generate_database
+from export_requests import write_requests_to_excel
+
+
+logger = logging.getLogger(__name__)
+
+
+def run_export_benchmark(requests_count, workdir, measure_memory=False):
+    """
+    Замеряет время потокового экспорта всех заявок.
+    С measure_memory дополнительно замеряет пиковое потребление памяти Python (tracemalloc замедляет экспорт).
+    """
+    database_path = os.path.join(workdir, f"export_{requests_count}.db")
+    if not os.path.exists(database_path):
+        generate_database(database_path, requests_count)
+
+    output_file = os.path.join(workdir, f"export_{requests_count}.xlsx")
+    conn = sqlite3.connect(database_path)
+
+    started = time.perf_counter()
+    rows = write_requests_to_excel(conn, output_file, "1=1")
+    elapsed = time.perf_counter() - started
+
+    result = {
+        "requests": requests_count,
+        "rows": rows,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": int(rows / elapsed) if elapsed else 0,
+        "file_size_mb": round(os.path.getsize(output_file) / 1024 / 1024, 1),
+    }
+
+    if measure_memory:
+        tracemalloc.start()
+        write_requests_to_excel(conn, output_file, "1=1")
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_memory_mb"] = round(peak / 1024 / 1024, 1)
+
+    conn.close()
+    return result
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Бенчмарк потокового экспорта заявок в Excel")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--workdir", default=None, help="Папка для баз и отчётов (по умолчанию временная)")
+    parser.add_argument("--memory", action="store_true", help="Замерить пиковое потребление памяти")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            result = run_export_benchmark(size, args.workdir or tmp, args.memory)
+            logger.info(f"Экспорт: {result}")
@@ -0,0 +1,85 @@
+import argparse
+import logging
+import random
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from initialization_database import init_db
+from media_layout import media_path
+
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ["Вывоз ТКО", "Вывоз КГО", "Вывоз РСО", "Начисления", "Корректировка данных в квитанции", "Актуальное"]
+STREETS = ["Ленина", "Гоголя", "Пушкина", "Кирова", "Маршала Мерецкова", "Антикайнена", "Правды", "Лесной"]
+
+USERS_PER_REQUEST = 0.1  # Пользователь в среднем подаёт 10 заявок
+MEDIA_PER_REQUEST = 0.6  # К большинству заявок приложено фото или видео
+OPEN_SHARE = 0.05  # Доля ещё не закрытых заявок
+ADMINS = 5
+BATCH_SIZE = 10000
+
+
+def generate_database(database_path, requests_count, seed=42):
+    """
+    Создаёт базу данных с синтетическими пользователями, заявками и медиафайлами
+    в пропорциях, близких к рабочим.
+    """
+    rnd = random.Random(seed)
+    init_db(database_path)
+
+    conn = sqlite3.connect(database_path)
+    conn.execute("PRAGMA synchronous=OFF")
+    started = time.perf_counter()
+
+    users_count = max(int(requests_count * USERS_PER_REQUEST), 1)
+    conn.executemany(
+        "INSERT INTO users (username, telegram_id, fio, phone, email, role) VALUES (?, ?, ?, ?, ?, ?)",
+        ((f"user{i}", 10_000_000 + i, f"Пользователь {i}", f"+7900{i:07d}", f"user{i}@example.com",
+          "admin" if i <= ADMINS else "user") for i in range(1, users_count + ADMINS + 1)))
+    conn.commit()
+
+    start_date = datetime.now() - timedelta(days=3 * 365)
+    seconds_range = int((datetime.now() - start_date).total_seconds())
+    created = sorted(rnd.randrange(seconds_range) for _ in range(requests_count))
+
+    for offset in range(0, requests_count, BATCH_SIZE):
+        requests = []
+        media = []
+        for i in range(offset, min(offset + BATCH_SIZE, requests_count)):
+            created_at = (start_date + timedelta(seconds=created[i])).strftime("%Y-%m-%d %H:%M:%S")
+            status = "open" if rnd.random() < OPEN_SHARE else "closed"
+            address = f"г. Петрозаводск, ул. {rnd.choice(STREETS)}, д. {rnd.randint(1, 120)}"
+            requests.append((i + 1, rnd.randint(ADMINS + 1, users_count + ADMINS), rnd.randint(1, ADMINS),
+                             rnd.choice(CATEGORIES), address,
+                             f"Описание проблемы по заявке {i + 1}: контейнерная площадка не убрана",
+                             status, created_at))
+            if rnd.random() < MEDIA_PER_REQUEST:
+                file_unique_id = f"AQAD{i:08d}"
+                media.append((i + 1, media_path("sources/requests", file_unique_id, ".jpg"),
+                              f"AgACAgIAAxkBAAI{i:08d}", file_unique_id, "image/jpeg", rnd.randint(50_000, 500_000),
+                              created_at))
+
+        conn.executemany(
+            """INSERT INTO requests (id, user_id, admin_id, category, address, description, status, created_at) 
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""", requests)
+        conn.executemany(
+            """INSERT INTO media (request_id, file_path, file_id, file_unique_id, mime_type, file_size, created_at) 
+               VALUES (?, ?, ?, ?, ?, ?, ?)""", media)
+        conn.commit()
+
+    conn.execute("ANALYZE")
+    conn.close()
+    logger.info(f"База {database_path} с {requests_count} заявками создана за {time.perf_counter() - started:.1f} с")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Генерация синтетической базы заявок")
+    parser.add_argument("database_path")
+    parser.add_argument("--requests", type=int, default=100_000)
+    args = parser.parse_args()
+
+    generate_database(args.database_path, args.requests)
@@ -0,0 +1,293 @@
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+from aiohttp import web
+
+import config
+from benchmarks.webhook_benchmark import percentile
+
+
+logger = logging.getLogger(__name__)
+
+ADMIN_TELEGRAM_ID = 900_000_000
+USER_TELEGRAM_ID = 100_000_000
+MEDIA_FILE_SIZE = 256 * 1024
+ERROR_MARKERS = ("Ошибка", "Не удалось", "нет прав", "не авторизованы")
+
+
+class FakeBotAPI:
+    """
+    Локальная имитация Bot API: отвечает на методы бота правдоподобными объектами,
+    отдаёт файлы для getFile и передаёт уведомления о заявках имитируемым администраторам.
+    """
+
+    def __init__(self, media_size=MEDIA_FILE_SIZE, seed=42):
+        self.calls = Counter()
+        self.error_replies = Counter()
+        self.notifications = defaultdict(asyncio.Queue)  # chat_id администратора -> ID заявок
+        self.media = random.Random(seed).randbytes(media_size)
+        self._message_ids = itertools.count(1)
+        self._runner = None
+
+    def create_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle_method)
+        app.router.add_get("/file/bot{token}/{path:.*}", self.handle_file)
+        return app
+
+    async def start(self, port):
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def handle_method(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        data = await request.post()
+
+        if method == "getFile":
+            file_id = data["file_id"]
+            return self._ok({"file_id": file_id, "file_unique_id": f"uq-{file_id}", "file_size": len(self.media),
+                             "file_path": f"photos/{file_id}.jpg"})
+        if method not in ("sendMessage", "sendPhoto", "sendVideo"):
+            return self._ok(True)
+
+        chat_id = int(data["chat_id"])
+        text = data.get("text") or data.get("caption") or ""
+        if any(marker in text for marker in ERROR_MARKERS):
+            self.error_replies[text.split("\n")[0][:60]] += 1
+
+        # Уведомление о заявке содержит кнопку answer:<ID заявки>
+        match = re.search(r'"callback_data":\s*"answer:(\d+)"', data.get("reply_markup") or "")
+        if match:
+            self.notifications[chat_id].put_nowait(int(match.group(1)))
+
+        message = {"message_id": next(self._message_ids), "date": int(time.time()),
+                   "chat": {"id": chat_id, "type": "private"}, "text": text}
+        return self._ok(message)
+
+    async def handle_file(self, request: web.Request):
+        self.calls["file"] += 1
+        return web.Response(body=self.media)
+
+    @staticmethod
+    def _ok(result):
+        return web.json_response({"ok": True, "result": result})
+
+
+class Simulation:
+    """Имитирует пользователей и администраторов, передавая их сообщения диспетчеру бота."""
+
+    def __init__(self, dp, bot, media_share, seed):
+        self.dp = dp
+        self.bot = bot
+        self.media_share = media_share
+        self.rnd = random.Random(seed)
+        self.latencies = defaultdict(list)  # шаг -> задержки обработки, с
+        self.failures = Counter()
+        self._update_ids = itertools.count(1)
+
+    def _user(self, telegram_id):
+        return {"id": telegram_id, "is_bot": False, "first_name": f"User{telegram_id}"}
+
+    def message(self, telegram_id, text=None, photo_id=None):
+        message = {"message_id": next(self._update_ids), "date": int(time.time()),
+                   "chat": {"id": telegram_id, "type": "private"}, "from": self._user(telegram_id)}
+        if photo_id:
+            message["photo"] = [{"file_id": photo_id, "file_unique_id": f"uq-{photo_id}", "width": 1280,
+                                 "height": 960, "file_size": MEDIA_FILE_SIZE}]
+            message["caption"] = text
+        else:
+            message["text"] = text
+        return {"update_id": next(self._update_ids), "message": message}
+
+    def callback(self, telegram_id, data):
+        return {"update_id": next(self._update_ids), "callback_query": {
+            "id": str(next(self._update_ids)), "from": self._user(telegram_id), "chat_instance": "load", "data": data,
+            "message": {"message_id": next(self._update_ids), "date": int(time.time()),
+                        "chat": {"id": telegram_id, "type": "private"}, "text": "Новая заявка"}}}
+
+    async def feed(self, step, update):
+        """Передаёт обновление диспетчеру и замеряет время его обработки."""
+        from aiogram.types import Update
+
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, Update.model_validate(update, context={"bot": self.bot}))
+        except Exception as e:
+            self.failures[f"{step}: {type(e).__name__}"] += 1
+        self.latencies[step].append(time.perf_counter() - started)
+
+    async def run_user(self, index):
+        """Регистрация и подача одной заявки: с фото или без медиафайла."""
+        telegram_id = USER_TELEGRAM_ID + index
+        with_media = self.rnd.random() < self.media_share
+        steps = [
+            ("start", self.message(telegram_id, "/start")),
+            ("accept_agreement", self.message(telegram_id, "Принять")),
+            ("get_fio", self.message(telegram_id, f"Пользователь {index}")),
+            ("get_phone", self.message(telegram_id, f"+7900{index:07d}")),
+            ("get_email", self.message(telegram_id, f"user{index}@example.com")),
+            ("create_request", self.message(telegram_id, "📝 Создать заявку")),
+        ]
+        if with_media:
+            steps += [
+                ("process_category", self.message(telegram_id, "Вывоз ТКО")),
+                ("process_address", self.message(telegram_id, f"ул. Ленина, д. {index % 120 + 1}")),
+                ("handle_address_confirmation", self.message(telegram_id, "Да")),
+                ("process_media", self.message(telegram_id, photo_id=f"user-photo-{index}")),
+            ]
+        else:
+            steps += [
+                ("process_category", self.message(telegram_id, "Актуальное")),
+                ("process_media", self.message(telegram_id, "Пропустить")),
+            ]
+        steps += [
+            ("process_description", self.message(telegram_id, f"Контейнерная площадка не убрана ({index})")),
+            ("confirm_request", self.message(telegram_id, "Да")),
+        ]
+        for step, update in steps:
+            await self.feed(step, update)
+
+    async def run_admin(self, telegram_id, notifications, expected, answered):
+        """Отвечает на каждую поступившую заявку: нажимает кнопку и отправляет текст ответа."""
+        while answered["count"] < expected:
+            try:
+                request_id = await asyncio.wait_for(notifications.get(), timeout=0.5)
+            except asyncio.TimeoutError:
+                continue
+            await self.feed("handle_admin_response_query", self.callback(telegram_id, f"answer:{request_id}"))
+            await self.feed("handle_admin_answer", self.message(telegram_id, f"Заявка {request_id} выполнена"))
+            answered["count"] += 1
+
+
+def _configure(workdir):
+    """Направляет бота на временную БД и папки; вызывается до импорта модулей бота."""
+    config.DATABASE_PATH = os.path.join(workdir, "load.db")
+    config.REQUESTS_MEDIA_DIR = os.path.join(workdir, "requests") + os.sep
+    config.TEMP_DIR = os.path.join(workdir, "temp") + os.sep
+    config.WORKING_DAYS = range(7)
+    config.WORKING_HOURS = (0, 24)
+    os.makedirs(config.REQUESTS_MEDIA_DIR, exist_ok=True)
+    os.makedirs(config.TEMP_DIR, exist_ok=True)
+
+
+async def run_load_test(users, admins, concurrency, media_share, workdir, port, telegram_limits=False, seed=42):
+    """
+    Прогоняет users пользователей через регистрацию и подачу заявки, а admins администраторов —
+    через ответ на заявки. Бот работает с локальной имитацией Bot API и временной БД.
+    """
+    _configure(workdir)
+
+    from aiogram.client.telegram import TelegramAPIServer
+    from bot_config import bot, dp
+    from db_connection import db
+    from initialization_database import init_db
+    from opros_bot import register_state_handlers
+    from send_scheduler import send_scheduler, TokenBucket
+
+    init_db(config.DATABASE_PATH)
+    with sqlite3.connect(config.DATABASE_PATH) as conn:
+        conn.executemany(
+            "INSERT INTO users (username, telegram_id, fio, phone, email, role) VALUES (?, ?, ?, ?, ?, 'admin')",
+            [(f"admin{i}", ADMIN_TELEGRAM_ID + i, f"Администратор {i}", f"+7800{i:07d}", f"admin{i}@example.com")
+             for i in range(admins)])
+
+    api = FakeBotAPI(seed=seed)
+    await api.start(port)
+    bot.session.api = TelegramAPIServer.from_base(f"http://127.0.0.1:{port}")
+    if not telegram_limits:
+        # Замеряется пропускная способность бота, а не лимиты Telegram на отправку
+        send_scheduler.global_bucket = TokenBucket(1e9, 1e9)
+        send_scheduler.chat_rate = send_scheduler.group_rate = send_scheduler.chat_burst = 1e9
+    register_state_handlers(dp)
+
+    simulation = Simulation(dp, bot, media_share, seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    answered = {"count": 0}
+
+    async def user(index):
+        async with semaphore:
+            await simulation.run_user(index)
+
+    started = time.perf_counter()
+    admin_tasks = [asyncio.create_task(simulation.run_admin(
+        ADMIN_TELEGRAM_ID + i, api.notifications[ADMIN_TELEGRAM_ID + i], users, answered)) for i in range(admins)]
+    await asyncio.gather(*(user(index) for index in range(users)))
+    users_done = time.perf_counter() - started
+    try:
+        await asyncio.wait_for(asyncio.gather(*admin_tasks), timeout=60)
+    except asyncio.TimeoutError:
+        logger.error(f"Администраторы ответили на {answered['count']} из {users} заявок")
+    elapsed = time.perf_counter() - started
+
+    await dp.storage.close()
+    await api.stop()
+    await bot.session.close()
+    db.close()
+
+    with sqlite3.connect(config.DATABASE_PATH) as conn:
+        statuses = dict(conn.execute("SELECT status, COUNT(*) FROM requests GROUP BY status").fetchall())
+        media_rows = conn.execute("SELECT COUNT(*) FROM media").fetchone()[0]
+
+    all_latencies = sorted(value for values in simulation.latencies.values() for value in values)
+    updates = len(all_latencies)
+    errors = sum(simulation.failures.values()) + sum(api.error_replies.values())
+
+    def summary(values):
+        values = sorted(values)
+        return {"count": len(values), "p50_ms": round(percentile(values, 0.50) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2)}
+
+    return {
+        "users": users,
+        "admins": admins,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "users_seconds": round(users_done, 2),
+        "updates": updates,
+        "updates_per_second": int(updates / elapsed),
+        "requests_per_second": round(users / elapsed, 1),
+        "latency": summary(all_latencies),
+        "error_rate": round(errors / updates, 4) if updates else 0,
+        "exceptions": dict(simulation.failures),
+        "error_replies": dict(api.error_replies),
+        "requests": statuses,
+        "media_rows": media_rows,
+        "api_calls": dict(api.calls),
+        "steps": {step: summary(values) for step, values in simulation.latencies.items()},
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сценариев бота с имитацией Bot API")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--admins", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=100, help="Одновременно действующих пользователей")
+    parser.add_argument("--media-share", type=float, default=0.6, help="Доля заявок с фото")
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--telegram-limits", action="store_true", help="Соблюдать лимиты Telegram на отправку")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        result = asyncio.run(run_load_test(args.users, args.admins, args.concurrency, args.media_share, workdir,
+                                           args.port, args.telegram_limits, args.seed))
+    logger.info(f"Нагрузочный тест:\n{json.dumps(result, ensure_ascii=False, indent=2)}")
@@ -0,0 +1,92 @@
+import argparse
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+from log_config import LOG_FORMAT, DeferredQueueHandler, SamplingFilter
+
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = {"id": 42, "username": "user", "telegram_id": 123456789, "fio": "Иванов Иван Иванович",
+             "phone": "+79990000000", "email": "user@example.com", "role": "user"}
+
+
+def _configure(handler):
+    """Делает handler единственным обработчиком тестового логгера."""
+    bench_logger = logging.getLogger("benchmark.logging")
+    bench_logger.handlers = [handler]
+    bench_logger.filters = []
+    bench_logger.propagate = False
+    bench_logger.setLevel(logging.INFO)
+    return bench_logger
+
+
+def _file_handler(path):
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    return handler
+
+
+def measure(messages, scenario, path):
+    """Возвращает время вызывающего потока на одно сообщение (мкс) и полное время с записью на диск (с)."""
+    listener = None
+    if scenario in ("sync_eager", "sync_lazy"):
+        bench_logger = _configure(_file_handler(path))
+    else:
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, _file_handler(path))
+        listener.start()
+        bench_logger = _configure(DeferredQueueHandler(log_queue))
+        if scenario == "queue_sampled":
+            bench_logger.addFilter(SamplingFilter(100))
+
+    started = time.perf_counter()
+    if scenario == "sync_eager":
+        for i in range(messages):
+            bench_logger.info(f"Данные пользователя {i}: {USER_DATA}")
+    elif scenario == "debug_eager":
+        for i in range(messages):
+            bench_logger.debug(f"Данные пользователя {i}: {USER_DATA}")
+    elif scenario == "debug_lazy":
+        for i in range(messages):
+            bench_logger.debug("Данные пользователя %s: %s", i, USER_DATA)
+    else:
+        for i in range(messages):
+            bench_logger.info("Данные пользователя %s: %s", i, USER_DATA)
+    caller = time.perf_counter() - started
+
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - started
+    for handler in bench_logger.handlers:
+        handler.close()
+    return round(caller / messages * 1_000_000, 2), round(total, 2)
+
+
+def run_logging_benchmark(messages):
+    """
+    Сравнивает накладные расходы логирования на вызывающий поток:
+    синхронная запись f-строк (как было) против очереди с отложенным форматированием и выборкой.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for scenario in ("sync_eager", "sync_lazy", "queue_lazy", "queue_sampled", "debug_eager", "debug_lazy"):
+            path = os.path.join(directory, f"{scenario}.log")
+            caller_us, total_seconds = measure(messages, scenario, path)
+            results[scenario] = {"caller_us": caller_us, "total_seconds": total_seconds}
+    return results
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
+    parser = argparse.ArgumentParser(description="Накладные расходы логирования на одно сообщение")
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for name, result in run_logging_benchmark(args.messages).items():
+        logger.info(f"{name}: {result}")
@@ -0,0 +1,81 @@
+import argparse
+import asyncio
+import logging
+import time
+import timeit
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from benchmarks.webhook_benchmark import make_update
+from metrics import MetricsMiddleware, MetricsRegistry
+
+
+logger = logging.getLogger(__name__)
+
+
+async def measure_dispatch(updates_count, instrumented):
+    """Прогоняет обновления через Dispatcher и возвращает среднее время обработки одного, мкс."""
+    dp = Dispatcher()
+    bot = Bot(token="123456:BENCHMARK")
+
+    async def handle(message):
+        pass
+
+    dp.message.register(handle)
+    if instrumented:
+        dp.message.middleware(MetricsMiddleware())
+
+    updates = [Update.model_validate(make_update(i, i % 100), context={"bot": bot}) for i in range(updates_count)]
+    started = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - started
+
+    await bot.session.close()
+    return elapsed / updates_count * 1_000_000
+
+
+def run_metrics_benchmark(updates_count, observations, labels):
+    """Замеряет накладные расходы метрик: на обновление, на одно наблюдение и на выдачу /metrics."""
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+
+    # Прогрев, затем поочерёдные замеры без метрик и с ними
+    asyncio.run(measure_dispatch(1000, True))
+    plain = min(asyncio.run(measure_dispatch(updates_count, False)) for _ in range(3))
+    instrumented = min(asyncio.run(measure_dispatch(updates_count, True)) for _ in range(3))
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("benchmark_seconds", "Бенчмарк", ("handler", "state"))
+    counter = registry.counter("benchmark", "Бенчмарк", ("method", "result"))
+    observe = timeit.timeit(lambda: histogram.observe(0.003, "handler", "state"), number=observations)
+    increment = timeit.timeit(lambda: counter.inc("SendMessage", "ok"), number=observations)
+
+    for i in range(labels):
+        histogram.observe(0.003, f"handler_{i % 50}", f"state_{i}")
+    render = timeit.timeit(registry.render, number=10) / 10
+
+    return {
+        "updates": updates_count,
+        "dispatch_us": round(plain, 2),
+        "dispatch_with_metrics_us": round(instrumented, 2),
+        "overhead_us": round(instrumented - plain, 2),
+        "overhead_percent": round((instrumented - plain) / plain * 100, 1),
+        "observe_ns": round(observe / observations * 1e9),
+        "counter_inc_ns": round(increment / observations * 1e9),
+        "render_ms": round(render * 1000, 2),
+        "render_series": labels,
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Накладные расходы метрик на обработку обновлений")
+    parser.add_argument("--updates", type=int, default=20_000)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--labels", type=int, default=500, help="Наборов меток гистограммы при выдаче /metrics")
+    args = parser.parse_args()
+
+    result = run_metrics_benchmark(args.updates, args.observations, args.labels)
+    logger.info(f"Метрики: {result}")
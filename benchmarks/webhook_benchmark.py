@@ -0,0 +1,106 @@
+import argparse
+import asyncio
+import logging
+import time
+
+from aiohttp import ClientSession
+from aiogram import Bot, Dispatcher
+
+from webhook import WebhookServer
+
+
+logger = logging.getLogger(__name__)
+
+SECRET = "benchmark-secret"
+
+
+def percentile(values, share):
+    """Возвращает перцентиль отсортированного списка."""
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def make_update(update_id, chat_id):
+    """Формирует обновление Telegram с текстовым сообщением, как его присылает Bot API."""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": f"Сообщение {update_id}",
+        },
+    }
+
+
+async def run_webhook_benchmark(updates_count, chats, concurrency, workers, port):
+    """
+    Отправляет обновления в локальный webhook-сервер, имитируя Telegram,
+    и замеряет задержку от отправки до завершения обработки.
+    """
+    sent_at = {}
+    latencies = []
+    done = asyncio.Event()
+
+    dp = Dispatcher()
+    bot = Bot(token="123456:BENCHMARK")
+
+    @dp.message()
+    async def handle(message):
+        latencies.append(time.perf_counter() - sent_at[message.message_id])
+        if len(latencies) == updates_count:
+            done.set()
+
+    logging.getLogger("aiogram.event").setLevel(logging.WARNING)
+    server = WebhookServer(dp, bot, secret=SECRET, workers=workers, queue_size=updates_count)
+    await server.start("127.0.0.1", port)
+
+    url = f"http://127.0.0.1:{port}{server.path}"
+    headers = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+    counter = iter(range(1, updates_count + 1))
+    errors = 0
+
+    async def sender(session):
+        nonlocal errors
+        for update_id in counter:
+            sent_at[update_id] = time.perf_counter()
+            async with session.post(url, json=make_update(update_id, update_id % chats), headers=headers) as resp:
+                if resp.status != 200:
+                    errors += 1
+
+    started = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(sender(session) for _ in range(concurrency)))
+    if not errors:
+        await asyncio.wait_for(done.wait(), timeout=60)
+    elapsed = time.perf_counter() - started
+
+    await server.stop()
+    await bot.session.close()
+
+    latencies.sort()
+    return {
+        "updates": updates_count,
+        "errors": errors,
+        "seconds": round(elapsed, 2),
+        "updates_per_second": int(len(latencies) / elapsed),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "per_worker": [worker["handled"] for worker in server.stats()],
+    }
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description="Нагрузочный тест webhook-режима с имитацией Telegram")
+    parser.add_argument("--updates", type=int, default=10_000)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50, help="Одновременных HTTP-запросов")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8099)
+    args = parser.parse_args()
+
+    result = asyncio.run(run_webhook_benchmark(args.updates, args.chats, args.concurrency, args.workers, args.port))
+    logger.info(f"Webhook: {result}")
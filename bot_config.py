@@ -1,7 +1,13 @@
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import API_TOKEN_TG
+from fsm_storage import SQLiteStorage
+from metrics import MetricsMiddleware, TelegramMetricsMiddleware
+from send_scheduler import SendSchedulerMiddleware, send_scheduler
 
 bot = Bot(token=API_TOKEN_TG)
-dp = Dispatcher(storage=MemoryStorage())
+bot.session.middleware(SendSchedulerMiddleware(send_scheduler))  # Все отправки идут через планировщик
+bot.session.middleware(TelegramMetricsMiddleware())
+dp = Dispatcher(storage=SQLiteStorage())
+dp.message.middleware(MetricsMiddleware())  # Время обработчиков по имени и состоянию FSM
+dp.callback_query.middleware(MetricsMiddleware())
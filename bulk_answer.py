@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import re
+
+from aiogram import types
+from aiogram.fsm.context import FSMContext
+
+import config
+from admin_requests import get_admin
+from bot_config import bot
+from keyboards import main_menu_users, main_menu_admins, confirmation_buttons, create_keyboard_button
+from new_send_email import format_email, email_worker
+from send_scheduler import send_priority, PRIORITY_BULK
+from states import BulkAnswerStates, MainMenuStates
+from work_database import select_open_requests, close_requests
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+BULK_MAX_REQUESTS = getattr(config, "BULK_MAX_REQUESTS", 200)  # Заявок в одном массовом ответе
+BULK_CONCURRENCY = getattr(config, "BULK_CONCURRENCY", 8)  # Одновременных отправок ответов пользователям
+
+PREVIEW_IDS = 30  # Сколько номеров выбранных заявок показать администратору
+
+
+def parse_request_ids(text):
+    """
+    Разбирает список номеров заявок вида «12, 15 20-25».
+    Возвращает список ID или None, если текст не является списком номеров.
+    """
+    if not re.fullmatch(r"[\d\s,;-]+", text) or not re.search(r"\d", text):
+        return None
+
+    request_ids = []
+    for first, last in re.findall(r"(\d+)(?:\s*-\s*(\d+))?", text):
+        low, high = sorted((int(first), int(last or first)))
+        # Диапазон ограничен размером массового ответа, чтобы «1-1000000» не разворачивался целиком
+        request_ids.extend(range(low, min(high, low + BULK_MAX_REQUESTS - 1) + 1))
+    return request_ids
+
+
+def format_response(request_id, text):
+    """Текст ответа пользователю по заявке (как в answer.handle_admin_answer)"""
+    return f"Ответ на вашу заявку {request_id}:\n{text}"
+
+
+async def handle_bulk_start(message: types.Message, state: FSMContext):
+    """Обработчик для кнопки '📨 Массовый ответ': запрашивает заявки для ответа"""
+    await state.set_state(BulkAnswerStates.select_requests)
+    await message.answer(
+        "Укажите номера заявок (например: 12, 15, 20-25) или слова из адреса или описания — "
+        f"ответ получат все подходящие открытые заявки (не более {BULK_MAX_REQUESTS}).",
+        reply_markup=create_keyboard_button("↩️ Назад")
+    )
+
+
+async def handle_bulk_select(message: types.Message, state: FSMContext):
+    """Выбирает открытые заявки по списку номеров или словам и запрашивает текст ответа"""
+    text = (message.text or "").strip()
+    request_ids = parse_request_ids(text)
+    if request_ids is not None:
+        requests = await select_open_requests(request_ids=request_ids, limit=BULK_MAX_REQUESTS)
+    else:
+        requests = await select_open_requests(text=text, limit=BULK_MAX_REQUESTS)
+
+    if not requests:
+        await message.answer("Открытых заявок не найдено. Укажите другие номера или слова.",
+                             reply_markup=create_keyboard_button("↩️ Назад"))
+        return
+
+    ids = [request["request_id"] for request in requests]
+    await state.update_data(bulk_request_ids=ids)
+
+    preview = ", ".join(f"№{request_id}" for request_id in ids[:PREVIEW_IDS])
+    if len(ids) > PREVIEW_IDS:
+        preview += f" и ещё {len(ids) - PREVIEW_IDS}"
+    limit_note = f"\nВыбраны первые {BULK_MAX_REQUESTS} заявок." if len(ids) >= BULK_MAX_REQUESTS else ""
+
+    await message.answer(f"Выбрано открытых заявок: {len(ids)}\n{preview}{limit_note}\n\nВведите текст ответа:",
+                         reply_markup=create_keyboard_button("↩️ Назад"))
+    await state.set_state(BulkAnswerStates.enter_answer)
+
+
+async def handle_bulk_answer_text(message: types.Message, state: FSMContext):
+    """Сохраняет текст массового ответа и запрашивает подтверждение"""
+    if not message.text:
+        await message.answer("Ошибка: в ответе отсутствует текст.")
+        return
+
+    data = await state.get_data()
+    await state.update_data(bulk_text=message.text)
+    await message.answer(f"Отправить ответ по {len(data.get('bulk_request_ids', []))} заявкам и закрыть их?\n\n"
+                         f"{message.text}", reply_markup=confirmation_buttons())
+    await state.set_state(BulkAnswerStates.confirm)
+
+
+async def _send_replies(requests, text):
+    """
+    Отправляет ответы авторам заявок не более чем BULK_CONCURRENCY отправками одновременно.
+    Отправки идут с приоритетом массовой рассылки и не задерживают ответы в диалогах.
+    Возвращает количество успешных отправок.
+    """
+    pending = iter(requests)
+    sent = 0
+
+    async def worker():
+        nonlocal sent
+        for request in pending:
+            reply_markup = main_menu_users() if request["role"] == "user" else main_menu_admins()
+            try:
+                await bot.send_message(request["telegram_id"], format_response(request["request_id"], text),
+                                       parse_mode="html", reply_markup=reply_markup)
+                sent += 1
+            except Exception as e:
+                logger.error("Ошибка при отправке ответа по заявке %s: %s", request["request_id"], e)
+
+    with send_priority(PRIORITY_BULK):
+        await asyncio.gather(*(worker() for _ in range(min(BULK_CONCURRENCY, len(requests)))))
+    return sent
+
+
+async def handle_bulk_confirm(message: types.Message, state: FSMContext):
+    """
+    Закрывает выбранные заявки одной транзакцией (вместе с сохранением ответа и письмами)
+    и рассылает ответ их авторам.
+    """
+    if not message.text:
+        # Фото или стикер вместо ответа на вопрос — спрашиваем ещё раз
+        await message.answer("Ответьте «Да» или «Нет».", reply_markup=confirmation_buttons())
+        return
+
+    if message.text.lower() != "да":
+        await state.set_state(MainMenuStates.menu_admin)
+        await message.answer("Массовый ответ отменён.", reply_markup=main_menu_admins())
+        return
+
+    admin = await get_admin(message.from_user.id)
+    if not admin:
+        await message.answer("У вас нет прав для выполнения этой операции.")
+        return
+
+    data = await state.get_data()
+    text = data.get("bulk_text")
+    # Контакты перечитываются: часть заявок могла быть закрыта, пока администратор писал ответ
+    requests = await select_open_requests(request_ids=data.get("bulk_request_ids"), limit=BULK_MAX_REQUESTS)
+    if not text or not requests:
+        await state.set_state(MainMenuStates.menu_admin)
+        await message.answer("Выбранные заявки уже закрыты.", reply_markup=main_menu_admins())
+        return
+
+    emails = {
+        request["request_id"]: (request["email"],
+                                *format_email(request["request_id"], format_response(request["request_id"], text)))
+        for request in requests if request["email"]
+    }
+
+    closed = await close_requests([request["request_id"] for request in requests], admin["id"], text, emails)
+    if closed is None:
+        await message.answer("Ошибка при закрытии заявок, ответ не отправлен.", reply_markup=main_menu_admins())
+        await state.set_state(MainMenuStates.menu_admin)
+        return
+    if emails:
+        email_worker.wake_up()
+
+    logger.info("Администратор %s закрыл массовым ответом заявок: %s.", message.from_user.id, len(closed))
+    await message.answer(f"Закрыто заявок: {len(closed)}. Отправляем ответы пользователям…",
+                         reply_markup=main_menu_admins())
+    await state.set_state(MainMenuStates.menu_admin)
+
+    closed = set(closed)
+    sent = await _send_replies([request for request in requests if request["request_id"] in closed], text)
+    await message.answer(f"Ответы отправлены: {sent} из {len(closed)}, писем в очереди: "
+                         f"{sum(1 for request_id in emails if request_id in closed)}.")
@@ -0,0 +1,53 @@
+import time
+from collections import OrderedDict
+
+
+# Признак отсутствия значения в кэше (None — допустимое закэшированное значение)
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Ограниченный по размеру LRU-кэш с временем жизни записей.
+    Предназначен для использования из одного цикла событий, поэтому без блокировок.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=MISSING):
+        """Возвращает значение по ключу или default, если его нет или срок его жизни истёк."""
+        item = self._data.get(key)
+        if item is not None:
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        """Сохраняет значение, вытесняя самую давнюю запись при переполнении."""
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """Удаляет запись по ключу."""
+        self._data.pop(key, None)
+
+    def clear(self):
+        """Очищает кэш."""
+        self._data.clear()
+
+    def stats(self):
+        """Возвращает счётчики попаданий и промахов."""
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
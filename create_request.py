@@ -1,5 +1,4 @@
 import logging
-from geopy.geocoders import Nominatim
 from aiogram import types
 from aiogram.types import ReplyKeyboardRemove
 from aiogram.fsm.context import FSMContext
@@ -11,17 +10,13 @@ from states import *
 from admin_notifications import notify_admins_about_request
 from config import WORKING_HOURS, WORKING_DAYS
 from bot_config import bot
-from save_media import save_media_file, download_media_file
-from work_database import get_user_data, get_available_admin_id, save_request_data, get_admins
+from geocoding import geocoder
+from save_media import media_store, get_message_media, send_media, MEDIA_MAX_FILE_SIZE
+from work_database import get_user_data, submit_request
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-# Создание объекта геокодера
-geolocator = Nominatim(user_agent="myGeocoder")
-
-
 async def create_request(message: types.Message, state: FSMContext):
     """Обработчик создания заявки с проверкой рабочего времени"""
     now = datetime.now()
@@ -35,22 +30,22 @@ async def create_request(message: types.Message, state: FSMContext):
         await message.answer("Создание заявок доступно только в рабочее время.")
         return
 
-    user_data = get_user_data(message.from_user.id)
-    logger.info(f"Пользователь {message.from_user.id} начал создание заявки.")
+    user_data = await get_user_data(message.from_user.id)
+    logger.info("Пользователь %s начал создание заявки.", message.from_user.id)
 
     if user_data:
-        logger.debug(f"Данные пользователя {message.from_user.id} найдены: {user_data}")
+        logger.debug("Данные пользователя %s найдены: %s", message.from_user.id, user_data)
         await message.answer("Выберите тему заявки", parse_mode="html", reply_markup=request_category_menu())
         await state.set_state(RequestCreationStates.select_category)
     else:
-        logger.warning(f"Пользователь {message.from_user.id} не найден в базе данных.")
+        logger.warning("Пользователь %s не найден в базе данных.", message.from_user.id)
         await message.answer("Не удалось найти ваши данные. Пожалуйста, начните с регистрации.")
 
 
 async def process_category(message: types.Message, state: FSMContext):
     await state.set_data({})
     await state.update_data(category=message.text)
-    logger.info(f"Пользователь {message.from_user.id} выбрал категорию: {message.text}")
+    logger.info("Пользователь %s выбрал категорию: %s", message.from_user.id, message.text)
 
     # Проверяем, выбрана ли категория "Начисление" или "Корректировка данных в квитанции"
     if message.text in ["Начисления", "Корректировка данных в квитанции"]:
@@ -66,21 +61,19 @@ async def process_category(message: types.Message, state: FSMContext):
 
 async def process_address(message: types.Message, state: FSMContext):
     if message.location:
-        logger.debug(
-            f"Пользователь {message.from_user.id} отправил геолокацию: "
-            f"{message.location.latitude}, {message.location.longitude}")
-        location_info = geolocator.reverse((message.location.latitude, message.location.longitude),
-                                           language='ru', timeout=30)
-
-        if location_info:
-            real_address = location_info.address
-            logger.debug(f"Реальный адрес по геолокации: {real_address}")
+        logger.debug("Пользователь %s отправил геолокацию: %s, %s",
+                     message.from_user.id, message.location.latitude, message.location.longitude)
+        location_address = await geocoder.reverse(message.location.latitude, message.location.longitude)
+
+        if location_address:
+            real_address = location_address
+            logger.debug("Реальный адрес по геолокации: %s", real_address)
         else:
             real_address = "Адрес не найден"
-            logger.warning(f"Не удалось найти адрес для геолокации пользователя {message.from_user.id}")
+            logger.warning("Не удалось найти адрес для геолокации пользователя %s", message.from_user.id)
     else:
         real_address = message.text
-        logger.debug(f"Пользователь {message.from_user.id} ввел текстовый адрес: {real_address}")
+        logger.debug("Пользователь %s ввел текстовый адрес: %s", message.from_user.id, real_address)
 
     await state.update_data(address=real_address)
     await message.answer(f"Ваш адрес: {real_address}.")
@@ -92,7 +85,7 @@ async def handle_address_confirmation(message: types.Message, state: FSMContext)
     user_answer = message.text.lower()
     data = await state.get_data()
     if user_answer == "да":
-        logger.info(f"Пользователь {message.from_user.id} подтвердил адрес: {message.text}")
+        logger.info("Пользователь %s подтвердил адрес: %s", message.from_user.id, message.text)
         await message.answer(f"Адрес подтвержден: {message.text}")
         if data['category'] in ["Начисления", "Корректировка данных в квитанции"]:
             await message.answer("Опишите проблему:", reply_markup=ReplyKeyboardRemove())
@@ -101,48 +94,49 @@ async def handle_address_confirmation(message: types.Message, state: FSMContext)
             await message.answer("Теперь загрузите медиафайл:", reply_markup=ReplyKeyboardRemove())
             await state.set_state(RequestCreationStates.attach_media)
     elif user_answer == "нет":
-        logger.info(f"Пользователь {message.from_user.id} отклонил адрес: {message.text}")
+        logger.info("Пользователь %s отклонил адрес: %s", message.from_user.id, message.text)
         await message.answer("Введите новый адрес:", reply_markup=address_button())
         await state.set_state(RequestCreationStates.enter_address)
 
 
 async def process_media(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    media = None
 
     await state.update_data(description=message.text)
     data = await state.get_data()
     if message.text == "Пропустить" and data['category'] == 'Актуальное':
-        logger.info(f"Пользователь с ID {message.from_user.id} не предоставил медиафайл.")
-        await state.update_data(media="")
+        logger.info("Пользователь с ID %s не предоставил медиафайл.", message.from_user.id)
+        await state.update_data(media=None)
         await message.answer("Опишите проблему:", reply_markup=ReplyKeyboardRemove())
         await state.set_state(RequestCreationStates.enter_description)
         return
 
-    if message.photo:
-        media = message.photo[-1]
-        logger.debug(f"Пользователь {user_id} загрузил фото.")
-    elif message.video:
-        media = message.video
-        logger.debug(f"Пользователь {user_id} загрузил видео.")
+    media = get_message_media(message)
+    if media:
+        logger.debug("Пользователь %s загрузил файл %s.", user_id, media['mime_type'])
     else:
-        logger.warning(f"Пользователь {user_id} отправил неподдерживаемый медиафайл.")
+        logger.warning("Пользователь %s отправил неподдерживаемый медиафайл.", user_id)
         await message.answer("Ошибка: Пожалуйста, загрузите изображение или видео.")
         return
 
-    file = await bot.get_file(media.file_id)
-    new_name_file = f'{file.file_id}.{file.file_path.split('.')[-1]}'
+    if media["file_size"] and media["file_size"] > MEDIA_MAX_FILE_SIZE:
+        logger.warning("Пользователь %s отправил слишком большой файл: %s байт.", user_id, media['file_size'])
+        await message.answer(f"Ошибка: размер файла не должен превышать {MEDIA_MAX_FILE_SIZE // (1024 * 1024)} МБ.")
+        return
+
+    file = await bot.get_file(media["file_id"])
 
     await state.set_state(RequestCreationStates.uploading)
     await message.answer("Файл загружается, пожалуйста, подождите...")
 
-    await state.update_data(media=new_name_file)
-
-    if await download_media_file(file, new_name_file):
-        logger.info(f"Пользователь {user_id} успешно загрузил файл {new_name_file}")
+    # Файл загружается сразу в постоянное хранилище, в заявку он попадёт после подтверждения
+    media["path"] = await media_store.save(file)
+    await state.update_data(media=media)
+    if media["path"]:
+        logger.info("Пользователь %s успешно загрузил файл %s", user_id, media['file_unique_id'])
         await message.reply(f"Файл сохранён!")
     else:
-        logger.error(f"Ошибка при загрузке файла от пользователя {user_id}")
+        logger.error("Ошибка при загрузке файла от пользователя %s", user_id)
         await message.answer(f"Ошибка при загрузке файла.")
 
     await message.answer("Опишите проблему:", reply_markup=ReplyKeyboardRemove())
@@ -153,7 +147,7 @@ async def process_description(message: types.Message, state: FSMContext):
     await state.update_data(description=message.text)
     data = await state.get_data()
 
-    user_data_base = get_user_data(message.from_user.id)
+    user_data_base = await get_user_data(message.from_user.id)
 
     request_text = (
         f"Категория: <b>{data['category']}</b>\n"
@@ -163,22 +157,17 @@ async def process_description(message: types.Message, state: FSMContext):
         f"{f'Адрес: <b>{data.get("address")}</b>\n' if data.get('address') else ''}"
         f"Описание: <b>{data['description']}</b>")
 
-    logger.info(f"Пользователь {message.from_user.id} заполнил описание проблемы: {data['description']}")
+    logger.info("Пользователь %s заполнил описание проблемы: %s", message.from_user.id, data['description'])
 
     if data.get("media"):
         try:
-            if data["media"].endswith(".jpg") or data["media"].endswith(".jpeg"):
-                await message.answer_photo(photo=data["media"].split('.')[0],
-                                           caption=f"Проверьте данные:\n{request_text}\nПодтвердить?",
-                                           parse_mode="html", reply_markup=confirmation_buttons())
-                logger.debug(f"Фото отправлено пользователю {message.from_user.id}")
-            else:
-                await message.answer_video(video=data["media"].split('.')[0],
-                                           caption=f"Проверьте данные:\n{request_text}\nПодтвердить?",
-                                           parse_mode="html", reply_markup=confirmation_buttons())
-                logger.debug(f"Видео отправлено пользователю {message.from_user.id}")
+            # Превью отправляется по file_id, файл повторно не загружается
+            await send_media(bot, message.chat.id, data["media"],
+                             caption=f"Проверьте данные:\n{request_text}\nПодтвердить?",
+                             parse_mode="html", reply_markup=confirmation_buttons())
+            logger.debug("Медиафайл отправлен пользователю %s", message.from_user.id)
         except Exception as e:
-            logger.error(f"Ошибка при отправке медиа пользователю {message.from_user.id}: {e}")
+            logger.error("Ошибка при отправке медиа пользователю %s: %s", message.from_user.id, e)
             await message.answer(f"Проверьте данные:\n{request_text}\nПодтвердить?", parse_mode="html",
                                  reply_markup=confirmation_buttons())
     else:
@@ -189,24 +178,29 @@ async def process_description(message: types.Message, state: FSMContext):
 
 
 async def confirm_request(message: types.Message, state: FSMContext):
-    user_data_base = get_user_data(message.from_user.id)
+    user_data_base = await get_user_data(message.from_user.id)
     reply_markup = main_menu_users() if user_data_base['role'] == 'user' else main_menu_admins()
     if message.text.lower() == "да":
         data = await state.get_data()
 
-        admin_id, admin_telegram_id = get_available_admin_id()
-
         if data['category'] in ["Начисления", "Корректировка данных в квитанции"]:
             data['status'] = 'closed'
         else:
             data['status'] = 'open'
 
-        # Вставляем данные заявки в БД
-        last_row_id = save_request_data(user_data_base['id'], data, admin_id)
-
-        # Обрабатываем медиафайл
+        # Медиафайл привязываем, только если он успешно сохранён
+        media_files = []
         if data.get("media") and not data['category'] in ["Начисления", "Корректировка данных в квитанции"]:
-            await save_media_file(data["media"], last_row_id)  # Сохраняем файл и запись в БД
+            if data["media"]["path"] and await media_store.exists(data["media"]["path"]):
+                media_files.append(data["media"])
+
+        # Выбор администратора, заявка и записи о медиафайлах сохраняются одной транзакцией
+        submitted = await submit_request(user_data_base['id'], data, media_files)
+        if submitted is None:
+            await message.answer("Не удалось сохранить заявку, попробуйте позже.", reply_markup=reply_markup)
+            return
+
+        last_row_id, admin_id, admin_telegram_id = submitted
 
         await message.answer(f"Ваше обращение №{last_row_id} поступило в работу. Спасибо за Ваше обращение.",
                              reply_markup=reply_markup)
@@ -215,7 +209,7 @@ async def confirm_request(message: types.Message, state: FSMContext):
     else:
         await message.answer("Отмена заявки", reply_markup=reply_markup)
 
-    user_data_base = get_user_data(message.from_user.id)
+    user_data_base = await get_user_data(message.from_user.id)
 
     reply_markup = main_menu_users() if user_data_base['role'] == 'user' else main_menu_admins()
     if user_data_base['role'] == 'user':
@@ -0,0 +1,225 @@
+import asyncio
+import itertools
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import config
+from config import DATABASE_PATH
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+DB_READERS = getattr(config, "DB_READERS", 3)  # Количество соединений только для чтения
+DB_EXPORT_WORKERS = getattr(config, "DB_EXPORT_WORKERS", 1)  # Соединений для долгих выгрузок (экспорт в Excel)
+DB_CACHED_STATEMENTS = getattr(config, "DB_CACHED_STATEMENTS", 128)  # Размер кэша подготовленных запросов
+DB_BUSY_TIMEOUT = getattr(config, "DB_BUSY_TIMEOUT", 5.0)  # Ожидание блокировки БД, сек.
+DB_GROUP_COMMIT_DELAY = getattr(config, "DB_GROUP_COMMIT_DELAY", 0.005)  # Окно группового commit, сек.
+
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения с SQLite: пул читателей, единственный писатель
+    и отдельные соединения для долгих выгрузок.
+    Каждое соединение принадлежит своему потоку исполнителя, поэтому запросы
+    не блокируют цикл событий aiogram.
+    """
+
+    def __init__(self, database_path, readers=DB_READERS, export_workers=DB_EXPORT_WORKERS):
+        self.database_path = database_path
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-reader")
+        self._exports = ThreadPoolExecutor(max_workers=export_workers, thread_name_prefix="db-export")
+        self._pending = []
+        self._flush_task = None
+        self._remote = None
+        self._remote_futures = {}
+        self._remote_ids = itertools.count()
+
+    def _connect(self, query_only=False):
+        """
+        Создаёт соединение текущего потока (WAL, кэш подготовленных запросов).
+        Соединение с query_only отклоняет любую запись ошибкой sqlite3.OperationalError.
+        """
+        conn = sqlite3.connect(self.database_path, timeout=DB_BUSY_TIMEOUT,
+                               cached_statements=DB_CACHED_STATEMENTS, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if query_only:
+            conn.execute("PRAGMA query_only=ON")
+        with self._lock:
+            self._connections.append(conn)
+        logger.info(f"Открыто соединение с базой данных в потоке {threading.current_thread().name}")
+        return conn
+
+    def connection(self, query_only=False):
+        """
+        Возвращает соединение, закреплённое за текущим потоком.
+        query_only учитывается при первом обращении потока, когда соединение создаётся.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect(query_only)
+        return conn
+
+    async def run_read(self, func, *args):
+        """Выполняет func(conn, *args) в пуле читателей на соединении только для чтения."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, lambda: func(self.connection(query_only=True), *args))
+
+    async def run_export(self, func, *args):
+        """
+        Выполняет долгое чтение func(conn, *args) на отдельном соединении вне пула читателей,
+        чтобы выгрузка не занимала потоки, обслуживающие запросы обработчиков.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._exports, lambda: func(self.connection(), *args))
+
+    async def run_write(self, func, *args):
+        """Выполняет func(conn, *args) в потоке писателя (или у писателя другого процесса)."""
+        loop = asyncio.get_running_loop()
+        if self._remote is not None:
+            future = loop.create_future()
+            request_id = next(self._remote_ids)
+            self._remote_futures[request_id] = (loop, future)
+            try:
+                self._remote[0].put((request_id, func, args))
+            except Exception:
+                self._remote_futures.pop(request_id, None)
+                raise
+            return await future
+        return await loop.run_in_executor(self._writer, lambda: func(self.connection(), *args))
+
+    def use_remote_writer(self, requests, responses):
+        """
+        Перенаправляет запись в очередь requests писателю другого процесса (см. serve_writes).
+        Чтение остаётся локальным. Очереди — multiprocessing.SimpleQueue,
+        func и аргументы должны сериализоваться pickle.
+        """
+        self._remote = (requests, responses)
+        threading.Thread(target=self._receive_remote_results, name="db-remote-writer", daemon=True).start()
+
+    def _receive_remote_results(self):
+        requests, responses = self._remote
+        while True:
+            item = responses.get()
+            if item is None:
+                break
+            request_id, ok, value = item
+            loop, future = self._remote_futures.pop(request_id)
+            loop.call_soon_threadsafe(self._resolve_remote, future, ok, value)
+
+    @staticmethod
+    def _resolve_remote(future, ok, value):
+        if future.done():
+            return
+        if ok:
+            future.set_result(value)
+        else:
+            future.set_exception(value)
+
+    def serve_writes(self, requests, responses):
+        """
+        Выполняет запросы на запись из очереди requests в потоке писателя этого процесса
+        и отправляет результаты в responses. Работает в отдельном потоке до получения None.
+        """
+        def serve():
+            while True:
+                try:
+                    item = requests.get()
+                except Exception as e:
+                    # Запрос не удалось десериализовать, ответить на него некому
+                    logger.error(f"Ошибка при получении запроса на запись: {e}")
+                    continue
+                if item is None:
+                    break
+
+                request_id, func, args = item
+                try:
+                    result = (True, self._writer.submit(lambda: func(self.connection(), *args)).result())
+                except Exception as e:
+                    result = (False, e)
+                try:
+                    responses.put((request_id, *result))
+                except Exception as e:
+                    # Результат или исключение не сериализуются, передаём текст ошибки
+                    responses.put((request_id, False, RuntimeError(f"{result[1]!r}: {e}")))
+
+        thread = threading.Thread(target=serve, name="db-write-server", daemon=True)
+        thread.start()
+        return thread
+
+    async def run_transaction(self, func, *args):
+        """
+        Выполняет func(conn, *args) как единицу работы в транзакции писателя.
+        Единицы, поступившие в течение DB_GROUP_COMMIT_DELAY, фиксируются одним commit;
+        каждая выполняется в своей точке сохранения, и ошибка одной не отменяет остальные.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((func, args, future))
+        if self._flush_task is None:
+            self._flush_task = loop.create_task(self._flush_pending())
+        return await future
+
+    async def _flush_pending(self):
+        """Отправляет накопленные единицы работы писателю одной транзакцией."""
+        await asyncio.sleep(DB_GROUP_COMMIT_DELAY)
+        batch, self._pending = self._pending, []
+        self._flush_task = None
+
+        try:
+            results = await self.run_write(self._run_batch, [(func, args) for func, args, _ in batch])
+        except Exception as e:
+            results = [(False, e)] * len(batch)
+
+        for (_, _, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    @staticmethod
+    def _run_batch(conn, batch):
+        """Выполняет пакет единиц работы в одной транзакции (в потоке писателя)."""
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for func, args in batch:
+                conn.execute("SAVEPOINT unit_of_work")
+                try:
+                    results.append((True, func(conn, *args)))
+                    conn.execute("RELEASE unit_of_work")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO unit_of_work")
+                    conn.execute("RELEASE unit_of_work")
+                    results.append((False, e))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        if len(batch) > 1:
+            logger.info(f"Групповой commit: {len(batch)} транзакций")
+        return results
+
+    def close(self):
+        """Останавливает исполнители и закрывает все соединения."""
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
+        self._exports.shutdown(wait=True)
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        logger.info("Соединения с базой данных закрыты")
+
+
+db = ConnectionManager(DATABASE_PATH)
@@ -1,39 +1,42 @@
 import logging
-import pandas as pd
+import xlsxwriter
 from datetime import datetime
 import hashlib
 import uuid
 import os
 
+import config
 from config import REPORTS_DIR
-from work_database import execute_db
+from db_connection import db
+from work_database import EXPORT_REQUESTS_QUERY
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+EXPORT_CHUNK_SIZE = getattr(config, "EXPORT_CHUNK_SIZE", 5000)  # Строк, читаемых из БД за один раз
 
-def fetch_data_from_db(filter_condition):
+EXPORT_COLUMNS = ["id", "fio", "phone", "email", "category", "address", "description", "status",
+                  "created_at", "admin_fio"]
+
+
+def fetch_data_from_db(conn, filter_condition, params=(), chunk_size=EXPORT_CHUNK_SIZE):
     """
     Функция для получения данных из базы данных с учётом фильтрации.
+    Читает результат курсором порциями, не загружая его в память целиком.
+    :param conn: соединение с базой данных
     :param filter_condition: условие фильтрации SQL-запроса
-    :return: DataFrame с результатами запроса
-    """
-    query = f"""
-    SELECT r.id, u.fio, u.phone, u.email, r.category, r.address, r.description, 
-           r.status, r.created_at, a.fio AS admin_fio
-    FROM requests r
-    JOIN users u ON r.user_id = u.id
-    LEFT JOIN users a ON r.admin_id = a.id
-    WHERE {filter_condition}
+    :param params: параметры условия фильтрации
+    :param chunk_size: количество строк в порции
+    :return: генератор порций строк результата
     """
-
-    # Выполнение запроса и получение всех результатов
-    result = execute_db(query, fetchall=True)
-    if result:
-        return pd.DataFrame(result,
-                            columns=["id", "fio", "phone", "email", "category", "address", "description", "status",
-                                     "created_at", "admin_fio"])
-    return None
+    cursor = conn.execute(EXPORT_REQUESTS_QUERY.format(filter_condition=filter_condition), params)
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
 
 
 def generate_unique_filename(filter_type):
@@ -53,96 +56,135 @@ def generate_unique_filename(filter_type):
     return os.path.join(REPORTS_DIR, f"{filter_type}_{filename_hash}.xlsx")
 
 
-def export_requests_to_excel(filter_type="all_time"):
+def write_requests_to_excel(conn, output_file, filter_condition, params=()):
     """
-    Функция для экспорта данных в Excel.
-    :param filter_type: тип фильтрации (по времени или без)
-    :return: название файла отчёта или None
+    Потоково записывает заявки в Excel в режиме constant_memory.
+    Строки пишутся целиком с форматом по статусу, ширина колонок считается по ходу записи.
+    :return: количество записанных заявок
+    """
+    workbook = xlsxwriter.Workbook(output_file, {"constant_memory": True})
+    worksheet = workbook.add_worksheet("Requests")
+
+    # Формат заголовков (тёмно-зелёный, жирный, белый текст)
+    header_format = workbook.add_format({
+        "bold": True,
+        "bg_color": "#4F7942",  # Тёмно-зелёный фон
+        "font_color": "white",
+        "align": "center",
+        "valign": "vcenter",
+        "border": 1  # Добавим границу
+    })
+
+    # Форматы строк для открытых и закрытых заявок (не яркие зеленые и красные)
+    closed_format = workbook.add_format({
+        "bg_color": "#A5D6A7",  # Нежно-зеленый для закрытых заявок
+        "text_wrap": True,
+        "align": "left",
+        "valign": "top",
+        "border": 1  # Добавим границу
+    })
+
+    open_format = workbook.add_format({
+        "bg_color": "#FFCCBC",  # Светло-красный для открытых заявок
+        "text_wrap": True,
+        "align": "left",
+        "valign": "top",
+        "border": 1  # Добавим границу
+    })
+
+    # Устанавливаем заголовки с форматированием
+    worksheet.write_row(0, 0, EXPORT_COLUMNS, header_format)
+    widths = [len(col_name) for col_name in EXPORT_COLUMNS]
+    status_index = EXPORT_COLUMNS.index("status")
+    write_string, write_number, write_blank = worksheet.write_string, worksheet.write_number, worksheet.write_blank
+
+    row_num = 0
+    try:
+        for rows in fetch_data_from_db(conn, filter_condition, params):
+            for row in rows:
+                row_num += 1
+                status = row[status_index]
+
+                # Цвет строки зависит от статуса заявки, строки без статуса остаются без заливки
+                if status:
+                    row_format = closed_format if status == "closed" else open_format
+                else:
+                    row_format = None
+
+                # Типизированная запись без автоопределения типа значения для каждой ячейки
+                for col_num, value in enumerate(row):
+                    if value is None:
+                        write_blank(row_num, col_num, None, row_format)
+                        continue
+                    if isinstance(value, str):
+                        write_string(row_num, col_num, value, row_format)
+                        value_len = len(value)
+                    else:
+                        write_number(row_num, col_num, value, row_format)
+                        value_len = len(str(value))
+                    if value_len > widths[col_num]:
+                        widths[col_num] = value_len
+
+        # Включаем автофильтр
+        worksheet.autofilter(0, 0, 0, len(EXPORT_COLUMNS) - 1)
+
+        # Закрепляем заголовки
+        worksheet.freeze_panes(1, 0)
+
+        # Устанавливаем ширину колонок
+        for i, col in enumerate(EXPORT_COLUMNS):
+            if col == "description":
+                worksheet.set_column(i, i, 50)  # 50 ≈ 600 пикселей
+            else:
+                worksheet.set_column(i, i, widths[i] + 2)
+    finally:
+        workbook.close()
+
+    return row_num
+
+
+def get_filter_condition(filter_type):
+    """
+    Возвращает SQL-условие и параметры для выбранного типа фильтрации.
     """
     now = datetime.now()
-    logger.info(f"Запуск экспорта с фильтром: {filter_type}")
 
     if filter_type == "today":
         eight_am = datetime(now.year, now.month, now.day, 8, 0)
-        filter_condition = f"r.created_at >= '{eight_am}'"
         logger.info(f"Фильтруем данные с {eight_am}")
-    else:
-        filter_condition = "1=1"
-        logger.info("Фильтрация по всем данным")
-
-    # Получаем данные из базы
-    df = fetch_data_from_db(filter_condition)
-    if df is None or df.empty:
-        logger.warning("Нет данных для экспорта")
-        return None
+        return "r.created_at >= ?", (str(eight_am),)
 
-    output_file = generate_unique_filename(filter_type)
-    logger.info(f"Генерация отчёта: {output_file}")
+    logger.info("Фильтрация по всем данным")
+    return "1=1", ()
 
-    try:
-        with pd.ExcelWriter(output_file, engine="xlsxwriter") as writer:
-            df.to_excel(writer, sheet_name="Requests", index=False)
-
-            workbook = writer.book
-            worksheet = writer.sheets["Requests"]
-
-            # Формат заголовков (тёмно-зелёный, жирный, белый текст)
-            header_format = workbook.add_format({
-                "bold": True,
-                "bg_color": "#4F7942",  # Тёмно-зелёный фон
-                "font_color": "white",
-                "align": "center",
-                "valign": "vcenter",
-                "border": 1  # Добавим границу
-            })
-
-            # Форматы строк для открытых и закрытых заявок (не яркие зеленые и красные)
-            closed_format = workbook.add_format({
-                "bg_color": "#A5D6A7",  # Нежно-зеленый для закрытых заявок
-                "text_wrap": True,
-                "align": "left",
-                "valign": "top",
-                "border": 1  # Добавим границу
-            })
-
-            open_format = workbook.add_format({
-                "bg_color": "#FFCCBC",  # Светло-красный для открытых заявок
-                "text_wrap": True,
-                "align": "left",
-                "valign": "top",
-                "border": 1  # Добавим границу
-            })
-
-            # Устанавливаем заголовки с форматированием
-            for col_num, col_name in enumerate(df.columns):
-                worksheet.write(0, col_num, col_name, header_format)
-
-            # Чередуем цвета строк в зависимости от статуса заявки
-            for row_num in range(1, len(df) + 1):
-                status = df.iloc[row_num - 1]["status"]  # Получаем статус заявки
-
-                # Проверяем, если строка имеет статус и он не пустой
-                if pd.notnull(status) and status != "":
-                    row_format = closed_format if status == "closed" else open_format
-                    for col_num in range(len(df.columns)):
-                        worksheet.write(row_num, col_num, df.iloc[row_num - 1, col_num], row_format)
 
-            # Включаем автофильтр
-            worksheet.autofilter(0, 0, 0, len(df.columns) - 1)
+async def export_requests_to_excel(filter_type="all_time"):
+    """
+    Функция для экспорта данных в Excel.
+    Чтение из БД и запись файла выполняются на отдельном соединении для выгрузок (db.run_export),
+    не блокируя цикл событий и не занимая пул читателей.
+    :param filter_type: тип фильтрации (по времени или без)
+    :return: название файла отчёта или None
+    """
+    logger.info(f"Запуск экспорта с фильтром: {filter_type}")
 
-            # Закрепляем заголовки
-            worksheet.freeze_panes(1, 0)
+    filter_condition, params = get_filter_condition(filter_type)
 
-            # Устанавливаем ширину колонок
-            for i, col in enumerate(df.columns):
-                max_len = max(df[col].astype(str).apply(len).max(), len(col)) + 2
-                if col == "description":
-                    worksheet.set_column(i, i, 50)  # 50 ≈ 600 пикселей
-                else:
-                    worksheet.set_column(i, i, max_len)
+    output_file = generate_unique_filename(filter_type)
+    logger.info(f"Генерация отчёта: {output_file}")
 
-        logger.info(f"Отчёт успешно сохранён: {output_file}")
-        return output_file  # Возвращаем название файла, если экспорт успешен
+    try:
+        rows_count = await db.run_export(write_requests_to_excel, output_file, filter_condition, params)
     except Exception as e:
         logger.error(f"Ошибка при сохранении отчёта в Excel: {e}")
+        if os.path.exists(output_file):
+            os.remove(output_file)
         return None  # Возвращаем None в случае ошибки
+
+    if not rows_count:
+        logger.warning("Нет данных для экспорта")
+        os.remove(output_file)
+        return None
+
+    logger.info(f"Отчёт успешно сохранён: {output_file}, заявок: {rows_count}")
+    return output_file  # Возвращаем название файла, если экспорт успешен
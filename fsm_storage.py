@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+import config
+from db_connection import db
+
+
+logger = logging.getLogger(__name__)
+
+FSM_FLUSH_INTERVAL = getattr(config, "FSM_FLUSH_INTERVAL", 1.0)  # Период сброса состояний в БД, сек.
+FSM_CACHE_SIZE = getattr(config, "FSM_CACHE_SIZE", 10_000)  # Сколько состояний держать в памяти
+
+
+def _key_to_str(key: StorageKey) -> str:
+    """Преобразует ключ хранилища в строку для первичного ключа таблицы."""
+    return ":".join(str(part) for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id,
+                                           key.business_connection_id, key.destiny))
+
+
+def _load_record(conn, key):
+    row = conn.execute("SELECT state, data FROM fsm_storage WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None, {}
+    return row[0], json.loads(row[1]) if row[1] else {}
+
+
+def _save_records(conn, records):
+    """Записывает пакет состояний одной транзакцией; пустые записи удаляются."""
+    upserts = [(key, state, json.dumps(data, ensure_ascii=False)) for key, (state, data) in records.items()
+               if state is not None or data]
+    deletes = [(key,) for key, (state, data) in records.items() if state is None and not data]
+
+    try:
+        conn.executemany(
+            """INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+               ON CONFLICT(key) DO UPDATE SET state = excluded.state, data = excluded.data,
+               updated_at = DATETIME('now', '+3 hours')""",
+            upserts)
+        conn.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM-хранилище в SQLite с отложенной записью.
+    Состояния читаются из БД один раз на ключ и дальше обслуживаются из памяти,
+    изменения накапливаются и сбрасываются пакетом раз в FSM_FLUSH_INTERVAL и при закрытии.
+    В памяти держится не больше cache_size записей: давно не используемые вытесняются,
+    если они уже записаны в БД.
+    """
+
+    def __init__(self, flush_interval=FSM_FLUSH_INTERVAL, cache_size=FSM_CACHE_SIZE):
+        self.flush_interval = flush_interval
+        self.cache_size = cache_size
+        self._records = OrderedDict()
+        self._dirty = set()
+        self._flushing = set()
+        self._loading = {}
+        self._flush_task = None
+        self._closed = False
+
+    async def _get_record(self, key: StorageKey):
+        str_key = _key_to_str(key)
+        record = self._records.get(str_key)
+        if record is not None:
+            self._records.move_to_end(str_key)
+            return str_key, record
+
+        # Параллельные обращения к одному ключу ждут одну загрузку из БД
+        task = self._loading.get(str_key)
+        if task is None:
+            task = self._loading[str_key] = asyncio.ensure_future(db.run_read(_load_record, str_key))
+        try:
+            state, data = await task
+        finally:
+            self._loading.pop(str_key, None)
+
+        record = self._records.setdefault(str_key, [state, data])
+        self._evict()
+        return str_key, record
+
+    def _evict(self):
+        """
+        Вытесняет давние записи сверх cache_size; не записанные в БД изменения не вытесняются.
+        Последняя использованная запись тоже остаётся: её только что вернули обработчику для изменения.
+        """
+        excess = len(self._records) - self.cache_size
+        if excess <= 0:
+            return
+        for str_key in list(self._records)[:-1]:
+            if excess <= 0:
+                break
+            if str_key in self._dirty or str_key in self._flushing:
+                continue
+            del self._records[str_key]
+            excess -= 1
+
+    def _mark_dirty(self, str_key):
+        self._dirty.add(str_key)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.flush_interval)
+        finally:
+            self._flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные изменения в БД."""
+        if not self._dirty:
+            return
+
+        dirty, self._dirty = self._dirty, set()
+        records = {key: (self._records[key][0], dict(self._records[key][1])) for key in dirty}
+        # Пока запись идёт, ключи нельзя вытеснять: повторная загрузка прочитала бы старое состояние
+        self._flushing |= dirty
+        try:
+            await db.run_write(_save_records, records)
+        except Exception as e:
+            # Вернём ключи в очередь и запланируем повторную запись
+            self._dirty |= dirty
+            if self._flush_task is None and not self._closed:
+                self._flush_task = asyncio.create_task(self._flush_later())
+            logger.error(f"Ошибка при сохранении состояний FSM: {e}")
+        finally:
+            self._flushing -= dirty
+        self._evict()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        str_key, record = await self._get_record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(str_key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        _, record = await self._get_record(key)
+        return record[0]
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        str_key, record = await self._get_record(key)
+        record[1] = data.copy()
+        self._mark_dirty(str_key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, record = await self._get_record(key)
+        return record[1].copy()
+
+    async def close(self) -> None:
+        self._closed = True
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
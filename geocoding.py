@@ -0,0 +1,126 @@
+import asyncio
+import logging
+from geopy.geocoders import Nominatim
+
+import config
+from cache import TTLCache, MISSING
+from metrics import GEOCODER_REQUESTS, GEOCODER_SECONDS
+from work_database import get_cached_address, save_cached_address
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+GEOCODER_PRECISION = getattr(config, "GEOCODER_PRECISION", 4)  # Знаков после запятой в ключе кэша (~11 м)
+GEOCODER_TIMEOUT = getattr(config, "GEOCODER_TIMEOUT", 5)  # Таймаут запроса к геокодеру, сек.
+GEOCODER_CONCURRENCY = getattr(config, "GEOCODER_CONCURRENCY", 1)  # Одновременных запросов к геокодеру
+
+
+class NominatimBackend:
+    """Обратное геокодирование через Nominatim (OpenStreetMap)."""
+
+    def __init__(self, user_agent="myGeocoder", timeout=GEOCODER_TIMEOUT):
+        self.geolocator = Nominatim(user_agent=user_agent)
+        self.timeout = timeout
+
+    def reverse(self, latitude, longitude):
+        """Возвращает адрес по координатам или None (блокирующий вызов)."""
+        location_info = self.geolocator.reverse((latitude, longitude), language='ru', timeout=self.timeout)
+        return location_info.address if location_info else None
+
+
+class GeocodingService:
+    """
+    Асинхронное обратное геокодирование с ограничением параллельности.
+    Результаты кэшируются в памяти и в БД по координатам, округлённым до precision знаков.
+    Бэкенд — любой объект с блокирующим методом reverse(latitude, longitude).
+    """
+
+    def __init__(self, backend=None, precision=GEOCODER_PRECISION, timeout=GEOCODER_TIMEOUT,
+                 concurrency=GEOCODER_CONCURRENCY):
+        self._backend = backend
+        self.precision = precision
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._memory = TTLCache(maxsize=4096, ttl=24 * 60 * 60)
+        self._inflight = {}
+
+    @property
+    def backend(self):
+        # Nominatim создаётся лениво, чтобы можно было подменить бэкенд до первого запроса
+        if self._backend is None:
+            self._backend = NominatimBackend()
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+        self._memory.clear()
+
+    def cache_key(self, latitude, longitude):
+        """Ключ кэша: координаты, округлённые до заданной точности."""
+        return f"{latitude:.{self.precision}f},{longitude:.{self.precision}f}"
+
+    async def reverse(self, latitude, longitude):
+        """Возвращает адрес по координатам или None, если его не удалось определить."""
+        key = self.cache_key(latitude, longitude)
+
+        address = self._memory.get(key)
+        if address is not MISSING:
+            GEOCODER_REQUESTS.inc("memory")
+            return address
+
+        # Одновременные запросы по одной площадке ждут один и тот же вызов геокодера
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.ensure_future(self._resolve(key, latitude, longitude))
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    def _release(self, future):
+        """Освобождает слот семафора после завершения потока геокодера."""
+        self._semaphore.release()
+        if not future.cancelled():
+            # Ошибка потока, завершившегося после таймаута, уже никто не ждёт
+            future.exception()
+
+    async def _resolve(self, key, latitude, longitude):
+        """Ищет адрес в БД, а при промахе обращается к бэкенду."""
+        address = await get_cached_address(key)
+        if address:
+            GEOCODER_REQUESTS.inc("database")
+            self._memory.set(key, address)
+            return address
+
+        # Слот семафора освобождается, когда поток геокодера завершится, а не по таймауту ожидания:
+        # иначе зависшие потоки копились бы сверх GEOCODER_CONCURRENCY
+        await self._semaphore.acquire()
+        try:
+            future = asyncio.ensure_future(asyncio.to_thread(self.backend.reverse, latitude, longitude))
+        except BaseException:
+            self._semaphore.release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            with GEOCODER_SECONDS.time():
+                address = await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            GEOCODER_REQUESTS.inc("timeout")
+            logger.error(f"Геокодер не ответил за {self.timeout} с для координат {key}")
+            return None
+        except Exception as e:
+            GEOCODER_REQUESTS.inc("error")
+            logger.error(f"Ошибка геокодирования координат {key}: {e}")
+            return None
+
+        GEOCODER_REQUESTS.inc("backend")
+
+        if address:
+            self._memory.set(key, address)
+            await save_cached_address(key, address)
+
+        return address
+
+
+geocoder = GeocodingService()
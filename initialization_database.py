@@ -3,28 +3,32 @@ import os
 import logging
 
 from config import DATABASE_PATH
+from log_config import setup_logging
+from migrations import apply_migrations, check_query_plans
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-def init_db():
-    """Создаёт таблицы в базе данных, если они не существуют."""
+def init_db(database_path=DATABASE_PATH):
+    """
+    Создаёт таблицы в базе данных, если они не существуют, и применяет миграции.
+    Ошибки создания схемы, миграций и проверки планов запросов пробрасываются вызывающему коду.
+    """
     conn = None  # Инициализируем conn как None для предотвращения ошибки
 
     # Проверка, существует ли папка для базы данных
-    db_directory = os.path.dirname(DATABASE_PATH)
-    if not os.path.exists(db_directory):
+    db_directory = os.path.dirname(database_path)
+    if db_directory and not os.path.exists(db_directory):
         try:
             os.makedirs(db_directory)
             logger.info(f"Папка для базы данных была успешно создана: {db_directory}")
         except Exception as e:
             logger.error(f"Ошибка при создании папки для базы данных: {e}")
-            return
+            raise
 
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = sqlite3.connect(database_path)
         cursor = conn.cursor()
         logger.info("Подключение к базе данных успешно")
 
@@ -89,12 +93,20 @@ def init_db():
 
         conn.commit()
         logger.info("Изменения в базе данных успешно сохранены")
+
+        # Применяем версионированные миграции и проверяем планы горячих запросов
+        apply_migrations(conn)
+        check_query_plans(conn)
     except Exception as e:
+        # Ошибка миграций или проверки планов запросов должна остановить запуск бота
         logger.error(f"Ошибка при инициализации базы данных: {e}")
+        raise
     finally:
         if conn:  # Проверяем, был ли объект соединения создан
             conn.close()
             logger.info("Соединение с базой данных закрыто")
 
 
-init_db()
+if __name__ == "__main__":
+    setup_logging()
+    init_db()
@@ -8,7 +8,7 @@ def main_menu_users():
     """Создает клавиатуру основного меню для пользователей"""
     builder = ReplyKeyboardBuilder()
     builder.add(KeyboardButton(text="🔄 Обновить свои данные"))
-    # builder.add(KeyboardButton(text="📋 Мои заявки"))
+    builder.add(KeyboardButton(text="📋 Мои заявки"))
     builder.add(KeyboardButton(text="📝 Создать заявку"))
     return builder.as_markup(resize_keyboard=True)
 
@@ -18,7 +18,7 @@ def main_menu_admins():
     builder = ReplyKeyboardBuilder()
     builder.add(KeyboardButton(text="🔄 Обновить данные"))
     builder.add(KeyboardButton(text="📊 Статистика"))
-    # builder.add(KeyboardButton(text="📋 Заявки"))
+    builder.add(KeyboardButton(text="📋 Заявки"))
     builder.add(KeyboardButton(text="📝 Создать заявку"))
     return builder.as_markup(resize_keyboard=True)
 
@@ -28,6 +28,7 @@ def statistics_selection_menu():
     builder = ReplyKeyboardBuilder()
     builder.add(KeyboardButton(text="📊 Статистика за всё время"))
     builder.add(KeyboardButton(text="📅 Статистика за сегодня"))
+    builder.add(KeyboardButton(text="📈 Сводка"))
     builder.add(KeyboardButton(text="↩️ Назад"))
     return builder.as_markup(resize_keyboard=True)
 
@@ -44,10 +45,11 @@ def data_menu_admins():
 def requests_menu_admins():
     """Создает клавиатуру меню работы с заявками для администраторов"""
     builder = ReplyKeyboardBuilder()
-    # builder.row(KeyboardButton(text="📋 Заявки пользователей"))
-    # builder.add(KeyboardButton(text="📋 Мои заявки"))
-    # builder.add(KeyboardButton(text="📊 Статистика"))
-    # builder.row(KeyboardButton(text="↩️ Назад"))
+    builder.row(KeyboardButton(text="📋 Мои открытые заявки"))
+    builder.add(KeyboardButton(text="📋 Все открытые заявки"))
+    builder.row(KeyboardButton(text="🔍 Поиск"))
+    builder.add(KeyboardButton(text="📨 Массовый ответ"))
+    builder.row(KeyboardButton(text="↩️ Назад"))
     return builder.as_markup(resize_keyboard=True)
 
 
@@ -122,3 +124,55 @@ def create_keyboard_answer(request_id):
     builder = InlineKeyboardBuilder()
     builder.add(InlineKeyboardButton(text="Написать ответ", callback_data=f'answer:{request_id}'))
     return builder.as_markup()
+
+
+def requests_page_keyboard(scope, request_ids, has_prev, has_next):
+    """
+    Создает клавиатуру страницы списка заявок: кнопки ответа по каждой заявке и переход между страницами.
+    scope — вид списка ("my" или "all"), передаётся в callback_data кнопок навигации.
+    """
+    builder = InlineKeyboardBuilder()
+    for request_id in request_ids:
+        builder.add(InlineKeyboardButton(text=f"Ответить №{request_id}", callback_data=f'answer:{request_id}'))
+    builder.adjust(2)
+
+    navigation = []
+    if has_prev:
+        navigation.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f'queue:{scope}:prev'))
+    navigation.append(InlineKeyboardButton(text="🔄", callback_data=f'queue:{scope}:first'))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f'queue:{scope}:next'))
+    builder.row(*navigation)
+    return builder.as_markup()
+
+
+def search_page_keyboard(request_ids, page, has_next):
+    """
+    Создает клавиатуру страницы результатов поиска: кнопки ответа по открытым заявкам и переход между страницами.
+    """
+    builder = InlineKeyboardBuilder()
+    for request_id in request_ids:
+        builder.add(InlineKeyboardButton(text=f"Ответить №{request_id}", callback_data=f'answer:{request_id}'))
+    builder.adjust(2)
+
+    navigation = []
+    if page > 0:
+        navigation.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f'search:{page - 1}'))
+    if has_next:
+        navigation.append(InlineKeyboardButton(text="Вперёд ▶️", callback_data=f'search:{page + 1}'))
+    if navigation:
+        builder.row(*navigation)
+    return builder.as_markup()
+
+
+def history_page_keyboard(first_id, last_id, has_newer, has_older):
+    """
+    Создает клавиатуру перехода между страницами истории заявок пользователя.
+    first_id и last_id — ID первой и последней заявки на текущей странице.
+    """
+    builder = InlineKeyboardBuilder()
+    if has_newer:
+        builder.add(InlineKeyboardButton(text="◀️ Новее", callback_data=f'history:after:{first_id}'))
+    if has_older:
+        builder.add(InlineKeyboardButton(text="Старше ▶️", callback_data=f'history:before:{last_id}'))
+    return builder.as_markup()
@@ -0,0 +1,91 @@
+import atexit
+import itertools
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+import config
+
+
+# Необязательные настройки из config.py
+LOG_LEVEL = getattr(config, "LOG_LEVEL", "INFO")
+LOG_LEVELS = getattr(config, "LOG_LEVELS", {})  # Уровни отдельных модулей, например {"work_database": "WARNING"}
+LOG_SAMPLING = getattr(config, "LOG_SAMPLING", {  # В лог попадает каждое N-е сообщение частых событий
+    "work_database.queries": 100,
+    "aiogram.event": 100,
+})
+LOG_FILE = getattr(config, "LOG_FILE", None)  # Файл лога в дополнение к stderr
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(filename)s - %(message)s'
+
+_listener = None
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает каждое rate-е сообщение ниже WARNING, предупреждения и ошибки — все."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate <= 1:
+            return True
+        return next(self._counter) % self.rate == 0
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Передаёт записи в очередь потока записи лога.
+    В вызывающем потоке только подставляются аргументы сообщения (значения могут измениться позже),
+    форматирование даты, трассировки и вывод выполняются в потоке QueueListener.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS, sampling=LOG_SAMPLING, log_file=LOG_FILE):
+    """
+    Настраивает логирование процесса: все записи через очередь уходят в отдельный поток,
+    который пишет их в stderr (и в log_file), не блокируя цикл событий.
+    Повторный вызов ничего не делает.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    for name, module_level in levels.items():
+        logging.getLogger(name).setLevel(module_level)
+    for name, rate in sampling.items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописывает оставшиеся в очереди записи и останавливает поток записи лога."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import time
+
+import config
+from config import TEMP_DIR, REQUESTS_MEDIA_DIR
+from work_database import get_referenced_media_paths, get_evictable_media
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+JANITOR_INTERVAL = getattr(config, "JANITOR_INTERVAL", 60 * 60)  # Период проходов очистки, сек.
+JANITOR_BATCH_SIZE = getattr(config, "JANITOR_BATCH_SIZE", 500)  # Файлов за один шаг обхода
+JANITOR_PAUSE = getattr(config, "JANITOR_PAUSE", 0.05)  # Пауза между шагами обхода, сек.
+JANITOR_TEMP_AGE = getattr(config, "JANITOR_TEMP_AGE", 24 * 60 * 60)  # Возраст удаляемых временных файлов, сек.
+JANITOR_ORPHAN_AGE = getattr(config, "JANITOR_ORPHAN_AGE", 24 * 60 * 60)  # Возраст файлов без записи в БД, сек.
+MEDIA_TOTAL_QUOTA = getattr(config, "MEDIA_TOTAL_QUOTA", None)  # Общий размер медиафайлов, байт (None — без лимита)
+
+
+class DirectoryScanner:
+    """Пошаговый обход дерева каталогов: каждый вызов next_batch возвращает не больше limit файлов."""
+
+    def __init__(self, root):
+        self._dirs = [root] if os.path.isdir(root) else []
+        self._iterator = None
+
+    @property
+    def done(self):
+        return self._iterator is None and not self._dirs
+
+    def next_batch(self, limit):
+        """Возвращает список (путь, размер, время изменения) следующих файлов (блокирующий вызов)."""
+        files = []
+        while len(files) < limit and not self.done:
+            if self._iterator is None:
+                try:
+                    self._iterator = os.scandir(self._dirs.pop())
+                except OSError as e:
+                    logger.warning(f"Не удалось прочитать каталог: {e}")
+                continue
+
+            entry = next(self._iterator, None)
+            if entry is None:
+                self._iterator.close()
+                self._iterator = None
+                continue
+
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    self._dirs.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((entry.path, stat.st_size, stat.st_mtime))
+            except OSError:
+                # Файл удалён во время обхода
+                continue
+        return files
+
+
+def _remove_files(paths, budget=None):
+    """Удаляет файлы (блокирующий вызов), пока не освобождено budget байт. Возвращает (файлов, байт)."""
+    removed, freed = 0, 0
+    for path in paths:
+        if budget is not None and freed >= budget:
+            break
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            logger.warning(f"Не удалось удалить файл {path}: {e}")
+            continue
+        removed += 1
+        freed += size
+    return removed, freed
+
+
+class MediaJanitor:
+    """
+    Фоновая очистка файлового хранилища.
+    Удаляет старые временные файлы и недокачанные .part, файлы хранилища без записей в БД
+    (например, загруженные в незавершённых заявках), а при превышении общего лимита —
+    копии на диске медиафайлов закрытых заявок, начиная со старых: они остаются доступны по file_id.
+    Каталоги обходятся небольшими шагами в отдельном потоке с паузами, не задерживая бота.
+    """
+
+    def __init__(self, media_root=REQUESTS_MEDIA_DIR, temp_root=TEMP_DIR, total_quota=MEDIA_TOTAL_QUOTA):
+        self.media_root = media_root
+        self.temp_root = temp_root
+        self.total_quota = total_quota
+        self.metrics = {"media_files": 0, "media_bytes": 0, "temp_files": 0, "temp_bytes": 0,
+                        "temp_removed": 0, "orphans_removed": 0, "evicted": 0, "freed_bytes": 0,
+                        "last_pass_seconds": None}
+        self._evict_after_id = 0
+        self._task = None
+
+    def start(self):
+        """Запускает фоновую очистку."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Фоновая очистка медиафайлов запущена")
+
+    async def stop(self):
+        """Останавливает фоновую очистку."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self):
+        """Возвращает метрики занятого места и результатов очистки."""
+        return dict(self.metrics)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_pass()
+            except Exception as e:
+                logger.error(f"Ошибка при очистке медиафайлов: {e}")
+            await asyncio.sleep(JANITOR_INTERVAL)
+
+    async def _scan(self, root):
+        """Асинхронно выдаёт порции файлов каталога root."""
+        scanner = DirectoryScanner(root)
+        while not scanner.done:
+            batch = await asyncio.to_thread(scanner.next_batch, JANITOR_BATCH_SIZE)
+            if batch:
+                yield batch
+            await asyncio.sleep(JANITOR_PAUSE)
+
+    async def run_pass(self):
+        """Выполняет один полный проход очистки и обновляет метрики."""
+        started = time.monotonic()
+        now = time.time()
+        usage = {"media_files": 0, "media_bytes": 0, "temp_files": 0, "temp_bytes": 0}
+
+        # Временные файлы удаляем только по возрасту
+        async for batch in self._scan(self.temp_root):
+            expired = [path for path, _, mtime in batch if now - mtime > JANITOR_TEMP_AGE]
+            removed, freed = await asyncio.to_thread(_remove_files, expired)
+            self.metrics["temp_removed"] += removed
+            self.metrics["freed_bytes"] += freed
+            usage["temp_files"] += len(batch) - removed
+            usage["temp_bytes"] += sum(size for _, size, _ in batch) - freed
+
+        async for batch in self._scan(self.media_root):
+            # Недокачанные файлы хранилища и старые файлы без ссылок из БД
+            parts = [path for path, _, mtime in batch if path.endswith(".part") and now - mtime > JANITOR_TEMP_AGE]
+            candidates = [path for path, _, mtime in batch
+                          if not path.endswith(".part") and now - mtime > JANITOR_ORPHAN_AGE]
+            referenced = await get_referenced_media_paths(candidates)
+            orphans = [path for path in candidates if path not in referenced]
+
+            removed_parts, freed_parts = await asyncio.to_thread(_remove_files, parts)
+            removed_orphans, freed_orphans = await asyncio.to_thread(_remove_files, orphans)
+            self.metrics["temp_removed"] += removed_parts
+            self.metrics["orphans_removed"] += removed_orphans
+            self.metrics["freed_bytes"] += freed_parts + freed_orphans
+            usage["media_files"] += len(batch) - removed_parts - removed_orphans
+            usage["media_bytes"] += sum(size for _, size, _ in batch) - freed_parts - freed_orphans
+
+        if self.total_quota is not None and usage["media_bytes"] > self.total_quota:
+            removed, freed = await self._evict(usage["media_bytes"] - self.total_quota)
+            usage["media_files"] -= removed
+            usage["media_bytes"] -= freed
+
+        self.metrics.update(usage)
+        self.metrics["last_pass_seconds"] = round(time.monotonic() - started, 2)
+        logger.info(f"Очистка медиафайлов завершена: {self.stats()}")
+
+    async def _evict(self, excess):
+        """
+        Удаляет копии на диске медиафайлов закрытых заявок, пока не освобождено excess байт.
+        Возвращает (файлов, байт).
+        """
+        logger.warning(f"Превышен общий лимит медиафайлов на {excess} байт, удаляем копии закрытых заявок")
+        evicted, freed = 0, 0
+        while freed < excess:
+            rows = await get_evictable_media(self._evict_after_id, JANITOR_BATCH_SIZE)
+            if not rows:
+                # Дошли до конца: следующий проход начнёт с самых старых записей
+                self._evict_after_id = 0
+                break
+            self._evict_after_id = rows[-1][0]
+
+            removed, batch_freed = await asyncio.to_thread(_remove_files, [path for _, path in rows], excess - freed)
+            evicted += removed
+            self.metrics["evicted"] += removed
+            self.metrics["freed_bytes"] += batch_freed
+            freed += batch_freed
+            await asyncio.sleep(JANITOR_PAUSE)
+        return evicted, freed
+
+
+media_janitor = MediaJanitor()
@@ -0,0 +1,159 @@
+import argparse
+import hashlib
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+from config import DATABASE_PATH, REQUESTS_MEDIA_DIR
+from db_connection import DB_BUSY_TIMEOUT
+from log_config import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_TASK = "media_layout"
+MIGRATION_BATCH_SIZE = 500
+MIGRATION_PAUSE = 0.1  # Пауза между пакетами, чтобы не мешать боту писать в БД, сек.
+
+
+def media_path(root, key, extension):
+    """
+    Путь хранения медиафайла с ключом key: files/ab/cd/{key}{extension},
+    где ab и cd — первые байты SHA-1 ключа. В каждом каталоге не больше 256 подкаталогов,
+    и файлы распределены по ним равномерно независимо от количества заявок.
+    """
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(root, "files", digest[:2], digest[2:4], f"{key}{extension}")
+
+
+def _place_file(old_path, new_path):
+    """Делает файл доступным по новому пути, не удаляя старый (блокирующий вызов)."""
+    if os.path.exists(new_path) or not os.path.exists(old_path):
+        return
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    try:
+        os.link(old_path, new_path)
+    except OSError:
+        # Жёсткая ссылка невозможна (другая файловая система) — копируем через временный файл
+        part_path = f"{new_path}.part"
+        shutil.copy2(old_path, part_path)
+        os.replace(part_path, new_path)
+
+
+def _remove_old_file(old_path, new_path, root):
+    """Удаляет файл по старому пути и опустевшие каталоги старой раскладки."""
+    if not os.path.exists(old_path):
+        return
+    # Файл по новому пути мог быть удалён очисткой до записи пути в БД — восстанавливаем
+    _place_file(old_path, new_path)
+    os.remove(old_path)
+
+    directory = os.path.dirname(old_path)
+    root = os.path.normpath(root)
+    while os.path.normpath(directory) != root and os.path.normpath(directory).startswith(root):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+
+def _media_key(file_path, file_unique_id, file_id):
+    return file_unique_id or file_id or os.path.basename(file_path).split('.')[0]
+
+
+def migrate_batch(conn, root, after_id, batch_size=MIGRATION_BATCH_SIZE):
+    """
+    Переносит в новую раскладку файлы пакета записей media с ID больше after_id.
+    Файл сначала появляется по новому пути, затем пути всех ссылающихся на него записей
+    меняются одной транзакцией, и только после этого удаляется старый файл —
+    бот всё время находит файл по тому пути, который видит в БД.
+    Возвращает (ID последней записи пакета или None, перенесено файлов).
+    """
+    rows = conn.execute(
+        """SELECT id, file_path, file_unique_id, file_id FROM media WHERE id > ? ORDER BY id LIMIT ?""",
+        (after_id, batch_size)).fetchall()
+    if not rows:
+        return None, 0
+
+    moves = {}
+    for _, file_path, file_unique_id, file_id in rows:
+        new_path = media_path(root, _media_key(file_path, file_unique_id, file_id), os.path.splitext(file_path)[1])
+        if file_path != new_path:
+            moves[file_path] = new_path
+
+    for old_path, new_path in moves.items():
+        _place_file(old_path, new_path)
+
+    last_id = rows[-1][0]
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany("UPDATE media SET file_path = ? WHERE file_path = ?",
+                         [(new_path, old_path) for old_path, new_path in moves.items()])
+        conn.executemany("UPDATE email_outbox SET attachment_path = ? WHERE attachment_path = ? AND status = 'pending'",
+                         [(new_path, old_path) for old_path, new_path in moves.items()])
+        conn.execute(
+            """INSERT INTO maintenance_progress (task, last_id) VALUES (?, ?)
+               ON CONFLICT(task) DO UPDATE SET last_id = excluded.last_id,
+               updated_at = DATETIME('now', '+3 hours')""",
+            (MIGRATION_TASK, last_id))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for old_path, new_path in moves.items():
+        _remove_old_file(old_path, new_path, root)
+
+    return last_id, len(moves)
+
+
+def migrate_media_layout(database_path=DATABASE_PATH, root=REQUESTS_MEDIA_DIR, batch_size=MIGRATION_BATCH_SIZE,
+                         pause=MIGRATION_PAUSE, restart=False):
+    """
+    Переносит медиафайлы из каталогов заявок в раскладку media_path пакетами.
+    Прогресс сохраняется в maintenance_progress: прерванный перенос продолжается с того же места.
+    """
+    conn = sqlite3.connect(database_path, timeout=DB_BUSY_TIMEOUT, isolation_level=None)
+    try:
+        if restart:
+            conn.execute("DELETE FROM maintenance_progress WHERE task = ?", (MIGRATION_TASK,))
+        row = conn.execute("SELECT last_id FROM maintenance_progress WHERE task = ?", (MIGRATION_TASK,)).fetchone()
+        after_id = row[0] if row else 0
+        if after_id:
+            logger.info(f"Продолжение переноса медиафайлов с записи {after_id}")
+
+        started = time.perf_counter()
+        total = 0
+        while True:
+            last_id, moved = migrate_batch(conn, root, after_id, batch_size)
+            if last_id is None:
+                break
+            after_id = last_id
+            total += moved
+            logger.info(f"Перенесено файлов: {total}, обработаны записи до {after_id}")
+            time.sleep(pause)
+
+        logger.info(f"Перенос медиафайлов завершён за {time.perf_counter() - started:.1f} с, файлов: {total}")
+        return total
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    parser = argparse.ArgumentParser(description="Перенос медиафайлов в раскладку с вложенными каталогами")
+    parser.add_argument("--batch-size", type=int, default=MIGRATION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=MIGRATION_PAUSE, help="Пауза между пакетами, сек.")
+    parser.add_argument("--restart", action="store_true", help="Начать перенос с первой записи")
+    args = parser.parse_args()
+
+    try:
+        migrate_media_layout(batch_size=args.batch_size, pause=args.pause, restart=args.restart)
+    except Exception as e:
+        logger.error(f"Ошибка при переносе медиафайлов: {e}")
+        sys.exit(1)
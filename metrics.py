@@ -0,0 +1,233 @@
+import bisect
+import logging
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import TelegramMethod
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+METRICS_HOST = getattr(config, "METRICS_HOST", "127.0.0.1")
+METRICS_PORT = getattr(config, "METRICS_PORT", 9090)  # Порт /metrics; None — не запускать сервер метрик
+
+# Границы корзин гистограмм задержки, сек.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labelnames, values):
+    if not labelnames:
+        return ""
+    pairs = []
+    for name, value in zip(labelnames, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Счётчик с метками. Значения меток передаются позиционно в порядке labelnames."""
+
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def samples(self):
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram:
+    """
+    Гистограмма с фиксированными корзинами и метками.
+    Наблюдение — поиск корзины и два сложения, суммирование по корзинам откладывается до выдачи метрик.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}  # метки -> [счётчики корзин (последняя — +Inf), сумма]
+
+    def observe(self, value, *labels):
+        item = self._values.get(labels)
+        if item is None:
+            item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        item[0][bisect.bisect_left(self.buckets, value)] += 1
+        item[1] += value
+
+    @contextmanager
+    def time(self, *labels):
+        """Замеряет время выполнения блока with."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels):
+        item = self._values.get(labels)
+        return sum(item[0]) if item else 0
+
+    def samples(self):
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (bound,))
+                yield f"{self.name}_bucket{bucket_labels} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса бота в текстовом формате Prometheus.
+    Счётчики и гистограммы обновляются из цикла событий без блокировок;
+    состояния фоновых сервисов снимаются их методами stats() в момент выдачи метрик.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix, stats, label=None):
+        """
+        Публикует числовые поля словаря stats() как метрики {prefix}_{поле} (gauge).
+        С label stats() возвращает список словарей, поле label каждого становится меткой.
+        """
+        self._collectors.append((prefix, stats, label))
+
+    def render(self):
+        """Возвращает все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+
+        for prefix, stats, label in self._collectors:
+            try:
+                items = stats() if label else [stats()]
+            except Exception as e:
+                logger.error(f"Ошибка при сборе метрик {prefix}: {e}")
+                continue
+            gauges = {}
+            for values in items:
+                labels = _format_labels((label,), (values[label],)) if label else ""
+                for key, value in values.items():
+                    if key != label and isinstance(value, (int, float)) and not isinstance(value, bool):
+                        gauges.setdefault(f"{prefix}_{key}", []).append(f"{prefix}_{key}{labels} {value}")
+            for name, samples in gauges.items():
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+UPDATE_SECONDS = registry.histogram(
+    "bot_update_seconds", "Время обработки обновления обработчиком", ("handler", "state"))
+UPDATE_ERRORS = registry.counter("bot_update_errors_total", "Ошибки в обработчиках обновлений", ("handler",))
+DB_QUERY_SECONDS = registry.histogram("bot_db_query_seconds", "Время выполнения запроса execute_db", ("query",))
+TELEGRAM_REQUESTS = registry.counter("bot_telegram_requests_total", "Запросы к Bot API", ("method", "result"))
+TELEGRAM_SECONDS = registry.histogram("bot_telegram_request_seconds", "Время запроса к Bot API", ("method",))
+EMAILS = registry.counter("bot_emails_total", "Отправка писем из очереди", ("result",))
+GEOCODER_REQUESTS = registry.counter("bot_geocoder_requests_total", "Запросы обратного геокодирования", ("result",))
+GEOCODER_SECONDS = registry.histogram("bot_geocoder_seconds", "Время обращения к геокодеру")
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Замеряет время обработчиков с разбивкой по имени обработчика и состоянию FSM.
+    Регистрируется как внутренний middleware (dp.message.middleware), когда обработчик уже выбран.
+    """
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        state = data.get("raw_state") or "none"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            UPDATE_ERRORS.inc(name)
+            raise
+        finally:
+            UPDATE_SECONDS.observe(time.perf_counter() - started, name, state)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Считает запросы бота к Bot API и их длительность по методам."""
+
+    async def __call__(self, make_request, bot: Bot, method: TelegramMethod):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            result = await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_REQUESTS.inc(name, type(e).__name__)
+            raise
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, name)
+        TELEGRAM_REQUESTS.inc(name, "ok")
+        return result
+
+
+class MetricsServer:
+    """Локальный HTTP-сервер, отдающий метрики по адресу /metrics."""
+
+    def __init__(self, registry: MetricsRegistry = registry):
+        self.registry = registry
+        self._runner = None
+
+    async def handle(self, request: web.Request):
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self, host=METRICS_HOST, port=METRICS_PORT):
+        """Запускает сервер метрик."""
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Метрики доступны по адресу http://{host}:{port}/metrics")
+
+    async def stop(self):
+        """Останавливает сервер метрик."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer()
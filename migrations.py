@@ -0,0 +1,354 @@
+import logging
+import mimetypes
+import os
+import re
+import sqlite3
+import sys
+
+import work_database
+from config import DATABASE_PATH
+from log_config import setup_logging
+
+
+logger = logging.getLogger(__name__)
+
+
+def _backfill_media_file_ids(conn):
+    """
+    Заполняет Telegram-идентификаторы и MIME-тип у сохранённых ранее медиафайлов.
+    Файлы в папках заявок названы {file_id}.{расширение}, файлы хранилища — {file_unique_id}.{расширение}.
+    """
+    updates = []
+    for media_id, file_path in conn.execute("SELECT id, file_path FROM media WHERE file_id IS NULL"):
+        key = os.path.basename(file_path).split('.')[0]
+        in_store = os.path.basename(os.path.dirname(file_path)) == "files"
+        updates.append((None if in_store else key, key if in_store else None,
+                        mimetypes.guess_type(file_path)[0], media_id))
+    conn.executemany("UPDATE media SET file_id = ?, file_unique_id = ?, mime_type = ? WHERE id = ?", updates)
+
+
+def _backfill_requests_fts(conn, batch_size=10000):
+    """
+    Заполняет полнотекстовый индекс заявок порциями по batch_size строк в порядке ID,
+    чтобы не читать всю таблицу заявок в одном запросе.
+    """
+    last_id = 0
+    indexed = 0
+    while True:
+        upper = conn.execute("SELECT MAX(id) FROM (SELECT id FROM requests WHERE id > ? ORDER BY id LIMIT ?)",
+                             (last_id, batch_size)).fetchone()[0]
+        if upper is None:
+            break
+        cursor = conn.execute(
+            """INSERT INTO requests_fts (rowid, description, address)
+               SELECT id, description, address FROM requests WHERE id > ? AND id <= ?""",
+            (last_id, upper))
+        indexed += cursor.rowcount
+        last_id = upper
+    logger.info(f"В полнотекстовый индекс добавлено заявок: {indexed}")
+
+
+# Упорядоченные шаги миграции: (версия, описание, шаги).
+# Шаг — SQL-строка либо функция, принимающая соединение.
+MIGRATIONS = [
+    (1, "Индексы для горячих запросов", [
+        "CREATE INDEX IF NOT EXISTS idx_requests_status_admin ON requests (status, admin_id)",
+        "CREATE INDEX IF NOT EXISTS idx_requests_created_at ON requests (created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_media_request_id ON media (request_id)",
+        "CREATE INDEX IF NOT EXISTS idx_users_role ON users (role)",
+    ]),
+    (2, "Счётчики открытых заявок администраторов", [
+        """CREATE TABLE IF NOT EXISTS admin_load (
+               admin_id INTEGER PRIMARY KEY,
+               open_requests INTEGER NOT NULL DEFAULT 0,
+               last_assigned_at TIMESTAMP NOT NULL DEFAULT '1970-01-01 00:00:00',
+               FOREIGN KEY (admin_id) REFERENCES users (id)
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_admin_load_order ON admin_load (open_requests, last_assigned_at)",
+        # Заполняем счётчики по текущим открытым заявкам
+        """INSERT OR REPLACE INTO admin_load (admin_id, open_requests, last_assigned_at)
+           SELECT u.id, COUNT(r.id), COALESCE(MAX(r.created_at), '1970-01-01 00:00:00')
+           FROM users u
+           LEFT JOIN requests r ON u.id = r.admin_id AND r.status = 'open'
+           WHERE u.role = 'admin'
+           GROUP BY u.id""",
+        # Счётчики обновляются триггерами в той же транзакции, что и изменение заявки
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_request_insert
+           AFTER INSERT ON requests
+           WHEN NEW.status = 'open' AND NEW.admin_id IS NOT NULL
+           BEGIN
+               UPDATE admin_load
+               SET open_requests = open_requests + 1, last_assigned_at = NEW.created_at
+               WHERE admin_id = NEW.admin_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_request_close
+           AFTER UPDATE OF status ON requests
+           WHEN OLD.status = 'open' AND NEW.status IS NOT 'open' AND OLD.admin_id IS NOT NULL
+           BEGIN
+               UPDATE admin_load SET open_requests = open_requests - 1 WHERE admin_id = OLD.admin_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_request_reopen
+           AFTER UPDATE OF status ON requests
+           WHEN OLD.status IS NOT 'open' AND NEW.status = 'open' AND NEW.admin_id IS NOT NULL
+           BEGIN
+               UPDATE admin_load SET open_requests = open_requests + 1 WHERE admin_id = NEW.admin_id;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_request_delete
+           AFTER DELETE ON requests
+           WHEN OLD.status = 'open' AND OLD.admin_id IS NOT NULL
+           BEGIN
+               UPDATE admin_load SET open_requests = open_requests - 1 WHERE admin_id = OLD.admin_id;
+           END""",
+        # Состав администраторов следует за ролью пользователя
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_user_insert
+           AFTER INSERT ON users
+           WHEN NEW.role = 'admin'
+           BEGIN
+               INSERT OR IGNORE INTO admin_load (admin_id) VALUES (NEW.id);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_user_promote
+           AFTER UPDATE OF role ON users
+           WHEN NEW.role = 'admin' AND OLD.role IS NOT 'admin'
+           BEGIN
+               INSERT OR REPLACE INTO admin_load (admin_id, open_requests, last_assigned_at)
+               SELECT NEW.id, COUNT(id), COALESCE(MAX(created_at), '1970-01-01 00:00:00')
+               FROM requests
+               WHERE admin_id = NEW.id AND status = 'open';
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_user_demote
+           AFTER UPDATE OF role ON users
+           WHEN OLD.role = 'admin' AND NEW.role IS NOT 'admin'
+           BEGIN
+               DELETE FROM admin_load WHERE admin_id = NEW.id;
+           END""",
+    ]),
+    (3, "Кэш обратного геокодирования", [
+        """CREATE TABLE IF NOT EXISTS geocode_cache (
+               coordinates TEXT PRIMARY KEY,  -- Координаты, округлённые до GEOCODER_PRECISION
+               address TEXT NOT NULL,
+               created_at TIMESTAMP DEFAULT (DATETIME('now', '+3 hours'))
+           )""",
+    ]),
+    (4, "Очередь исходящих писем", [
+        """CREATE TABLE IF NOT EXISTS email_outbox (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               recipient TEXT NOT NULL,
+               subject TEXT NOT NULL,
+               body TEXT NOT NULL,
+               attachment_path TEXT,
+               status TEXT NOT NULL DEFAULT 'pending',  -- pending, sent, failed
+               attempts INTEGER NOT NULL DEFAULT 0,
+               next_attempt_at INTEGER NOT NULL,  -- Unix-время следующей попытки
+               last_error TEXT,
+               created_at TIMESTAMP DEFAULT (DATETIME('now', '+3 hours')),
+               sent_at TIMESTAMP
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox (status, next_attempt_at)",
+    ]),
+    (5, "Ежедневная статистика заявок", [
+        # Пустые категория/статус хранятся как '', отсутствующий администратор — как 0
+        """CREATE TABLE IF NOT EXISTS request_stats_daily (
+               day TEXT NOT NULL,
+               category TEXT NOT NULL,
+               status TEXT NOT NULL,
+               admin_id INTEGER NOT NULL,
+               requests_count INTEGER NOT NULL DEFAULT 0,
+               PRIMARY KEY (day, category, status, admin_id)
+           ) WITHOUT ROWID""",
+        """INSERT OR REPLACE INTO request_stats_daily (day, category, status, admin_id, requests_count)
+           SELECT DATE(created_at), COALESCE(category, ''), COALESCE(status, ''), COALESCE(admin_id, 0), COUNT(*)
+           FROM requests
+           GROUP BY 1, 2, 3, 4""",
+        """CREATE TRIGGER IF NOT EXISTS trg_request_stats_insert
+           AFTER INSERT ON requests
+           BEGIN
+               INSERT INTO request_stats_daily (day, category, status, admin_id, requests_count)
+               VALUES (DATE(NEW.created_at), COALESCE(NEW.category, ''), COALESCE(NEW.status, ''),
+                       COALESCE(NEW.admin_id, 0), 1)
+               ON CONFLICT (day, category, status, admin_id) DO UPDATE SET requests_count = requests_count + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_request_stats_update
+           AFTER UPDATE OF status, admin_id, category ON requests
+           BEGIN
+               UPDATE request_stats_daily SET requests_count = requests_count - 1
+               WHERE day = DATE(OLD.created_at) AND category = COALESCE(OLD.category, '')
+                     AND status = COALESCE(OLD.status, '') AND admin_id = COALESCE(OLD.admin_id, 0);
+               INSERT INTO request_stats_daily (day, category, status, admin_id, requests_count)
+               VALUES (DATE(NEW.created_at), COALESCE(NEW.category, ''), COALESCE(NEW.status, ''),
+                       COALESCE(NEW.admin_id, 0), 1)
+               ON CONFLICT (day, category, status, admin_id) DO UPDATE SET requests_count = requests_count + 1;
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_request_stats_delete
+           AFTER DELETE ON requests
+           BEGIN
+               UPDATE request_stats_daily SET requests_count = requests_count - 1
+               WHERE day = DATE(OLD.created_at) AND category = COALESCE(OLD.category, '')
+                     AND status = COALESCE(OLD.status, '') AND admin_id = COALESCE(OLD.admin_id, 0);
+           END""",
+    ]),
+    (6, "Хранилище состояний FSM", [
+        """CREATE TABLE IF NOT EXISTS fsm_storage (
+               key TEXT PRIMARY KEY,  -- bot_id:chat_id:user_id:thread_id:business_connection_id:destiny
+               state TEXT,
+               data TEXT,  -- JSON
+               updated_at TIMESTAMP DEFAULT (DATETIME('now', '+3 hours'))
+           ) WITHOUT ROWID""",
+    ]),
+    (7, "Telegram-идентификаторы медиафайлов", [
+        "ALTER TABLE media ADD COLUMN file_id TEXT",
+        "ALTER TABLE media ADD COLUMN file_unique_id TEXT",
+        "ALTER TABLE media ADD COLUMN mime_type TEXT",
+        "ALTER TABLE media ADD COLUMN file_size INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_media_file_unique_id ON media (file_unique_id)",
+        _backfill_media_file_ids,
+    ]),
+    (8, "Индекс путей медиафайлов для очистки хранилища", [
+        "CREATE INDEX IF NOT EXISTS idx_media_file_path ON media (file_path)",
+    ]),
+    (9, "Прогресс фоновых переносов данных", [
+        """CREATE TABLE IF NOT EXISTS maintenance_progress (
+               task TEXT PRIMARY KEY,
+               last_id INTEGER NOT NULL DEFAULT 0,
+               updated_at TIMESTAMP DEFAULT (DATETIME('now', '+3 hours'))
+           )""",
+    ]),
+    (10, "Индекс истории заявок пользователя", [
+        "CREATE INDEX IF NOT EXISTS idx_requests_user_id ON requests (user_id)",
+    ]),
+    (11, "Полнотекстовый поиск по описаниям и адресам заявок", [
+        # Индекс без копии текста: содержимое читается из requests по rowid = requests.id
+        """CREATE VIRTUAL TABLE IF NOT EXISTS requests_fts USING fts5(
+               description, address,
+               content='requests', content_rowid='id',
+               tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+           )""",
+        """CREATE TRIGGER IF NOT EXISTS trg_requests_fts_insert
+           AFTER INSERT ON requests
+           BEGIN
+               INSERT INTO requests_fts (rowid, description, address)
+               VALUES (NEW.id, NEW.description, NEW.address);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_requests_fts_delete
+           AFTER DELETE ON requests
+           BEGIN
+               INSERT INTO requests_fts (requests_fts, rowid, description, address)
+               VALUES ('delete', OLD.id, OLD.description, OLD.address);
+           END""",
+        """CREATE TRIGGER IF NOT EXISTS trg_requests_fts_update
+           AFTER UPDATE OF description, address ON requests
+           BEGIN
+               INSERT INTO requests_fts (requests_fts, rowid, description, address)
+               VALUES ('delete', OLD.id, OLD.description, OLD.address);
+               INSERT INTO requests_fts (rowid, description, address)
+               VALUES (NEW.id, NEW.description, NEW.address);
+           END""",
+        _backfill_requests_fts,
+    ]),
+    (12, "Счётчики администраторов при переназначении заявок", [
+        # Один триггер вместо отдельных закрытия и повторного открытия: при одновременной смене статуса
+        # и администратора счётчик старого администратора уменьшается, нового — увеличивается ровно один раз
+        "DROP TRIGGER IF EXISTS trg_admin_load_request_close",
+        "DROP TRIGGER IF EXISTS trg_admin_load_request_reopen",
+        """CREATE TRIGGER IF NOT EXISTS trg_admin_load_request_update
+           AFTER UPDATE OF status, admin_id ON requests
+           WHEN (OLD.status IS 'open') != (NEW.status IS 'open') OR OLD.admin_id IS NOT NEW.admin_id
+           BEGIN
+               UPDATE admin_load SET open_requests = open_requests - 1
+               WHERE OLD.status = 'open' AND admin_id = OLD.admin_id;
+               UPDATE admin_load SET open_requests = open_requests + 1
+               WHERE NEW.status = 'open' AND admin_id = NEW.admin_id;
+           END""",
+        # Пересчитываем счётчики, разошедшиеся из-за прежних переназначений
+        """UPDATE admin_load SET open_requests = (
+               SELECT COUNT(*) FROM requests r WHERE r.admin_id = admin_load.admin_id AND r.status = 'open')""",
+    ]),
+]
+
+# Горячие запросы бота, которые не должны приводить к полному сканированию таблиц:
+# (запрос, параметры) — те же константы и построители запросов, что использует work_database
+HOT_QUERIES = {
+    "get_request_details": (work_database.REQUEST_DETAILS_QUERY, (1,)),
+    "get_available_admin_id": (work_database.AVAILABLE_ADMIN_QUERY, ()),
+    "get_admins": (work_database.ADMINS_QUERY, ()),
+    "get_user_data": (work_database.USER_DATA_QUERY, (1,)),
+    "export_today": (work_database.EXPORT_REQUESTS_QUERY.format(filter_condition="r.created_at >= ?"),
+                     ("1970-01-01 08:00:00",)),
+    "get_open_requests_page": work_database.open_requests_page_query((1, 1), 5),
+    "get_open_requests_page_unassigned": work_database.open_requests_page_query((None, 1), 5),
+    "get_open_requests_page_admin": work_database.open_requests_page_query((1, 1), 5, admin_id=1),
+    "get_user_requests_page": (work_database.USER_REQUESTS_OLDER_QUERY, (1, 1, 6)),
+    "get_user_requests_page_newer": (work_database.USER_REQUESTS_NEWER_QUERY, (1, 1, 6)),
+    "get_referenced_media_paths": (work_database.REFERENCED_MEDIA_QUERY.format(placeholders="?, ?"),
+                                   ("a", "b", "a", "b")),
+    "get_request_stats": (work_database.REQUEST_STATS_QUERY, ("-0 days",)),
+}
+
+
+def get_schema_version(conn):
+    """Возвращает текущую версию схемы базы данных."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """Применяет по порядку все шаги миграции, версия которых выше текущей."""
+    current_version = get_schema_version(conn)
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current_version:
+            continue
+
+        logger.info(f"Применение миграции {version}: {description}")
+        try:
+            conn.execute("BEGIN")
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {int(version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.error(f"Ошибка при применении миграции {version}")
+            raise
+
+        current_version = version
+
+    logger.info(f"Версия схемы базы данных: {current_version}")
+    return current_version
+
+
+def check_query_plans(conn):
+    """
+    Проверяет планы горячих запросов.
+    Выбрасывает RuntimeError, если какой-либо из них переходит к полному сканированию таблицы (SCAN).
+    Обход индекса (SCAN ... USING [COVERING] INDEX) допускается только в запросах с LIMIT:
+    без LIMIT он читает всю таблицу так же, как полное сканирование.
+    """
+    problems = []
+
+    for name, (query, params) in HOT_QUERIES.items():
+        has_limit = re.search(r"\bLIMIT\b", query, re.IGNORECASE) is not None
+        for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params):
+            detail = row[-1]
+            if not detail.startswith("SCAN"):
+                continue
+            if "USING" not in detail or not has_limit:
+                problems.append(f"{name}: {detail}")
+
+    if problems:
+        raise RuntimeError("Горячие запросы выполняются полным сканированием: " + "; ".join(problems))
+
+    logger.info("Планы горячих запросов используют индексы")
+
+
+if __name__ == "__main__":
+    setup_logging()
+
+    with sqlite3.connect(DATABASE_PATH) as connection:
+        try:
+            apply_migrations(connection)
+            check_query_plans(connection)
+        except Exception as e:
+            logger.error(f"Проверка схемы базы данных не пройдена: {e}")
+            sys.exit(1)
@@ -2,42 +2,45 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
+import asyncio
 import smtplib
+import time
 from pathlib import Path
 import logging
 
+import config
 from config import FROM_EMAIL, FROM_PASSWORD
+from metrics import EMAILS
+from work_database import enqueue_email, get_due_emails, mark_email_sent, mark_email_retry, get_email_queue_depth
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Необязательные настройки из config.py
+SMTP_HOST = getattr(config, "SMTP_HOST", "smtp.yandex.ru")
+SMTP_PORT = getattr(config, "SMTP_PORT", 465)
+SMTP_USE_SSL = getattr(config, "SMTP_USE_SSL", True)  # False — обычный SMTP (например, локальный aiosmtpd)
+EMAIL_BATCH_SIZE = getattr(config, "EMAIL_BATCH_SIZE", 20)  # Писем за один проход
+EMAIL_MAX_ATTEMPTS = getattr(config, "EMAIL_MAX_ATTEMPTS", 5)  # Попыток до отметки 'failed'
+EMAIL_RETRY_DELAY = getattr(config, "EMAIL_RETRY_DELAY", 30)  # Базовая задержка повтора, сек. (удваивается)
+EMAIL_POLL_INTERVAL = getattr(config, "EMAIL_POLL_INTERVAL", 5)  # Проверка очереди без новых писем, сек.
+EMAIL_IDLE_TIMEOUT = getattr(config, "EMAIL_IDLE_TIMEOUT", 60)  # Закрытие простаивающего SMTP-соединения, сек.
 
-def send_email(request_data, response_text, file_path):
-    """Отправка email с ответом на заявку пользователя"""
 
-    subject = f"Заявка №{request_data['request_id']}"
-
-    response_text = response_text + ("""\n_______________________\n\n"""
-                                     """Данное сообщение сформировано автоматически,"""
-                                     """пожалуйста, не отвечайте на это письмо.""")
-
-    # Создаем email сообщение
+def build_message(recipient, subject, body, attachment_path=None):
+    """Формирует email сообщение с необязательным вложением"""
     msg = MIMEMultipart()
     msg['From'] = FROM_EMAIL
-    msg['To'] = request_data['user']['email']
+    msg['To'] = recipient
     msg['Subject'] = subject
-    msg.attach(MIMEText(response_text, 'plain'))
-
-    logger.info(f"Отправка письма пользователю {request_data['user']['email']} по заявке №{request_data['request_id']}")
+    msg.attach(MIMEText(body, 'plain'))
 
     # Прикрепляем файл, если он есть
-    if file_path:
-        media_path = Path(file_path)
+    if attachment_path:
+        media_path = Path(attachment_path)
         logger.info(f"Проверка наличия файла для прикрепления: {media_path}")
         if media_path.exists():
             try:
-                logger.info(f"Файл найден, начинаем загрузку: {media_path}")
                 with open(media_path, 'rb') as file:
                     attachment = MIMEBase('application', 'octet-stream')
                     attachment.set_payload(file.read())
@@ -50,14 +53,146 @@ def send_email(request_data, response_text, file_path):
         else:
             logger.warning(f"Файл {media_path} не найден, отправка без вложения.")
 
-    # Отправка письма
-    try:
-        logger.info(f"Подключение к SMTP серверу для отправки письма на {request_data['user']['email']}")
-        with smtplib.SMTP_SSL("smtp.yandex.ru", 465) as server:
-            server.login(FROM_EMAIL, FROM_PASSWORD)
-            server.sendmail(FROM_EMAIL, request_data['user']['email'], msg.as_string())
-            logger.info(f"Ответ на заявку №{request_data['request_id']} успешно отправлен на "
-                        f"{request_data['user']['email']}")
-    except Exception as e:
-        logger.error(f"Ошибка при отправке письма: {e}")
-        return
+    return msg
+
+
+def format_email(request_id, response_text):
+    """Возвращает тему и текст письма с ответом на заявку"""
+    subject = f"Заявка №{request_id}"
+
+    response_text = response_text + ("""\n_______________________\n\n"""
+                                     """Данное сообщение сформировано автоматически,"""
+                                     """пожалуйста, не отвечайте на это письмо.""")
+    return subject, response_text
+
+
+async def send_email(request_data, response_text, file_path):
+    """Ставит email с ответом на заявку пользователя в очередь отправки"""
+    recipient = request_data['user']['email']
+    if not recipient:
+        logger.warning(f"У пользователя по заявке №{request_data['request_id']} не указан email, письмо не отправлено.")
+        return None
+
+    subject, response_text = format_email(request_data['request_id'], response_text)
+
+    email_id = await enqueue_email(recipient, subject, response_text, file_path)
+    email_worker.wake_up()
+    return email_id
+
+
+class EmailWorker:
+    """
+    Фоновая отправка писем из очереди email_outbox.
+    Держит одно авторизованное SMTP-соединение для всех писем пакета,
+    неудачные отправки повторяет с экспоненциальной задержкой.
+    """
+
+    def __init__(self):
+        self._smtp = None
+        self._last_used = 0.0
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        """Запускает фоновую задачу отправки."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Фоновая отправка писем запущена")
+
+    async def stop(self):
+        """Останавливает фоновую задачу и закрывает SMTP-соединение."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await asyncio.to_thread(self._disconnect)
+
+    def wake_up(self):
+        """Сообщает о новом письме в очереди."""
+        self._wakeup.set()
+
+    async def queue_depth(self):
+        """Возвращает количество писем, ожидающих отправки."""
+        return await get_email_queue_depth()
+
+    async def _run(self):
+        while True:
+            try:
+                sent = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Ошибка при обработке очереди писем: {e}")
+                sent = 0
+
+            # Полный пакет — сразу берём следующий, иначе ждём новых писем
+            if sent < EMAIL_BATCH_SIZE:
+                if self._smtp is not None and time.monotonic() - self._last_used > EMAIL_IDLE_TIMEOUT:
+                    await asyncio.to_thread(self._disconnect)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=EMAIL_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def process_batch(self):
+        """Отправляет один пакет писем из очереди. Возвращает количество обработанных писем."""
+        emails = await get_due_emails(EMAIL_BATCH_SIZE)
+
+        for email in emails:
+            try:
+                await asyncio.to_thread(self._send, email)
+                await mark_email_sent(email["id"])
+                EMAILS.inc("sent")
+                logger.info(f"Письмо №{email['id']} ({email['subject']}) успешно отправлено на {email['recipient']}")
+            except Exception as e:
+                attempts = email["attempts"] + 1
+                give_up = attempts >= EMAIL_MAX_ATTEMPTS
+                delay = EMAIL_RETRY_DELAY * 2 ** (attempts - 1)
+                await mark_email_retry(email["id"], e, delay, give_up)
+                EMAILS.inc("failed" if give_up else "retry")
+                if give_up:
+                    logger.error(f"Письмо №{email['id']} не отправлено после {attempts} попыток: {e}")
+                else:
+                    logger.warning(f"Ошибка при отправке письма №{email['id']}, повтор через {delay} с: {e}")
+
+        return len(emails)
+
+    def _connect(self):
+        """Возвращает авторизованное SMTP-соединение, открывая его при необходимости."""
+        if self._smtp is None:
+            logger.info(f"Подключение к SMTP серверу {SMTP_HOST}:{SMTP_PORT}")
+            smtp_class = smtplib.SMTP_SSL if SMTP_USE_SSL else smtplib.SMTP
+            smtp = smtp_class(SMTP_HOST, SMTP_PORT, timeout=30)
+            if FROM_PASSWORD:
+                smtp.login(FROM_EMAIL, FROM_PASSWORD)
+            self._smtp = smtp
+        return self._smtp
+
+    def _disconnect(self):
+        """Закрывает SMTP-соединение."""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+            logger.info("SMTP-соединение закрыто")
+
+    def _send(self, email):
+        """Отправляет письмо через общее SMTP-соединение (блокирующий вызов)."""
+        msg = build_message(email["recipient"], email["subject"], email["body"], email["attachment_path"])
+        try:
+            self._connect().sendmail(FROM_EMAIL, email["recipient"], msg.as_string())
+            self._last_used = time.monotonic()
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError):
+            # Ошибка относится к письму, соединение остаётся рабочим
+            raise
+        except Exception:
+            # Соединение могло быть разорвано сервером, следующая попытка откроет новое
+            self._disconnect()
+            raise
+
+
+email_worker = EmailWorker()
@@ -2,35 +2,50 @@ import asyncio
 import logging
 
 from aiogram import Dispatcher, types, F
-from aiogram.filters import StateFilter
+from aiogram.filters import Command, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.types import ReplyKeyboardRemove
 
+import config
+from admin_requests import handle_requests_menu, handle_open_requests, handle_requests_page, queue_cursors, \
+    handle_search_prompt, handle_search, handle_search_page
 from answer import handle_admin_answer, handle_admin_response_query
 from bot_config import dp, bot
+from bulk_answer import handle_bulk_start, handle_bulk_select, handle_bulk_answer_text, handle_bulk_confirm
 from create_request import (create_request, process_category, process_address, handle_address_confirmation,
                             process_media, process_description, confirm_request)
+from db_connection import db
+from initialization_database import init_db
 from keyboards import *
+from log_config import setup_logging
+from media_janitor import media_janitor
+from metrics import registry, metrics_server, METRICS_PORT
+from new_send_email import email_worker
 from report_export import handle_statistics, handle_statistics_today, handle_statistics_all_time, \
-    handle_back_to_admin_menu
+    handle_statistics_summary, handle_back_to_admin_menu
+from send_scheduler import send_scheduler
 from states import *
-from work_database import user_exists, get_user_data, save_user_data
+from supervisor import run_supervisor, BOT_PROCESSES
+from user_requests import handle_my_requests, handle_history_page
+from webhook import run_webhook
+from work_database import user_exists, get_user_data, save_user_data, user_cache, user_requests_cache
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+BOT_MODE = getattr(config, "BOT_MODE", "polling")  # polling или webhook
+
 
 async def start(message: types.Message, state: FSMContext):
     """
     Обрабатывает команду /start, проверяя наличие пользователя и отправляя соответствующее меню.
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id}")
+    logger.info("Получено сообщение от пользователя с ID: %s", message.from_user.id)
 
-    if user_exists(message.from_user.id):
+    if await user_exists(message.from_user.id):
         # Получаем данные пользователя
-        user_data = get_user_data(message.from_user.id)
-        logger.info(f"Данные пользователя: {user_data}")
+        user_data = await get_user_data(message.from_user.id)
+        logger.debug("Данные пользователя: %s", user_data)
 
         if user_data["role"] == "admin":
             # Если пользователь админ, показываем меню для админов
@@ -43,7 +58,7 @@ async def start(message: types.Message, state: FSMContext):
             await message.answer(f"Привет! Выбери, что хочешь сделать :", reply_markup=main_menu_users())
             await state.set_state(MainMenuStates.menu_user)
     else:
-        logger.info(f"Пользователь с ID {message.from_user.id} не найден в системе. Отправляем сообщение о согласии.")
+        logger.info("Пользователь с ID %s не найден в системе. Отправляем сообщение о согласии.", message.from_user.id)
         await message.answer(
             """Вас приветствует служба приёма обращений Карельский . Заполняя обращение через Чатбот, 
             Вы даёте согласие на использование ваших персональных данных.
@@ -57,25 +72,25 @@ async def update_data_menu_admins(message: types.Message, state: FSMContext):
     """
     Обновляет меню для администратора, если пользователь найден и является администратором.
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id}")
+    logger.info("Получено сообщение от пользователя с ID: %s", message.from_user.id)
 
-    user_data = get_user_data(message.from_user.id)
+    user_data = await get_user_data(message.from_user.id)
     if user_data:
         # Если пользователь найден в базе данных
-        logger.info(f"Данные пользователя: {user_data}")
+        logger.debug("Данные пользователя: %s", user_data)
 
         if user_data["role"] == "admin":
             # Если это администратор, показываем меню для админа
-            logger.info(f"Пользователь с ID {message.from_user.id} является администратором. Отправляем меню.")
+            logger.info("Пользователь с ID %s является администратором. Отправляем меню.", message.from_user.id)
             await message.answer("Вы администратор. Выберите, что хотите сделать:", reply_markup=data_menu_admins())
             await state.set_state(DataStates.data_menu)  # Переход в главное меню админа
         else:
             # Если пользователь не администратор
-            logger.warning(f"Пользователь с ID {message.from_user.id} не является администратором.")
+            logger.warning("Пользователь с ID %s не является администратором.", message.from_user.id)
             await message.answer("Вы не являетесь администратором.", reply_markup=main_menu_users())
     else:
         # Если пользователя нет в базе данных
-        logger.warning(f"Пользователь с ID {message.from_user.id} не найден в базе данных.")
+        logger.warning("Пользователь с ID %s не найден в базе данных.", message.from_user.id)
         await message.answer("Не удалось найти ваши данные. Пожалуйста, начните с регистрации.")
         await message.answer(
             """Вас приветствует служба приёма обращений. Заполняя обращение через Чатбот, 
@@ -90,18 +105,18 @@ async def update_data(message: types.Message, state: FSMContext):
     """
     Обновляет данные пользователя и предоставляет меню для ввода нового ФИО.
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id}")
+    logger.info("Получено сообщение от пользователя с ID: %s", message.from_user.id)
 
-    user_data = get_user_data(message.from_user.id)
+    user_data = await get_user_data(message.from_user.id)
     if user_data:
         # Если пользователь найден в базе данных
-        logger.info(f"Данные пользователя: {user_data}")
+        logger.debug("Данные пользователя: %s", user_data)
 
         if user_data["role"] == "admin":
             await state.update_data(fio=user_data["fio"], phone=user_data["phone"],
                                     email=user_data["email"], role=user_data["role"])
             # Если это администратор, показываем меню для админа
-            logger.info(f"Пользователь с ID {message.from_user.id} является администратором.")
+            logger.info("Пользователь с ID %s является администратором.", message.from_user.id)
             await message.answer("Вы администратор.", reply_markup=ReplyKeyboardRemove())
             await message.answer(
                 f"Давай обновим твои данные.\n\nТекущее ФИО: <b>{user_data['fio']}</b>\nВведите новое ФИО:",
@@ -109,7 +124,7 @@ async def update_data(message: types.Message, state: FSMContext):
             await state.set_state(UserStates.fio)  # Переход к вводу нового ФИО
         else:
             # Если обычный пользователь, показываем меню для обновления данных
-            logger.info(f"Пользователь с ID {message.from_user.id} не является администратором.")
+            logger.info("Пользователь с ID %s не является администратором.", message.from_user.id)
             await state.update_data(fio=user_data["fio"], phone=user_data["phone"],
                                     email=user_data["email"], role=user_data["role"])
 
@@ -119,7 +134,7 @@ async def update_data(message: types.Message, state: FSMContext):
             await state.set_state(UserStates.fio)  # Переход к вводу нового ФИО
     else:
         # Если пользователя нет в базе данных
-        logger.warning(f"Пользователь с ID {message.from_user.id} не найден в базе данных.")
+        logger.warning("Пользователь с ID %s не найден в базе данных.", message.from_user.id)
         await message.answer("Не удалось найти ваши данные. Пожалуйста, начните с регистрации.")
 
 
@@ -127,16 +142,16 @@ async def accept_agreement(message: types.Message, state: FSMContext):
     """
     Обрабатывает согласие пользователя на обработку данных и переходит к следующему шагу.
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id} с текстом: {message.text}")
+    logger.info("Получено сообщение от пользователя с ID: %s с текстом: %s", message.from_user.id, message.text)
 
     if message.text == "Принять":
         # Переход к заполнению данных
-        logger.info(f"Пользователь с ID {message.from_user.id} принял соглашение.")
+        logger.info("Пользователь с ID %s принял соглашение.", message.from_user.id)
         await message.answer("Укажите Ваши данные: ФИО", reply_markup=ReplyKeyboardRemove())
         await state.set_state(UserStates.fio)
     else:
         # Если не принял, можно завершить взаимодействие или спросить повторно
-        logger.warning(f"Пользователь с ID {message.from_user.id} не принял соглашение.")
+        logger.warning("Пользователь с ID %s не принял соглашение.", message.from_user.id)
         await message.answer("Для продолжения необходимо принять соглашение.")
 
 
@@ -144,31 +159,31 @@ async def get_fio(message: types.Message, state: FSMContext):
     """
     Обрабатывает введённое ФИО пользователя и переходит к следующему шагу (выбор роли или телефон).
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id} с текстом: {message.text}")
+    logger.info("Получено сообщение от пользователя с ID: %s с текстом: %s", message.from_user.id, message.text)
 
-    user_data_base = get_user_data(message.from_user.id)
-    logger.info(f"Данные пользователя из базы: {user_data_base}")
+    user_data_base = await get_user_data(message.from_user.id)
+    logger.debug("Данные пользователя из базы: %s", user_data_base)
 
     user_data = await state.get_data()
-    logger.info(f"Текущие данные пользователя в сессии: {user_data}")
+    logger.debug("Текущие данные пользователя в сессии: %s", user_data)
 
     is_new = not bool(user_data_base)  # Проверяем, создаются ли данные впервые
 
     if message.text == "Пропустить":
-        logger.info(f"Пользователь с ID {message.from_user.id} пропустил ввод ФИО.")
+        logger.info("Пользователь с ID %s пропустил ввод ФИО.", message.from_user.id)
         pass
     elif message.text == "Оставить пустым":
-        logger.info(f"Пользователь с ID {message.from_user.id} оставил ФИО пустым.")
+        logger.info("Пользователь с ID %s оставил ФИО пустым.", message.from_user.id)
         await state.update_data(fio="")
     else:
-        logger.info(f"Пользователь с ID {message.from_user.id} ввел ФИО: {message.text}")
+        logger.info("Пользователь с ID %s ввел ФИО: %s", message.from_user.id, message.text)
         await state.update_data(fio=message.text)
 
     # reply_markup = empty_or_skip_buttons() if user_data_base else empty_or_skip_buttons(show_skip=False)
 
     # Если администратор, сразу после ФИО предложим выбрать роль
     if user_data_base and user_data_base["role"] == "admin":
-        logger.info(f"Пользователь с ID {message.from_user.id} является администратором. Переход к выбору роли.")
+        logger.info("Пользователь с ID %s является администратором. Переход к выбору роли.", message.from_user.id)
         text = "Теперь выбери свою роль (Администратор или Пользователь):"
         await message.answer(text, parse_mode="html",
                              reply_markup=get_role_keyboard())
@@ -180,7 +195,7 @@ async def get_fio(message: types.Message, state: FSMContext):
 
         text = "Укажите способ обратной связи, мобильный номер телефона:" if is_new else \
             f"Текущий номер телефона: <b>{user_data_base['phone']}</b>\nТеперь введи новый номер телефона:"
-        logger.info(f"Пользователю с ID {message.from_user.id} отправлено сообщение о введении номера телефона.")
+        logger.info("Пользователю с ID %s отправлено сообщение о введении номера телефона.", message.from_user.id)
         await message.answer(text, parse_mode="html", reply_markup=reply_markup)
         await state.set_state(UserStates.phone)
 
@@ -189,24 +204,24 @@ async def get_role(message: types.Message, state: FSMContext):
     """
     Обрабатывает выбор роли пользователя и переходит к вводу номера телефона.
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id} с текстом: {message.text}")
+    logger.info("Получено сообщение от пользователя с ID: %s с текстом: %s", message.from_user.id, message.text)
 
-    user_data_base = get_user_data(message.from_user.id)
-    logger.info(f"Данные пользователя из базы: {user_data_base}")
+    user_data_base = await get_user_data(message.from_user.id)
+    logger.debug("Данные пользователя из базы: %s", user_data_base)
 
     user_data = await state.get_data()
-    logger.info(f"Текущие данные пользователя в сессии: {user_data}")
+    logger.debug("Текущие данные пользователя в сессии: %s", user_data)
 
     is_new = not bool(user_data_base)  # Проверяем, создаются ли данные впервые
 
     if message.text == "Администратор":
         await state.update_data(role="admin")
-        logger.info(f"Пользователь с ID {message.from_user.id} получил роль администратора.")
+        logger.info("Пользователь с ID %s получил роль администратора.", message.from_user.id)
     elif message.text == "Пользователь":
         await state.update_data(role="user")
-        logger.info(f"Пользователь с ID {message.from_user.id} понижен до роли пользователя.")
+        logger.info("Пользователь с ID %s понижен до роли пользователя.", message.from_user.id)
     else:
-        logger.warning(f"Пользователь с ID {message.from_user.id} ввел некорректную роль: {message.text}")
+        logger.warning("Пользователь с ID %s ввел некорректную роль: %s", message.from_user.id, message.text)
         await message.answer("Некорректный ввод. Введите номер вручную или отправьте контакт.")
         return
 
@@ -215,7 +230,7 @@ async def get_role(message: types.Message, state: FSMContext):
 
     text = "Укажите способ обратной связи, мобильный номер телефона:" if is_new else \
         f"Текущий номер телефона: <b>{user_data_base['phone']}</b>\nТеперь введи новый номер телефона:"
-    logger.info(f"Пользователю с ID {message.from_user.id} отправлено сообщение о введении номера телефона.")
+    logger.info("Пользователю с ID %s отправлено сообщение о введении номера телефона.", message.from_user.id)
     await message.answer(text, parse_mode="html", reply_markup=reply_markup)
     await state.set_state(UserStates.phone)
 
@@ -224,28 +239,28 @@ async def get_phone(message: types.Message, state: FSMContext):
     """
     Обрабатывает введённый номер телефона пользователя и переходит к следующему шагу (email).
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id} с текстом: {message.text}")
+    logger.info("Получено сообщение от пользователя с ID: %s с текстом: %s", message.from_user.id, message.text)
 
-    user_data_base = get_user_data(message.from_user.id)
-    logger.info(f"Данные пользователя из базы: {user_data_base}")
+    user_data_base = await get_user_data(message.from_user.id)
+    logger.debug("Данные пользователя из базы: %s", user_data_base)
 
     user_data = await state.get_data()
-    logger.info(f"Текущие данные пользователя в сессии: {user_data}")
+    logger.debug("Текущие данные пользователя в сессии: %s", user_data)
 
     is_new = not bool(user_data_base)
 
     if message.text == "Пропустить":
-        logger.info(f"Пользователь с ID {message.from_user.id} пропустил ввод номера телефона.")
+        logger.info("Пользователь с ID %s пропустил ввод номера телефона.", message.from_user.id)
         pass
     elif message.contact:
         await state.update_data(phone=message.contact.phone_number)
-        logger.info(f"Пользователь с ID {message.from_user.id} отправил контакт. "
-                    f"Номер телефона: {message.contact.phone_number}")
+        logger.info("Пользователь с ID %s отправил контакт. Номер телефона: %s",
+                    message.from_user.id, message.contact.phone_number)
     elif message.text:
         await state.update_data(phone=message.text)
-        logger.info(f"Пользователь с ID {message.from_user.id} ввел номер телефона: {message.text}")
+        logger.info("Пользователь с ID %s ввел номер телефона: %s", message.from_user.id, message.text)
     else:
-        logger.warning(f"Пользователь с ID {message.from_user.id} ввел некорректный номер телефона.")
+        logger.warning("Пользователь с ID %s ввел некорректный номер телефона.", message.from_user.id)
         await message.answer("Некорректный ввод. Введите номер вручную или отправьте контакт.")
         return
 
@@ -253,7 +268,7 @@ async def get_phone(message: types.Message, state: FSMContext):
 
     text = "Укажите адрес Вашей эл.почты:" if is_new else \
         f"Текущий email: <b>{user_data_base['email'] or '-'}</b>\nТеперь введи новый email:"
-    logger.info(f"Пользователю с ID {message.from_user.id} отправлено сообщение о введении email.")
+    logger.info("Пользователю с ID %s отправлено сообщение о введении email.", message.from_user.id)
     await message.answer(text, parse_mode="html", reply_markup=reply_markup)
     await state.set_state(UserStates.email)
 
@@ -262,30 +277,30 @@ async def get_email(message: types.Message, state: FSMContext):
     """
     Обрабатывает введённый email пользователя, сохраняет данные и отправляет сообщение о статусе сохранения.
     """
-    logger.info(f"Получено сообщение от пользователя с ID: {message.from_user.id} с текстом: {message.text}")
+    logger.info("Получено сообщение от пользователя с ID: %s с текстом: %s", message.from_user.id, message.text)
 
-    user_data_base = get_user_data(message.from_user.id)
-    logger.info(f"Данные пользователя из базы: {user_data_base}")
+    user_data_base = await get_user_data(message.from_user.id)
+    logger.debug("Данные пользователя из базы: %s", user_data_base)
 
     user_data = await state.get_data()
-    logger.info(f"Текущие данные пользователя в сессии: {user_data}")
+    logger.debug("Текущие данные пользователя в сессии: %s", user_data)
 
     is_new = not bool(user_data_base)
 
     if message.text == "Пропустить":
-        logger.info(f"Пользователь с ID {message.from_user.id} пропустил ввод email.")
+        logger.info("Пользователь с ID %s пропустил ввод email.", message.from_user.id)
         pass
     elif message.text == "Оставить пустым":
         await state.update_data(email=None)
-        logger.info(f"Пользователь с ID {message.from_user.id} оставил email пустым.")
+        logger.info("Пользователь с ID %s оставил email пустым.", message.from_user.id)
     else:
         await state.update_data(email=message.text)
-        logger.info(f"Пользователь с ID {message.from_user.id} ввел email: {message.text}")
+        logger.info("Пользователь с ID %s ввел email: %s", message.from_user.id, message.text)
 
     updated_data = await state.get_data()
-    logger.info(f"Обновленные данные пользователя: {updated_data}")
+    logger.debug("Обновленные данные пользователя: %s", updated_data)
 
-    save_user_data(message.from_user.id, updated_data, message.from_user.username)
+    await save_user_data(message.from_user.id, updated_data, message.from_user.username)
 
     status_text = "✅ Данные сохранены!\n\n" if is_new else "✅ Данные обновлены!\n\n"
 
@@ -298,8 +313,8 @@ async def get_email(message: types.Message, state: FSMContext):
         f"Выбери, что хочешь сделать:"
     )
 
-    user_data_base = get_user_data(message.from_user.id)
-    logger.info(f"Данные пользователя из базы после обновления: {user_data_base}")
+    user_data_base = await get_user_data(message.from_user.id)
+    logger.debug("Данные пользователя из базы после обновления: %s", user_data_base)
 
     reply_markup = main_menu_users() if user_data_base['role'] == 'user' else main_menu_admins()
     await message.answer(text, parse_mode="html", reply_markup=reply_markup)
@@ -307,19 +322,20 @@ async def get_email(message: types.Message, state: FSMContext):
         await state.set_state(MainMenuStates.menu_user)
     elif user_data_base['role'] == 'admin':
         await state.set_state(MainMenuStates.menu_admin)
-    logger.info(f"Пользователю с ID {message.from_user.id} отправлено сообщение с результатами.")
+    logger.info("Пользователю с ID %s отправлено сообщение с результатами.", message.from_user.id)
 
 
 # Регистрация обработчиков
 def register_state_handlers(dp: Dispatcher):
     dp.message.register(start, F.text == "/start")
+    dp.message.register(handle_search, Command("search"))
     dp.message.register(accept_agreement, AgreementStates.accepting_agreement)
 
     dp.message.register(update_data_menu_admins, F.text == "🔄 Обновить данные", StateFilter(MainMenuStates.menu_admin))
 
     dp.message.register(update_data, F.text == "🔄 Обновить свои данные")
     dp.message.register(create_request, F.text == "📝 Создать заявку")
-    # dp.message.register(update_data, F.text == "📋 Мои заявки")
+    dp.message.register(handle_my_requests, F.text == "📋 Мои заявки")
 
     dp.message.register(get_fio, UserStates.fio)
     dp.message.register(get_role, UserStates.role)
@@ -344,10 +360,33 @@ def register_state_handlers(dp: Dispatcher):
                         StateFilter(StatsStates.stat_menu))
     dp.message.register(handle_statistics_all_time, F.text == "📊 Статистика за всё время",
                         StateFilter(StatsStates.stat_menu))
+    dp.message.register(handle_statistics_summary, F.text == "📈 Сводка", StateFilter(StatsStates.stat_menu))
     dp.message.register(handle_back_to_admin_menu, F.text == "↩️ Назад", StateFilter(StatsStates.stat_menu))
 
+    # Обработчики для списка заявок администратора и поиска
+    requests_menu = StateFilter(AdminRequestsStates.requests_menu, AdminRequestsStates.search)
+    dp.message.register(handle_requests_menu, F.text == "📋 Заявки", StateFilter(MainMenuStates.menu_admin))
+    dp.message.register(handle_open_requests, F.text.in_({"📋 Мои открытые заявки", "📋 Все открытые заявки"}),
+                        requests_menu)
+    dp.message.register(handle_search_prompt, F.text == "🔍 Поиск", requests_menu)
+    dp.message.register(handle_bulk_start, F.text == "📨 Массовый ответ", requests_menu)
+    dp.message.register(handle_back_to_admin_menu, F.text == "↩️ Назад", requests_menu)
+    # Любой другой текст в режиме поиска — слова для поиска, поэтому кнопки меню регистрируются выше
+    dp.message.register(handle_search, AdminRequestsStates.search)
+
+    # Обработчики массового ответа
+    bulk_answer = StateFilter(BulkAnswerStates.select_requests, BulkAnswerStates.enter_answer)
+    dp.message.register(handle_back_to_admin_menu, F.text == "↩️ Назад", bulk_answer)
+    dp.message.register(handle_bulk_select, BulkAnswerStates.select_requests)
+    dp.message.register(handle_bulk_answer_text, BulkAnswerStates.enter_answer)
+    dp.message.register(handle_bulk_confirm, BulkAnswerStates.confirm)
+
+    dp.callback_query.register(process_callback, lambda query: query.data.startswith('answer:'))
+    dp.callback_query.register(handle_requests_page, lambda query: query.data.startswith('queue:'))
+    dp.callback_query.register(handle_search_page, lambda query: query.data.startswith('search:'))
+    dp.callback_query.register(handle_history_page, lambda query: query.data.startswith('history:'))
+
 
-@dp.callback_query(lambda query: query.data.startswith('answer:'))
 async def process_callback(query: types.CallbackQuery, state: FSMContext):
     callback_data = query.data
     action, user_id = callback_data.split(':')
@@ -358,9 +397,33 @@ async def process_callback(query: types.CallbackQuery, state: FSMContext):
 
 # Запуск бота
 async def main():
+    init_db()
     register_state_handlers(dp)
-    await dp.start_polling(bot)
+    email_worker.start()
+    media_janitor.start()
+    registry.add_collector("bot_send", send_scheduler.stats)
+    registry.add_collector("bot_user_cache", user_cache.stats)
+    registry.add_collector("bot_queue_cursors", queue_cursors.stats)
+    registry.add_collector("bot_user_requests_cache", user_requests_cache.stats)
+    registry.add_collector("bot_janitor", media_janitor.stats)
+    if METRICS_PORT is not None:
+        await metrics_server.start()
+    try:
+        if BOT_PROCESSES > 1:
+            # Обновления обрабатываются в BOT_PROCESSES процессах, здесь только приём и запись в БД
+            await run_supervisor(dp, bot, BOT_MODE)
+        elif BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await email_worker.stop()
+        await media_janitor.stop()
+        await metrics_server.stop()
+        await dp.storage.close()  # Сбрасываем отложенные состояния FSM
+        db.close()
 
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(main())
@@ -1,3 +1,4 @@
+import html
 import os
 from aiogram.types import Message, FSInputFile
 from aiogram.fsm.context import FSMContext
@@ -5,7 +6,25 @@ from aiogram.fsm.context import FSMContext
 from keyboards import *
 from export_requests import export_requests_to_excel
 from states import StatsStates, MainMenuStates
-from work_database import get_user_data
+from work_database import get_user_data, get_request_stats
+
+
+def format_request_stats(title, stats):
+    """Формирует текст сводки по статистике заявок"""
+    if not stats["total"]:
+        return f"<b>{title}</b>\nЗаявок нет."
+
+    def lines(counts):
+        return "\n".join(f"  {html.escape(str(name))}: <b>{count}</b>"
+                         for name, count in sorted(counts.items(), key=lambda item: -item[1]))
+
+    return (
+        f"<b>{title}</b>\n"
+        f"Всего заявок: <b>{stats['total']}</b>\n\n"
+        f"По статусам:\n{lines(stats['status'])}\n\n"
+        f"По категориям:\n{lines(stats['category'])}\n\n"
+        f"По администраторам:\n{lines(stats['admin'])}"
+    )
 
 
 async def handle_statistics(message: Message, state: FSMContext):
@@ -24,14 +43,14 @@ async def handle_statistics_today(message: Message, state: FSMContext):
     await state.set_state(StatsStates.stat_last_day)
 
     # Генерируем файл отчёта за сегодняшний день
-    file_path = export_requests_to_excel(filter_type="today")
+    file_path = await export_requests_to_excel(filter_type="today")
 
     if file_path is None:
         await message.answer("Нет данных для статистики за сегодня.")
         await state.set_state(StatsStates.stat_menu)
         return
 
-    user_data_base = get_user_data(message.from_user.id)
+    user_data_base = await get_user_data(message.from_user.id)
     reply_markup = main_menu_users() if user_data_base['role'] == 'user' else main_menu_admins()
 
     # Отправляем файл пользователю
@@ -49,14 +68,14 @@ async def handle_statistics_all_time(message: Message, state: FSMContext):
     await state.set_state(StatsStates.stat_all_time)
 
     # Генерируем файл отчёта за всё время
-    file_path = export_requests_to_excel(filter_type="all_time")
+    file_path = await export_requests_to_excel(filter_type="all_time")
 
     if file_path is None:
         await message.answer("Нет данных для статистики за всё время.")
         await state.set_state(StatsStates.stat_menu)
         return
 
-    user_data_base = get_user_data(message.from_user.id)
+    user_data_base = await get_user_data(message.from_user.id)
     reply_markup = main_menu_users() if user_data_base['role'] == 'user' else main_menu_admins()
 
     # Отправляем файл пользователю
@@ -68,6 +87,19 @@ async def handle_statistics_all_time(message: Message, state: FSMContext):
     await state.set_state(MainMenuStates.menu_admin)
 
 
+async def handle_statistics_summary(message: Message, state: FSMContext):
+    """Обработчик для кнопки '📈 Сводка': быстрые цифры из ежедневной статистики"""
+    today = await get_request_stats(days=1)
+    month = await get_request_stats(days=30)
+
+    await message.answer(f"{format_request_stats('Сегодня', today)}\n\n"
+                         f"{format_request_stats('За 30 дней', month)}",
+                         parse_mode="html", reply_markup=statistics_selection_menu())
+
+    # Остаёмся в меню статистики
+    await state.set_state(StatsStates.stat_menu)
+
+
 async def handle_back_to_admin_menu(message: Message, state: FSMContext):
     """Обработчик для кнопки '🔙 Назад'"""
     # Завершаем текущее состояние
@@ -1,61 +1,145 @@
+import asyncio
 import logging
 import os
-import shutil
+import uuid
 
-from bot_config import bot
-from config import *
-from work_database import save_media_to_db
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import File, FSInputFile, Message
 
+import config
+from bot_config import bot
+from config import REQUESTS_MEDIA_DIR
+from media_layout import media_path
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+MEDIA_CHUNK_SIZE = getattr(config, "MEDIA_CHUNK_SIZE", 64 * 1024)  # Размер порции при загрузке файла, байт
+# Размер одного медиафайла, байт (прежнее имя настройки — MEDIA_REQUEST_QUOTA)
+MEDIA_MAX_FILE_SIZE = getattr(config, "MEDIA_MAX_FILE_SIZE",
+                              getattr(config, "MEDIA_REQUEST_QUOTA", 20 * 1024 * 1024))
+MEDIA_DOWNLOAD_TIMEOUT = 120  # Таймаут загрузки файла, сек.
+
+
+def get_message_media(message: Message):
+    """
+    Возвращает описание фото или видео из сообщения (file_id, file_unique_id, MIME-тип, размер) или None.
+    Путь к сохранённой копии добавляется в поле path после сохранения файла.
+    """
+    if message.photo:
+        media, mime_type = message.photo[-1], "image/jpeg"  # Telegram пересжимает фото в JPEG
+    elif message.video:
+        media, mime_type = message.video, message.video.mime_type or "video/mp4"
+    else:
+        return None
+
+    return {"file_id": media.file_id, "file_unique_id": media.file_unique_id, "mime_type": mime_type,
+            "file_size": media.file_size, "path": None}
+
+
+async def send_media(bot: Bot, chat_id, media, **kwargs):
+    """
+    Отправляет фото или видео по сохранённому file_id без повторной загрузки файла.
+    Если Telegram не принимает file_id, файл загружается с диска.
+    """
+    is_photo = (media.get("mime_type") or "").startswith("image/")
+    send = bot.send_photo if is_photo else bot.send_video
+    field = "photo" if is_photo else "video"
+
+    try:
+        return await send(chat_id, **{field: media["file_id"]}, **kwargs)
+    except TelegramBadRequest as e:
+        if not media.get("path") or not await asyncio.to_thread(os.path.exists, media["path"]):
+            raise
+        logger.warning("Не удалось отправить файл %s по file_id, загружаем с диска: %s", media['file_unique_id'], e)
+        return await send(chat_id, **{field: FSInputFile(media["path"])}, **kwargs)
+
 
-# Проверка и создание директории, если её нет
-def ensure_directory_exists(directory: str):
-    """Проверяет наличие директории и создает директорию, если ее нет"""
-    if not os.path.exists(directory):
+class MediaStore:
+    """
+    Асинхронное хранилище медиафайлов.
+    Файл загружается потоком сразу в постоянную папку через временный файл и атомарное переименование,
+    имя файла — file_unique_id Telegram, поэтому одно и то же фото, отправленное дважды, хранится один раз.
+    Файлы раскладываются по вложенным каталогам (media_layout.media_path), чтобы каталоги не разрастались.
+    Все операции с файловой системой выполняются вне цикла событий.
+    """
+
+    def __init__(self, root=REQUESTS_MEDIA_DIR, bot: Bot = bot):
+        self.root = root
+        self.bot = bot
+        self._inflight = {}
+
+    def path_for(self, key, extension):
+        """Возвращает путь хранения файла с ключом key."""
+        return media_path(self.root, key, extension)
+
+    async def exists(self, path) -> bool:
+        """Проверяет, что файл сохранён."""
+        return await asyncio.to_thread(os.path.exists, path)
+
+    @staticmethod
+    def _touch(path) -> bool:
+        """Обновляет время изменения файла (блокирующий вызов). Возвращает False, если файла нет."""
         try:
-            os.makedirs(directory)
-            logger.info(f"Директория {directory} была успешно создана.")
-        except Exception as e:
-            logger.error(f"Ошибка при создании директории {directory}: {e}")
+            os.utime(path)
+            return True
+        except FileNotFoundError:
             return False
-    return True
 
+    async def save(self, file: File):
+        """
+        Сохраняет файл Telegram (результат bot.get_file) и возвращает путь к нему или None при ошибке.
+        Уже сохранённый файл повторно не загружается, файл больше MEDIA_MAX_FILE_SIZE не сохраняется.
+        """
+        if file.file_size and file.file_size > MEDIA_MAX_FILE_SIZE:
+            logger.warning("Файл %s (%s байт) превышает лимит %s",
+                           file.file_unique_id, file.file_size, MEDIA_MAX_FILE_SIZE)
+            return None
 
-async def download_media_file(file, new_name_file: str) -> bool:
-    """Загружает медиафайл в указанную(временную) директорию."""
-    if not ensure_directory_exists(TEMP_DIR):
-        return False
+        path = self.path_for(file.file_unique_id, os.path.splitext(file.file_path)[1])
+        # Повторно использованный файл «молодеет»: пока заявка с ним не подтверждена, записи в БД нет,
+        # и очистка (media_janitor) не должна удалить его как файл без ссылок
+        if await asyncio.to_thread(self._touch, path):
+            logger.info("Файл %s уже сохранён в %s", file.file_unique_id, path)
+            return path
 
-    try:
-        await bot.download_file(file.file_path, f'{TEMP_DIR}/{new_name_file}', timeout=120)
-        return True
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке файла: {e}")
-        return False
+        # Одновременные загрузки одного файла ждут одну и ту же загрузку
+        task = self._inflight.get(path)
+        if task is None:
+            task = self._inflight[path] = asyncio.ensure_future(self._download(file.file_path, path))
+            task.add_done_callback(lambda _: self._inflight.pop(path, None))
 
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            logger.error("Ошибка при загрузке файла %s: %s", file.file_unique_id, e)
+            return None
 
-async def save_media_file(file, request_id):
-    """Перемещает временный файл в постоянную папку и сохраняет в БД"""
-    request_folder = os.path.join(REQUESTS_MEDIA_DIR, str(request_id))  # sources/requests/{id_заявки}
+        logger.info("Файл %s сохранён в %s", file.file_unique_id, path)
+        return path
 
-    # Проверка и создание папки с использованием функции ensure_directory_exists
-    if not ensure_directory_exists(request_folder):
-        return  # Если не удаётся создать директорию, выходим из функции
+    async def _download(self, file_path, path):
+        """Загружает файл порциями во временный файл рядом с конечным и переименовывает его."""
+        await asyncio.to_thread(os.makedirs, os.path.dirname(path), exist_ok=True)
 
-    # Пути файлов
-    temp_file_path = os.path.join(TEMP_DIR, file)  # Временный путь
-    new_file_path = os.path.join(request_folder, file)  # Конечный путь
+        part_path = f"{path}.{uuid.uuid4().hex}.part"
+        url = self.bot.session.api.file_url(self.bot.token, file_path)
+        handle = await asyncio.to_thread(open, part_path, "wb")
+        try:
+            async for chunk in self.bot.session.stream_content(url, timeout=MEDIA_DOWNLOAD_TIMEOUT,
+                                                               chunk_size=MEDIA_CHUNK_SIZE):
+                await asyncio.to_thread(handle.write, chunk)
+            await asyncio.to_thread(handle.close)
+            await asyncio.to_thread(os.replace, part_path, path)
+        except BaseException:
+            await asyncio.to_thread(self._discard, handle, part_path)
+            raise
 
-    # Проверяем, существует ли файл
-    if os.path.exists(temp_file_path):
-        shutil.move(temp_file_path, new_file_path)
+    @staticmethod
+    def _discard(handle, part_path):
+        handle.close()
+        if os.path.exists(part_path):
+            os.remove(part_path)
 
-        # Сохраняем путь в БД
-        save_media_to_db(request_id, new_file_path)
 
-        logger.info(f"Файл успешно сохранён в {new_file_path}!")
-    else:
-        logger.error(f"Временный файл {temp_file_path} не найден!")
+media_store = MediaStore()
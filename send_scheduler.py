@@ -0,0 +1,256 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (TelegramMethod, SendMessage, SendPhoto, SendVideo, SendDocument, SendMediaGroup,
+                             SendLocation, CopyMessage, ForwardMessage)
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+BOT_PROCESSES = getattr(config, "BOT_PROCESSES", 1)
+SEND_GLOBAL_RATE = getattr(config, "SEND_GLOBAL_RATE", 30)  # Сообщений в секунду на бота (лимит Telegram)
+SEND_CHAT_RATE = getattr(config, "SEND_CHAT_RATE", 1)  # Сообщений в секунду в личный чат
+SEND_CHAT_BURST = getattr(config, "SEND_CHAT_BURST", 3)  # Допустимая пачка сообщений в личный чат
+SEND_GROUP_RATE = getattr(config, "SEND_GROUP_RATE", 20 / 60)  # Сообщений в секунду в группу
+SEND_MAX_RETRIES = getattr(config, "SEND_MAX_RETRIES", 3)  # Повторов после ответа 429
+SEND_REPORT_INTERVAL = getattr(config, "SEND_REPORT_INTERVAL", 60)  # Период отчёта о задержке очереди, сек.
+
+# Приоритеты отправки: меньше — раньше
+PRIORITY_HIGH = 0  # Уведомления администраторов
+PRIORITY_NORMAL = 1  # Ответы в диалоге
+PRIORITY_BULK = 2  # Массовые рассылки
+
+# Методы, на которые распространяются лимиты Telegram на отправку сообщений
+RATE_LIMITED_METHODS = (SendMessage, SendPhoto, SendVideo, SendDocument, SendMediaGroup, SendLocation,
+                        CopyMessage, ForwardMessage)
+
+_priority = ContextVar("send_priority", default=PRIORITY_NORMAL)
+
+
+@contextmanager
+def send_priority(priority):
+    """Задаёт приоритет всех отправок внутри блока with."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity подряд."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Возвращает, через сколько секунд будет доступен токен."""
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.blocked_until - now)
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds):
+        """Запрещает отправку на seconds секунд (ответ 429 с retry_after)."""
+        now = time.monotonic()
+        self._refill(now)
+        self.tokens = 0
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now):
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+
+class SendScheduler:
+    """
+    Планировщик исходящих сообщений бота.
+    Выдаёт разрешения на отправку с учётом общего ведра токенов и вёдер отдельных чатов:
+    из готовых к отправке чатов первым обслуживается запрос с более высоким приоритетом,
+    при равном приоритете — более ранний. Чат, упёршийся в свой лимит, не задерживает остальные.
+    """
+
+    def __init__(self, global_rate=SEND_GLOBAL_RATE / BOT_PROCESSES, chat_rate=SEND_CHAT_RATE,
+                 chat_burst=SEND_CHAT_BURST, group_rate=SEND_GROUP_RATE):
+        self.global_bucket = TokenBucket(global_rate, max(global_rate, 1))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self._chats = {}  # chat_id -> [ведро, куча запросов (priority, seq, future, enqueued_at)]
+        self._ready = []  # (priority, seq, chat_id) — головы очередей чатов, которым можно отправлять
+        self._delayed = []  # (ready_at, seq, chat_id) — чаты, ждущие своего токена
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._waits = {priority: deque(maxlen=1000) for priority in (PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_BULK)}
+        self.sent = 0
+        self.retries = 0
+        self._reported_at = time.monotonic()
+
+    def _chat(self, chat_id):
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            # Отрицательные ID — группы и каналы, у них свой, более строгий лимит
+            if isinstance(chat_id, int) and chat_id > 0:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, 1)
+            chat = self._chats[chat_id] = [bucket, []]
+        return chat
+
+    def _schedule(self, chat_id, now):
+        """Ставит голову очереди чата в готовые или отложенные."""
+        bucket, queue = self._chats[chat_id]
+        if not queue:
+            return
+        delay = bucket.delay(now)
+        if delay > 0:
+            heapq.heappush(self._delayed, (now + delay, next(self._seq), chat_id))
+        else:
+            priority, seq, _, _ = queue[0]
+            heapq.heappush(self._ready, (priority, seq, chat_id))
+
+    async def acquire(self, chat_id, priority=None, seq=None):
+        """
+        Ждёт разрешения на отправку сообщения в чат chat_id.
+        Возвращает порядковый номер запроса: повтор с тем же номером сохраняет место в очереди.
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.get_loop() is not loop:
+            self._task = loop.create_task(self._run())
+
+        priority = _priority.get() if priority is None else priority
+        seq = next(self._seq) if seq is None else seq
+        future = loop.create_future()
+        now = time.monotonic()
+        _, queue = self._chat(chat_id)
+        heapq.heappush(queue, (priority, seq, future, now))
+        self._schedule(chat_id, now)
+        self._wakeup.set()
+        await future
+        return seq
+
+    def block_chat(self, chat_id, seconds):
+        """Приостанавливает отправку в чат после ответа 429."""
+        self._chat(chat_id)[0].block(seconds)
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._delayed)
+                self._schedule(chat_id, now)
+
+            if now - self._reported_at >= SEND_REPORT_INTERVAL:
+                self._report(now)
+
+            if not self._ready:
+                self._prune(now)
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = self.global_bucket.delay(now)
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            priority, seq, chat_id = heapq.heappop(self._ready)
+            bucket, queue = self._chats.get(chat_id, (None, None))
+            # Устаревшая запись: голова очереди чата уже сменилась
+            if not queue or queue[0][:2] != (priority, seq):
+                continue
+            if bucket.delay(now) > 0:
+                self._schedule(chat_id, now)
+                continue
+
+            _, _, future, enqueued_at = heapq.heappop(queue)
+            if future.cancelled():
+                self._schedule(chat_id, now)
+                continue
+            self.global_bucket.consume(now)
+            bucket.consume(now)
+            self._waits[priority].append(now - enqueued_at)
+            self.sent += 1
+            future.set_result(None)
+            self._schedule(chat_id, now)
+
+    def _prune(self, now):
+        """Удаляет чаты без очереди, ведро которых уже полностью восстановилось."""
+        for chat_id in [chat_id for chat_id, (bucket, queue) in self._chats.items()
+                        if not queue and bucket.is_idle(now)]:
+            del self._chats[chat_id]
+
+    def stats(self):
+        """Возвращает глубину очереди и задержку выдачи разрешений (мс) по приоритетам."""
+        latency = {}
+        for priority, waits in self._waits.items():
+            if waits:
+                values = sorted(waits)
+                latency[priority] = {"p50_ms": round(values[len(values) // 2] * 1000, 1),
+                                     "p95_ms": round(values[min(int(len(values) * 0.95), len(values) - 1)] * 1000, 1),
+                                     "max_ms": round(values[-1] * 1000, 1)}
+        return {"queue_depth": sum(len(queue) for _, queue in self._chats.values()),
+                "sent": self.sent, "retries": self.retries, "latency": latency}
+
+    def _report(self, now):
+        self._reported_at = now
+        stats = self.stats()
+        if stats["sent"] or stats["queue_depth"]:
+            logger.info(f"Очередь отправки: {stats}")
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Пропускает все отправки сообщений бота через SendScheduler
+    и автоматически повторяет их после ответа 429 с учётом retry_after.
+    """
+
+    def __init__(self, scheduler: SendScheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot: Bot, method: TelegramMethod):
+        if not isinstance(method, RATE_LIMITED_METHODS):
+            return await make_request(bot, method)
+
+        priority = _priority.get()
+        seq = None
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            seq = await self.scheduler.acquire(method.chat_id, priority, seq)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == SEND_MAX_RETRIES:
+                    raise
+                logger.warning(f"Ограничение Telegram в чате {method.chat_id}, повтор через {e.retry_after} с")
+                self.scheduler.block_chat(method.chat_id, e.retry_after)
+                self.scheduler.retries += 1
+
+
+send_scheduler = SendScheduler()
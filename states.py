@@ -22,6 +22,17 @@ class UserStates(StatesGroup):
     role = State()                  # Ввод роли пользователя
 
 
+class AdminRequestsStates(StatesGroup):
+    requests_menu = State()         # Меню заявок администратора
+    search = State()                # Ввод слов для поиска заявок
+
+
+class BulkAnswerStates(StatesGroup):
+    select_requests = State()       # Выбор заявок по номерам или словам
+    enter_answer = State()          # Ввод текста массового ответа
+    confirm = State()               # Подтверждение массового ответа
+
+
 class MainMenuStates(StatesGroup):
     menu_admin = State()
     menu_user = State()
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import multiprocessing
+import queue as queue_module
+import signal
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import config
+from db_connection import db
+from log_config import setup_logging
+from metrics import registry, metrics_server, METRICS_PORT
+from webhook import WebhookServer, get_update_chat_id, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+BOT_PROCESSES = getattr(config, "BOT_PROCESSES", 1)  # Процессов-обработчиков; больше 1 — режим супервизора
+SUPERVISOR_QUEUE_SIZE = getattr(config, "SUPERVISOR_QUEUE_SIZE", 1000)  # Очередь обновлений одного процесса
+SUPERVISOR_CONCURRENCY = getattr(config, "SUPERVISOR_CONCURRENCY", 100)  # Одновременных обновлений в процессе
+SUPERVISOR_REPORT_INTERVAL = getattr(config, "SUPERVISOR_REPORT_INTERVAL", 60)  # Период отчёта о нагрузке, сек.
+
+POLLING_TIMEOUT = 10  # Таймаут long polling, сек.
+
+
+def worker_process(index, updates, write_requests, write_responses, handled):
+    """Точка входа процесса-обработчика."""
+    # Остановкой обработчиков управляет супервизор, Ctrl+C их не прерывает
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging()
+    asyncio.run(_worker_main(index, updates, write_requests, write_responses, handled))
+
+
+async def _worker_main(index, updates, write_requests, write_responses, handled):
+    # Модули бота импортируются уже в процессе обработчика: при загрузке они создают Bot и Dispatcher
+    from admin_requests import queue_cursors
+    from bot_config import bot, dp
+    from opros_bot import register_state_handlers
+    from send_scheduler import send_scheduler
+    from work_database import user_cache, user_requests_cache
+
+    db.use_remote_writer(write_requests, write_responses)
+    register_state_handlers(dp)
+    registry.add_collector("bot_send", send_scheduler.stats)
+    registry.add_collector("bot_user_cache", user_cache.stats)
+    registry.add_collector("bot_queue_cursors", queue_cursors.stats)
+    registry.add_collector("bot_user_requests_cache", user_requests_cache.stats)
+    if METRICS_PORT is not None:
+        # Каждый обработчик отдаёт свои метрики на следующем порту после супервизора
+        await metrics_server.start(port=METRICS_PORT + index + 1)
+    await dp.emit_startup(bot=bot, dispatcher=dp, bots=(bot,), **dp.workflow_data)
+    logger.info(f"Обработчик №{index} запущен")
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(SUPERVISOR_CONCURRENCY)
+    locks = {}
+    pending = {}
+    tasks = set()
+
+    async def process(chat_id, update):
+        # Задачи стартуют в порядке создания, поэтому обновления одного чата берут блокировку по очереди
+        lock = locks.setdefault(chat_id, asyncio.Lock())
+        try:
+            async with lock:
+                await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+        finally:
+            semaphore.release()
+            with handled.get_lock():
+                handled[index] += 1
+            pending[chat_id] -= 1
+            if not pending[chat_id]:
+                del pending[chat_id]
+                locks.pop(chat_id, None)
+
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+
+            try:
+                update = Update.model_validate_json(data, context={"bot": bot})
+            except Exception as e:
+                logger.error(f"Некорректное обновление от супервизора: {e}")
+                continue
+
+            await semaphore.acquire()
+            chat_id = get_update_chat_id(update)
+            pending[chat_id] = pending.get(chat_id, 0) + 1
+            task = asyncio.create_task(process(chat_id, update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        await dp.emit_shutdown(bot=bot, dispatcher=dp, bots=(bot,), **dp.workflow_data)
+        await dp.storage.close()  # Сбрасываем отложенные состояния FSM через писателя супервизора
+        await bot.session.close()
+        await metrics_server.stop()
+        logger.info(f"Обработчик №{index} остановлен")
+
+
+class Supervisor:
+    """
+    Распределяет обновления между процессами-обработчиками по хэшу ID чата,
+    поэтому обновления одного пользователя всегда попадают в один процесс и идут по порядку.
+    Запись в БД обработчики передают единственному писателю супервизора.
+    """
+
+    def __init__(self, processes=BOT_PROCESSES, queue_size=SUPERVISOR_QUEUE_SIZE):
+        # spawn: процессы не наследуют потоки и соединения с БД родителя
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(maxsize=queue_size) for _ in range(processes)]
+        self.routed = [0] * processes
+        self.handled = self._context.Array("q", processes)
+        self._write_channels = [(self._context.SimpleQueue(), self._context.SimpleQueue())
+                                for _ in range(processes)]
+        self._write_threads = []
+        self._processes = []
+
+    def start(self):
+        """Запускает процессы-обработчики и обслуживание их запросов на запись."""
+        for index, updates in enumerate(self.queues):
+            write_requests, write_responses = self._write_channels[index]
+            self._write_threads.append(db.serve_writes(write_requests, write_responses))
+            process = self._context.Process(
+                target=worker_process, name=f"bot-worker-{index}", daemon=True,
+                args=(index, updates, write_requests, write_responses, self.handled))
+            process.start()
+            self._processes.append(process)
+        logger.info(f"Супервизор запустил обработчиков: {len(self._processes)}")
+
+    async def route(self, update: Update):
+        """Передаёт обновление процессу, закреплённому за его чатом."""
+        index = hash(get_update_chat_id(update)) % len(self.queues)
+        data = update.model_dump_json(exclude_unset=True)
+        try:
+            self.queues[index].put_nowait(data)
+        except queue_module.Full:
+            # Обработчик не успевает — ждём места, не блокируя цикл событий
+            await asyncio.to_thread(self.queues[index].put, data)
+        self.routed[index] += 1
+
+    async def feed_update(self, bot: Bot, update: Update):
+        """Совместимость с Dispatcher.feed_update для приёма через WebhookServer."""
+        await self.route(update)
+
+    def stats(self):
+        """Возвращает нагрузку по процессам-обработчикам."""
+        return [{"worker": i, "pid": process.pid, "alive": process.is_alive(),
+                 "queue_depth": self.queues[i].qsize(), "routed": self.routed[i], "handled": self.handled[i]}
+                for i, process in enumerate(self._processes)]
+
+    async def report_load(self, interval=SUPERVISOR_REPORT_INTERVAL):
+        """Периодически пишет в лог нагрузку по обработчикам."""
+        while True:
+            await asyncio.sleep(interval)
+            for worker in self.stats():
+                if not worker["alive"]:
+                    logger.error(f"Обработчик №{worker['worker']} (pid {worker['pid']}) завершился")
+                logger.info(f"Обработчик №{worker['worker']}: в очереди {worker['queue_depth']}, "
+                            f"передано {worker['routed']}, обработано {worker['handled']}")
+
+    async def stop(self):
+        """Дожидается обработки очередей, останавливает процессы и обслуживание записи."""
+        for updates in self.queues:
+            await asyncio.to_thread(updates.put, None)
+        for process in self._processes:
+            await asyncio.to_thread(process.join)
+        for write_requests, _ in self._write_channels:
+            write_requests.put(None)
+        for thread in self._write_threads:
+            await asyncio.to_thread(thread.join)
+        self._processes = []
+        self._write_threads = []
+        logger.info("Супервизор остановлен")
+
+
+async def _poll_updates(supervisor: Supervisor, bot: Bot, allowed_updates):
+    """Long polling в супервизоре: обновления только принимаются и распределяются."""
+    offset = None
+    while True:
+        try:
+            updates = await bot.get_updates(offset=offset, timeout=POLLING_TIMEOUT, allowed_updates=allowed_updates)
+        except Exception as e:
+            logger.error(f"Ошибка при получении обновлений: {e}")
+            await asyncio.sleep(1)
+            continue
+
+        for update in updates:
+            await supervisor.route(update)
+            offset = update.update_id + 1
+
+
+async def run_supervisor(dispatcher: Dispatcher, bot: Bot, mode="polling"):
+    """Запускает бота в режиме супервизора с BOT_PROCESSES обработчиками и работает до отмены."""
+    if mode == "webhook" and not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook необходимо задать WEBHOOK_URL в config.py")
+
+    supervisor = Supervisor()
+    supervisor.start()
+    registry.add_collector("bot_supervisor", supervisor.stats, label="worker")
+    reporter = asyncio.create_task(supervisor.report_load())
+    allowed_updates = dispatcher.resolve_used_update_types()
+    try:
+        if mode == "webhook":
+            # Один обработчик очереди сервера: распределение быстрое и сохраняет порядок
+            server = WebhookServer(supervisor, bot, workers=1)
+            await server.start()
+            await bot.set_webhook(f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                                  allowed_updates=allowed_updates)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                await server.stop()
+        else:
+            await _poll_updates(supervisor, bot, allowed_updates)
+    finally:
+        reporter.cancel()
+        await supervisor.stop()
+        await bot.session.close()
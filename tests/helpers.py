@@ -0,0 +1,63 @@
+import os
+import socket
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import work_database
+from db_connection import ConnectionManager
+from initialization_database import init_db
+
+
+def free_port():
+    """Возвращает свободный TCP-порт на 127.0.0.1."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class DatabaseTestCase(unittest.IsolatedAsyncioTestCase):
+    """
+    Тест на временной базе: схема создаётся init_db, модули слоя данных работают
+    через отдельный ConnectionManager вместо рабочего db.
+    """
+
+    # Модули, в которых подменяется db (помимо work_database)
+    patch_db_in = ()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp.name, "requests.db")
+        init_db(self.database_path)
+        self.db = ConnectionManager(self.database_path)
+        for module in (work_database, *self.patch_db_in):
+            patcher = mock.patch.object(module, "db", self.db)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        work_database.user_cache.clear()
+        work_database.user_requests_cache.clear()
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def query(self, sql, params=()):
+        """Выполняет запрос на отдельном соединении и возвращает все строки."""
+        conn = self.connect()
+        try:
+            return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def connect(self):
+        """Отдельное соединение с временной базой (для подготовки данных и проверок)."""
+        return sqlite3.connect(self.database_path, timeout=5)
+
+    def add_user(self, conn, telegram_id, role="user", fio=None):
+        """Добавляет пользователя и возвращает его ID."""
+        cursor = conn.execute(
+            "INSERT INTO users (telegram_id, fio, phone, email, role) VALUES (?, ?, ?, ?, ?)",
+            (telegram_id, fio or f"Пользователь {telegram_id}", f"+7{telegram_id}", f"u{telegram_id}@example.com",
+             role))
+        return cursor.lastrowid
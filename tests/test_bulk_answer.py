@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+import bulk_answer
+from db_connection import ConnectionManager
+from states import MainMenuStates
+from work_database import close_requests
+from tests.helpers import DatabaseTestCase
+
+
+class CloseRequestsTest(DatabaseTestCase):
+    """Массовое закрытие заявок одной транзакцией."""
+
+    def setUp(self):
+        super().setUp()
+        with self.connect() as conn:
+            self.admin_id = self.add_user(conn, 400, role="admin")
+            user_id = self.add_user(conn, 401)
+            self.request_ids = [
+                conn.execute("INSERT INTO requests (user_id, admin_id, category, description, status) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             (user_id, self.admin_id, "Вывоз ТКО", f"Заявка {number}",
+                              "closed" if number == 2 else "open")).lastrowid
+                for number in range(5)]
+
+    async def test_closes_open_requests_in_one_transaction(self):
+        already_closed = self.request_ids[2]
+        emails = {request_id: (f"u{request_id}@example.com", "Ответ", "Готово") for request_id in self.request_ids}
+
+        with mock.patch.object(ConnectionManager, "_run_batch", wraps=ConnectionManager._run_batch) as run_batch:
+            closed = await close_requests([*self.request_ids, 100500], self.admin_id, "Готово", emails)
+
+        expected = [request_id for request_id in self.request_ids if request_id != already_closed]
+        self.assertEqual(sorted(closed), expected)
+        self.assertEqual(run_batch.call_count, 1)
+        self.assertEqual(self.query("SELECT COUNT(*) FROM requests WHERE status = 'open'"), [(0,)])
+        self.assertEqual(sorted(row[0] for row in self.query("SELECT request_id FROM messages")), expected)
+        self.assertEqual(sorted(row[0] for row in self.query("SELECT recipient FROM email_outbox")),
+                         sorted(f"u{request_id}@example.com" for request_id in expected))
+        self.assertEqual(self.query("SELECT open_requests FROM admin_load WHERE admin_id = ?", (self.admin_id,)),
+                         [(0,)])
+
+    async def test_failure_closes_nothing(self):
+        # Письмо без обязательных полей — ошибка внутри единицы работы откатывает всё
+        emails = {self.request_ids[-1]: (None, None, None)}
+        self.assertIsNone(await close_requests(self.request_ids, self.admin_id, "Готово", emails))
+        self.assertEqual(self.query("SELECT COUNT(*) FROM requests WHERE status = 'open'"), [(4,)])
+        self.assertEqual(self.query("SELECT COUNT(*) FROM messages"), [(0,)])
+
+
+class BulkConfirmTest(unittest.IsolatedAsyncioTestCase):
+    """Ответ администратора на вопрос подтверждения массового ответа."""
+
+    def message(self, text):
+        message = mock.AsyncMock()
+        message.text = text
+        message.from_user.id = 400
+        return message
+
+    async def test_confirmation_is_case_insensitive(self):
+        state = mock.AsyncMock()
+        state.get_data.return_value = {"bulk_text": "Готово", "bulk_request_ids": [1]}
+        with mock.patch.object(bulk_answer, "get_admin", return_value={"id": 1}) as get_admin, \
+                mock.patch.object(bulk_answer, "select_open_requests", return_value=[]):
+            await bulk_answer.handle_bulk_confirm(self.message("да"), state)
+        get_admin.assert_awaited_once()
+
+    async def test_cancel(self):
+        state = mock.AsyncMock()
+        with mock.patch.object(bulk_answer, "get_admin") as get_admin:
+            await bulk_answer.handle_bulk_confirm(self.message("Нет"), state)
+        get_admin.assert_not_called()
+        state.set_state.assert_awaited_once_with(MainMenuStates.menu_admin)
+
+    async def test_message_without_text_asks_again(self):
+        state = mock.AsyncMock()
+        message = self.message(None)
+        with mock.patch.object(bulk_answer, "get_admin") as get_admin:
+            await bulk_answer.handle_bulk_confirm(message, state)
+        get_admin.assert_not_called()
+        state.set_state.assert_not_called()
+        message.answer.assert_awaited_once()
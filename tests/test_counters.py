@@ -0,0 +1,95 @@
+from tests.helpers import DatabaseTestCase
+
+
+class AdminLoadTest(DatabaseTestCase):
+    """Счётчики открытых заявок администраторов (admin_load) совпадают с пересчётом по заявкам."""
+
+    def assert_admin_load(self, conn):
+        expected = dict(conn.execute(
+            """SELECT u.id, COUNT(r.id)
+               FROM users u
+               LEFT JOIN requests r ON r.admin_id = u.id AND r.status = 'open'
+               WHERE u.role = 'admin'
+               GROUP BY u.id""").fetchall())
+        actual = dict(conn.execute("SELECT admin_id, open_requests FROM admin_load").fetchall())
+        self.assertEqual(actual, expected)
+
+    def test_counters_follow_requests_and_roles(self):
+        with self.connect() as conn:
+            first, second = self.add_user(conn, 500, role="admin"), self.add_user(conn, 501, role="admin")
+            user_id = self.add_user(conn, 502)
+
+            def insert(admin_id, status="open"):
+                return conn.execute("INSERT INTO requests (user_id, admin_id, category, status) VALUES (?, ?, ?, ?)",
+                                    (user_id, admin_id, "Вывоз ТКО", status)).lastrowid
+
+            ids = [insert(first) for _ in range(3)] + [insert(second) for _ in range(2)]
+            insert(None)
+            insert(first, "closed")
+            self.assert_admin_load(conn)
+
+            conn.execute("UPDATE requests SET status = 'closed' WHERE id = ?", (ids[0],))
+            self.assert_admin_load(conn)
+
+            # Переназначение открытой и закрытой заявки
+            conn.execute("UPDATE requests SET admin_id = ? WHERE id = ?", (second, ids[1]))
+            conn.execute("UPDATE requests SET admin_id = ? WHERE id = ?", (second, ids[0]))
+            self.assert_admin_load(conn)
+
+            # Закрытие с переназначением одним запросом и повторное открытие
+            conn.execute("UPDATE requests SET status = 'closed', admin_id = ? WHERE id = ?", (first, ids[3]))
+            conn.execute("UPDATE requests SET status = 'open' WHERE id = ?", (ids[0],))
+            self.assert_admin_load(conn)
+
+            conn.execute("DELETE FROM requests WHERE id IN (?, ?)", (ids[2], ids[4]))
+            self.assert_admin_load(conn)
+
+            # Понижение и повышение роли
+            conn.execute("UPDATE users SET role = 'user' WHERE id = ?", (second,))
+            self.assert_admin_load(conn)
+            conn.execute("UPDATE users SET role = 'admin' WHERE id = ?", (second,))
+            conn.execute("UPDATE users SET role = 'admin' WHERE id = ?", (user_id,))
+            self.assert_admin_load(conn)
+
+
+class RequestStatsDailyTest(DatabaseTestCase):
+    """Ежедневная статистика (request_stats_daily) совпадает с GROUP BY по заявкам."""
+
+    def assert_stats(self, conn):
+        expected = conn.execute(
+            """SELECT DATE(created_at), COALESCE(category, ''), COALESCE(status, ''), COALESCE(admin_id, 0), COUNT(*)
+               FROM requests
+               GROUP BY 1, 2, 3, 4
+               ORDER BY 1, 2, 3, 4""").fetchall()
+        actual = conn.execute(
+            """SELECT day, category, status, admin_id, requests_count
+               FROM request_stats_daily
+               WHERE requests_count != 0
+               ORDER BY 1, 2, 3, 4""").fetchall()
+        self.assertEqual(actual, expected)
+
+    def test_stats_follow_requests(self):
+        with self.connect() as conn:
+            admin_id = self.add_user(conn, 600, role="admin")
+            other_admin = self.add_user(conn, 601, role="admin")
+            user_id = self.add_user(conn, 602)
+
+            rows = [(admin_id, "Вывоз ТКО", "open", "2024-05-01 09:00:00"),
+                    (admin_id, "Вывоз ТКО", "open", "2024-05-01 23:59:59"),
+                    (None, "Начисления", "closed", "2024-05-02 00:00:00"),
+                    (other_admin, None, None, "2024-05-02 12:00:00"),
+                    (other_admin, "Вывоз ТКО", "open", "2024-05-03 08:00:00")]
+            ids = [conn.execute("INSERT INTO requests (user_id, admin_id, category, status, created_at) "
+                                "VALUES (?, ?, ?, ?, ?)", (user_id, *row)).lastrowid for row in rows]
+            self.assert_stats(conn)
+
+            conn.execute("UPDATE requests SET status = 'closed' WHERE id = ?", (ids[0],))
+            conn.execute("UPDATE requests SET admin_id = ? WHERE id = ?", (other_admin, ids[1]))
+            conn.execute("UPDATE requests SET category = 'Актуальное', status = 'open' WHERE id = ?", (ids[3],))
+            conn.execute("UPDATE requests SET admin_id = NULL, status = 'closed' WHERE id = ?", (ids[4],))
+            self.assert_stats(conn)
+
+            # Изменение описания на статистику не влияет
+            conn.execute("UPDATE requests SET description = 'Уточнение' WHERE id = ?", (ids[2],))
+            conn.execute("DELETE FROM requests WHERE id IN (?, ?)", (ids[0], ids[2]))
+            self.assert_stats(conn)
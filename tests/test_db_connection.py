@@ -0,0 +1,130 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import db_connection
+from db_connection import ConnectionManager
+
+
+def _insert(conn, value, fail=False):
+    conn.execute("INSERT INTO items (value) VALUES (?)", (value,))
+    if fail:
+        raise ValueError(value)
+    return value
+
+
+def _insert_orphan(conn, value):
+    # Нарушение отложенного внешнего ключа обнаруживается только при commit
+    conn.execute("INSERT INTO children (parent_id, value) VALUES (?, ?)", (100500, value))
+    return value
+
+
+def _enable_foreign_keys(conn):
+    conn.execute("PRAGMA foreign_keys = ON")
+
+
+class RunTransactionTest(unittest.IsolatedAsyncioTestCase):
+    """Групповой commit, точки сохранения единиц работы и откат всего пакета."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp.name, "test.db")
+        with sqlite3.connect(self.database_path) as conn:
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute("CREATE TABLE parents (id INTEGER PRIMARY KEY)")
+            conn.execute("""CREATE TABLE children (
+                                id INTEGER PRIMARY KEY, value TEXT,
+                                parent_id INTEGER REFERENCES parents (id) DEFERRABLE INITIALLY DEFERRED)""")
+        self.db = ConnectionManager(self.database_path)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def values(self, table="items"):
+        with sqlite3.connect(self.database_path) as conn:
+            return sorted(row[0] for row in conn.execute(f"SELECT value FROM {table}"))
+
+    async def test_concurrent_units_share_one_commit(self):
+        with mock.patch.object(ConnectionManager, "_run_batch", wraps=ConnectionManager._run_batch) as run_batch:
+            results = await asyncio.gather(self.db.run_transaction(_insert, "a"),
+                                           self.db.run_transaction(_insert, "b"))
+
+        self.assertEqual(results, ["a", "b"])
+        self.assertEqual(run_batch.call_count, 1)
+        self.assertEqual(len(run_batch.call_args.args[1]), 2)
+        self.assertEqual(self.values(), ["a", "b"])
+
+    async def test_failed_unit_does_not_roll_back_others(self):
+        results = await asyncio.gather(self.db.run_transaction(_insert, "a"),
+                                       self.db.run_transaction(_insert, "bad", True),
+                                       self.db.run_transaction(_insert, "c"),
+                                       return_exceptions=True)
+
+        self.assertEqual(results[0], "a")
+        self.assertIsInstance(results[1], ValueError)
+        self.assertEqual(results[2], "c")
+        self.assertEqual(self.values(), ["a", "c"])
+
+    async def test_failed_begin_fails_whole_batch(self):
+        # Другое соединение держит блокировку записи, BEGIN IMMEDIATE писателя не дождётся её
+        blocker = sqlite3.connect(self.database_path)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            with mock.patch.object(db_connection, "DB_BUSY_TIMEOUT", 0.1):
+                results = await asyncio.gather(self.db.run_transaction(_insert, "a"),
+                                               self.db.run_transaction(_insert, "b"),
+                                               return_exceptions=True)
+        finally:
+            blocker.rollback()
+            blocker.close()
+
+        self.assertTrue(all(isinstance(result, sqlite3.OperationalError) for result in results), results)
+        self.assertEqual(self.values(), [])
+
+    async def test_failed_commit_fails_whole_batch(self):
+        await self.db.run_write(_enable_foreign_keys)
+        results = await asyncio.gather(self.db.run_transaction(_insert, "a"),
+                                       self.db.run_transaction(_insert_orphan, "orphan"),
+                                       return_exceptions=True)
+
+        self.assertTrue(all(isinstance(result, sqlite3.IntegrityError) for result in results), results)
+        self.assertEqual(self.values(), [])
+        self.assertEqual(self.values("children"), [])
+
+        # После отката писатель продолжает работать
+        self.assertEqual(await self.db.run_transaction(_insert, "after"), "after")
+        self.assertEqual(self.values(), ["after"])
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+
+def _count(conn):
+    return conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+
+class ReadOnlyReadersTest(unittest.IsolatedAsyncioTestCase):
+    """Соединения пула читателей открываются с PRAGMA query_only, писатель пишет как прежде."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        database_path = os.path.join(self.tmp.name, "test.db")
+        with sqlite3.connect(database_path) as conn:
+            conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT NOT NULL)")
+        self.db = ConnectionManager(database_path, readers=1)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    async def test_write_through_reader_fails(self):
+        with self.assertRaisesRegex(sqlite3.OperationalError, "readonly"):
+            await self.db.run_read(_insert, "a")
+        self.assertEqual(await self.db.run_transaction(_insert, "b"), "b")
+        self.assertEqual(await self.db.run_read(_count), 1)
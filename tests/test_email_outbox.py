@@ -0,0 +1,126 @@
+import os
+import smtplib
+from unittest import mock
+
+import new_send_email
+from aiosmtpd.controller import Controller
+from new_send_email import EmailWorker, EMAIL_MAX_ATTEMPTS, EMAIL_RETRY_DELAY
+from work_database import enqueue_email
+from tests.helpers import DatabaseTestCase, free_port
+
+
+class RecordingHandler:
+    """Обработчик локального SMTP-сервера: сохраняет письма, отклоняет адреса из rejected."""
+
+    def __init__(self):
+        self.messages = []
+        self.rejected = set()
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address in self.rejected:
+            return "550 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        return "250 Message accepted"
+
+
+class EmailWorkerTest(DatabaseTestCase):
+    """Отправка очереди писем через локальный SMTP-сервер, повторы с задержкой."""
+
+    def setUp(self):
+        super().setUp()
+        self.handler = RecordingHandler()
+        self.port = free_port()
+        self.controller = None
+        self.start_server()
+        self.addCleanup(self.stop_server)
+        for name, value in {"SMTP_HOST": "127.0.0.1", "SMTP_PORT": self.port, "SMTP_USE_SSL": False,
+                            "FROM_PASSWORD": ""}.items():
+            patcher = mock.patch.object(new_send_email, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.worker = EmailWorker()
+
+    def start_server(self):
+        self.controller = Controller(self.handler, hostname="127.0.0.1", port=self.port)
+        self.controller.start()
+
+    def stop_server(self):
+        if self.controller is not None:
+            self.controller.stop()
+            self.controller = None
+
+    async def asyncTearDown(self):
+        await self.worker.stop()
+
+    def outbox(self):
+        return self.query("SELECT recipient, status, attempts, next_attempt_at - strftime('%s', 'now') "
+                          "FROM email_outbox ORDER BY id")
+
+    async def test_batch_delivered_over_one_connection(self):
+        attachment = os.path.join(self.tmp.name, "photo.jpg")
+        with open(attachment, "wb") as f:
+            f.write(b"jpeg")
+        for number in range(3):
+            await enqueue_email(f"user{number}@example.com", f"Заявка №{number}", "Ответ",
+                                attachment if number == 0 else None)
+
+        with mock.patch.object(new_send_email.smtplib, "SMTP", wraps=smtplib.SMTP) as smtp:
+            self.assertEqual(await self.worker.process_batch(), 3)
+            self.assertEqual(smtp.call_count, 1)
+
+        self.assertEqual([recipients for recipients, _ in self.handler.messages],
+                         [[f"user{number}@example.com"] for number in range(3)])
+        self.assertIn(b'filename="photo.jpg"', self.handler.messages[0][1])
+        self.assertEqual([row[1] for row in self.outbox()], ["sent"] * 3)
+        self.assertEqual(await self.worker.queue_depth(), 0)
+
+    async def test_rejected_recipient_backs_off(self):
+        self.handler.rejected.add("bad@example.com")
+        await enqueue_email("bad@example.com", "Заявка №1", "Ответ")
+        await enqueue_email("good@example.com", "Заявка №2", "Ответ")
+
+        self.assertEqual(await self.worker.process_batch(), 2)
+        (_, status, attempts, delay), good = self.outbox()
+        self.assertEqual((status, attempts), ("pending", 1))
+        self.assertAlmostEqual(delay, EMAIL_RETRY_DELAY, delta=2)
+        # Отказ по адресу не разрывает соединение, следующее письмо ушло по нему же
+        self.assertEqual(good[1], "sent")
+        self.assertIsNotNone(self.worker._smtp)
+
+        # Повтор ещё не наступил
+        self.assertEqual(await self.worker.process_batch(), 0)
+
+        # Задержка удваивается с каждой попыткой, после EMAIL_MAX_ATTEMPTS письмо помечается failed
+        with self.connect() as conn:
+            conn.execute("UPDATE email_outbox SET next_attempt_at = 0, attempts = 2 WHERE recipient = ?",
+                         ("bad@example.com",))
+        await self.worker.process_batch()
+        _, status, attempts, delay = self.outbox()[0]
+        self.assertEqual((status, attempts), ("pending", 3))
+        self.assertAlmostEqual(delay, EMAIL_RETRY_DELAY * 4, delta=2)
+
+        with self.connect() as conn:
+            conn.execute("UPDATE email_outbox SET next_attempt_at = 0, attempts = ? WHERE recipient = ?",
+                         (EMAIL_MAX_ATTEMPTS - 1, "bad@example.com"))
+        await self.worker.process_batch()
+        self.assertEqual(self.outbox()[0][1:3], ("failed", EMAIL_MAX_ATTEMPTS))
+        self.assertEqual(await self.worker.queue_depth(), 0)
+
+    async def test_connection_error_reconnects_on_retry(self):
+        await enqueue_email("user@example.com", "Заявка №1", "Ответ")
+        self.stop_server()
+
+        self.assertEqual(await self.worker.process_batch(), 1)
+        self.assertEqual(self.outbox()[0][1:3], ("pending", 1))
+        self.assertIsNone(self.worker._smtp)
+
+        self.start_server()
+        with self.connect() as conn:
+            conn.execute("UPDATE email_outbox SET next_attempt_at = 0")
+        self.assertEqual(await self.worker.process_batch(), 1)
+        self.assertEqual(self.outbox()[0][1], "sent")
+        self.assertEqual(len(self.handler.messages), 1)
@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from unittest import mock
+
+import fsm_storage
+from aiogram.fsm.storage.base import StorageKey
+from fsm_storage import SQLiteStorage
+from tests.helpers import DatabaseTestCase
+
+
+def key(number):
+    return StorageKey(bot_id=1, chat_id=number, user_id=number)
+
+
+class SQLiteStorageTest(DatabaseTestCase):
+    """Отложенная запись состояний FSM, вытеснение из памяти и повтор неудачной записи."""
+
+    patch_db_in = (fsm_storage,)
+
+    async def test_state_survives_close(self):
+        storage = SQLiteStorage(flush_interval=60)
+        await storage.set_state(key(1), "RequestCreationStates:enter_address")
+        await storage.set_data(key(1), {"category": "Вывоз ТКО", "media": None})
+        await storage.close()
+
+        storage = SQLiteStorage(flush_interval=60)
+        self.assertEqual(await storage.get_state(key(1)), "RequestCreationStates:enter_address")
+        self.assertEqual(await storage.get_data(key(1)), {"category": "Вывоз ТКО", "media": None})
+        await storage.close()
+
+    async def test_dirty_keys_not_evicted(self):
+        storage = SQLiteStorage(flush_interval=60, cache_size=2)
+        for number in range(5):
+            await storage.set_state(key(number), f"state{number}")
+        self.assertEqual(len(storage._records), 5)
+
+        await storage.flush()
+        self.assertEqual(len(storage._records), 2)
+        self.assertEqual(await storage.get_state(key(0)), "state0")
+        await storage.close()
+
+    async def test_flushing_keys_not_evicted(self):
+        storage = SQLiteStorage(flush_interval=60, cache_size=1)
+        await storage.set_state(key(1), "state1")
+        await storage.set_state(key(2), "state2")
+
+        started, release = threading.Event(), threading.Event()
+        save_records = fsm_storage._save_records
+
+        def slow_save(conn, records):
+            started.set()
+            release.wait(5)
+            return save_records(conn, records)
+
+        with mock.patch.object(fsm_storage, "_save_records", slow_save):
+            flush = asyncio.ensure_future(storage.flush())
+            await asyncio.to_thread(started.wait, 5)
+            # Пока идёт запись, новые ключи не вытесняют записываемые
+            for number in range(3, 6):
+                await storage.get_state(key(number))
+            self.assertIn(fsm_storage._key_to_str(key(1)), storage._records)
+            self.assertIn(fsm_storage._key_to_str(key(2)), storage._records)
+            release.set()
+            await flush
+
+        self.assertEqual(len(storage._records), 1)
+        await storage.close()
+
+    async def test_failed_flush_is_rescheduled(self):
+        storage = SQLiteStorage(flush_interval=0.05)
+        await storage.set_state(key(1), "state1")
+        storage._flush_task.cancel()
+        storage._flush_task = None
+
+        with mock.patch.object(fsm_storage, "_save_records", side_effect=RuntimeError("database is locked")):
+            await storage.flush()
+        self.assertEqual(storage._dirty, {fsm_storage._key_to_str(key(1))})
+        retry = storage._flush_task
+        self.assertIsNotNone(retry)
+
+        await retry
+        self.assertEqual(storage._dirty, set())
+        self.assertEqual(self.query("SELECT state FROM fsm_storage"), [("state1",)])
+        await storage.close()
@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+from geocoding import GeocodingService
+from tests.helpers import DatabaseTestCase
+
+
+class FakeBackend:
+    """Локальная замена геокодера: считает вызовы и может задерживать ответ до release."""
+
+    def __init__(self, block=False):
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def reverse(self, latitude, longitude):
+        self.calls.append((latitude, longitude))
+        self.started.set()
+        self.release.wait(5)
+        return f"г. Петрозаводск, {latitude:.4f}, {longitude:.4f}"
+
+
+class GeocodingServiceTest(DatabaseTestCase):
+    """Кэш адресов по округлённым координатам, объединение запросов и таймаут."""
+
+    async def test_memory_and_database_cache_by_rounded_key(self):
+        backend = FakeBackend()
+        geocoder = GeocodingService(backend=backend, precision=4)
+
+        address = await geocoder.reverse(61.785012, 34.346918)
+        # Координаты, совпадающие после округления, берутся из памяти
+        self.assertEqual(await geocoder.reverse(61.785049, 34.346940), address)
+        self.assertEqual(len(backend.calls), 1)
+
+        # Новый экземпляр (например, после перезапуска) находит адрес в БД
+        other_backend = FakeBackend()
+        other = GeocodingService(backend=other_backend, precision=4)
+        self.assertEqual(await other.reverse(61.78501, 34.34692), address)
+        self.assertEqual(other_backend.calls, [])
+        self.assertEqual(self.query("SELECT coordinates FROM geocode_cache"), [("61.7850,34.3469",)])
+
+    async def test_concurrent_calls_share_one_request(self):
+        backend = FakeBackend(block=True)
+        geocoder = GeocodingService(backend=backend)
+
+        calls = [asyncio.ensure_future(geocoder.reverse(61.7850, 34.3469)) for _ in range(5)]
+        await asyncio.to_thread(backend.started.wait, 5)
+        backend.release.set()
+        results = await asyncio.gather(*calls)
+
+        self.assertEqual(len(set(results)), 1)
+        self.assertEqual(len(backend.calls), 1)
+
+    async def test_timeout_holds_slot_until_thread_finishes(self):
+        backend = FakeBackend(block=True)
+        geocoder = GeocodingService(backend=backend, timeout=0.05, concurrency=1)
+
+        self.assertIsNone(await geocoder.reverse(61.7850, 34.3469))
+        # Поток геокодера ещё работает — слот семафора занят
+        self.assertTrue(geocoder._semaphore.locked())
+
+        second = asyncio.ensure_future(geocoder.reverse(62.0, 35.0))
+        await asyncio.sleep(0.1)
+        self.assertEqual(len(backend.calls), 1)
+
+        backend.release.set()
+        self.assertIsNotNone(await second)
+        self.assertEqual(len(backend.calls), 2)
+        self.assertFalse(geocoder._semaphore.locked())
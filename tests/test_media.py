@@ -0,0 +1,59 @@
+import os
+import time
+from unittest import mock
+
+import media_janitor
+from aiogram.types import File
+from media_janitor import MediaJanitor
+from save_media import MediaStore
+from tests.helpers import DatabaseTestCase
+
+
+class MediaStoreJanitorTest(DatabaseTestCase):
+    """Повторно использованный файл не удаляется очисткой, пока заявка с ним не подтверждена."""
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = os.path.join(self.tmp.name, "requests")
+        self.temp_root = os.path.join(self.tmp.name, "temp")
+        os.makedirs(self.temp_root)
+        self.store = MediaStore(root=self.media_root, bot=mock.Mock())
+        self.janitor = MediaJanitor(media_root=self.media_root, temp_root=self.temp_root, total_quota=None)
+        patcher = mock.patch.object(media_janitor, "JANITOR_PAUSE", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _stored_file(self, key, age):
+        """Создаёт файл хранилища с ключом key и временем изменения age секунд назад."""
+        path = self.store.path_for(key, ".jpg")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"jpeg")
+        old = time.time() - age
+        os.utime(path, (old, old))
+        return path
+
+    async def test_dedup_hit_refreshes_mtime(self):
+        path = self._stored_file("AQADreused", media_janitor.JANITOR_ORPHAN_AGE + 60)
+        file = File(file_id="id-reused", file_unique_id="AQADreused", file_size=4, file_path="photos/file_1.jpg")
+
+        self.assertEqual(await self.store.save(file), path)
+        self.assertLess(time.time() - os.path.getmtime(path), 60)
+        self.store.bot.session.stream_content.assert_not_called()
+
+        await self.janitor.run_pass()
+        self.assertTrue(os.path.exists(path))
+
+    async def test_old_orphan_removed(self):
+        orphan = self._stored_file("AQADorphan", media_janitor.JANITOR_ORPHAN_AGE + 60)
+        referenced = self._stored_file("AQADreferenced", media_janitor.JANITOR_ORPHAN_AGE + 60)
+        with self.connect() as conn:
+            user_id = self.add_user(conn, 1001)
+            request_id = conn.execute("INSERT INTO requests (user_id, category, description) VALUES (?, ?, ?)",
+                                      (user_id, "Вывоз ТКО", "Фото")).lastrowid
+            conn.execute("INSERT INTO media (request_id, file_path) VALUES (?, ?)", (request_id, referenced))
+
+        await self.janitor.run_pass()
+        self.assertFalse(os.path.exists(orphan))
+        self.assertTrue(os.path.exists(referenced))
+        self.assertEqual(self.janitor.stats()["orphans_removed"], 1)
@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import initialization_database
+import migrations
+from initialization_database import init_db
+from migrations import check_query_plans
+
+
+class CheckQueryPlansTest(unittest.TestCase):
+    """Проверка планов горячих запросов на базе, созданной init_db."""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.database_path = os.path.join(self.tmp.name, "requests.db")
+        init_db(self.database_path)
+        self.conn = sqlite3.connect(self.database_path)
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp.cleanup()
+
+    def test_plans_use_indexes(self):
+        check_query_plans(self.conn)
+
+    def test_raises_without_indexes(self):
+        # Удаляем все индексы, созданные миграциями (автоиндексы UNIQUE удалить нельзя, у них нет sql)
+        indexes = [row[0] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL")]
+        self.assertTrue(indexes)
+        for name in indexes:
+            self.conn.execute(f'DROP INDEX "{name}"')
+        self.conn.commit()
+
+        with self.assertRaises(RuntimeError):
+            check_query_plans(self.conn)
+
+    def test_index_scan_allowed_only_with_limit(self):
+        query = "SELECT telegram_id FROM users ORDER BY telegram_id"
+        with mock.patch.object(migrations, "HOT_QUERIES", {"ordered": (f"{query} LIMIT 1", ())}):
+            check_query_plans(self.conn)
+        # Обход всего индекса без LIMIT читает всю таблицу
+        with mock.patch.object(migrations, "HOT_QUERIES", {"ordered": (query, ())}):
+            with self.assertRaisesRegex(RuntimeError, "COVERING INDEX"):
+                check_query_plans(self.conn)
+
+    def test_init_db_propagates_plan_errors(self):
+        error = RuntimeError("Горячие запросы выполняются полным сканированием")
+        with mock.patch.object(initialization_database, "check_query_plans", side_effect=error):
+            with self.assertRaises(RuntimeError):
+                init_db(self.database_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import work_database
+from work_database import get_open_requests_page, get_user_requests_page, submit_request, close_requests
+from tests.helpers import DatabaseTestCase
+
+CREATED_AT = "2024-05-01 10:00:00"  # Одинаковое время создания у всех заявок
+
+
+class PaginationTest(DatabaseTestCase):
+    """Keyset-пагинация очереди открытых заявок и истории заявок пользователя."""
+
+    def setUp(self):
+        super().setUp()
+        with self.connect() as conn:
+            self.admins = [self.add_user(conn, 100 + number, role="admin") for number in range(3)]
+            self.user_id = self.add_user(conn, 200)
+            other_user = self.add_user(conn, 201)
+            rows = []
+            for number in range(47):
+                # Заявки без администратора, вперемешку с назначенными, часть закрыта
+                admin_id = None if number % 4 == 0 else self.admins[number % 3]
+                status = "closed" if number % 5 == 0 else "open"
+                user_id = self.user_id if number % 2 else other_user
+                rows.append((user_id, admin_id, "Вывоз ТКО", f"ул. Ленина, д. {number}", "Описание", status,
+                             CREATED_AT))
+            conn.executemany(
+                """INSERT INTO requests (user_id, admin_id, category, address, description, status, created_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""", rows)
+
+    async def _page_through_queue(self, limit, admin_id=None):
+        seen, after = [], None
+        while True:
+            requests, has_next = await get_open_requests_page(after=after, limit=limit, admin_id=admin_id)
+            seen.extend(request["request_id"] for request in requests)
+            if not has_next:
+                return seen
+            after = (requests[-1]["admin_id"], requests[-1]["request_id"])
+
+    async def test_open_queue_has_no_gaps_or_repeats(self):
+        expected = [row[0] for row in self.query(
+            "SELECT id FROM requests WHERE status = 'open' ORDER BY admin_id IS NOT NULL, admin_id, id")]
+        self.assertTrue(any(row[0] is None for row in self.query("SELECT admin_id FROM requests")))
+
+        for limit in (1, 3, 5, 50):
+            self.assertEqual(await self._page_through_queue(limit), expected, limit)
+
+    async def test_admin_queue_has_no_gaps_or_repeats(self):
+        admin_id = self.admins[1]
+        expected = [row[0] for row in self.query(
+            "SELECT id FROM requests WHERE status = 'open' AND admin_id = ? ORDER BY id", (admin_id,))]
+        self.assertEqual(await self._page_through_queue(4, admin_id), expected)
+
+    async def test_user_history_pages_both_ways(self):
+        expected = [row[0] for row in self.query(
+            "SELECT id FROM requests WHERE user_id = ? ORDER BY id DESC", (self.user_id,))]
+
+        pages, before = [], None
+        while True:
+            requests, has_older, has_newer = await get_user_requests_page(self.user_id, before=before, limit=5)
+            self.assertEqual(has_newer, before is not None)
+            pages.append([request["request_id"] for request in requests])
+            if not has_older:
+                break
+            before = requests[-1]["request_id"]
+        self.assertEqual([request_id for page in pages for request_id in page], expected)
+
+        # Назад от последней страницы к первой — те же страницы в обратном порядке
+        for page, newer_page in zip(reversed(pages), list(reversed(pages))[1:]):
+            requests, _, _ = await get_user_requests_page(self.user_id, after=page[0], limit=5)
+            self.assertEqual([request["request_id"] for request in requests], newer_page)
+
+    async def test_history_cache_invalidated(self):
+        requests, _, _ = await get_user_requests_page(self.user_id, limit=5)
+        self.assertIsNot(work_database.user_requests_cache.get(self.user_id), work_database.MISSING)
+
+        submitted = await submit_request(self.user_id, {"category": "Вывоз ТКО", "address": "ул. Мира, д. 1",
+                                                        "description": "Новая заявка", "status": "open"})
+        self.assertIsNotNone(submitted)
+        requests, _, _ = await get_user_requests_page(self.user_id, limit=5)
+        self.assertEqual(requests[0]["request_id"], submitted[0])
+        self.assertEqual(requests[0]["status"], "open")
+
+        self.assertEqual(await close_requests([submitted[0]], self.admins[0], "Готово"), [submitted[0]])
+        requests, _, _ = await get_user_requests_page(self.user_id, limit=5)
+        self.assertEqual(requests[0]["status"], "closed")
@@ -0,0 +1,77 @@
+import unittest
+
+from migrations import _backfill_requests_fts
+from work_database import search_requests, search_terms
+from tests.helpers import DatabaseTestCase
+
+
+class SearchTermsTest(unittest.TestCase):
+    """Отбрасывание окончаний в словах поиска."""
+
+    def test_endings(self):
+        self.assertEqual(search_terms("особенную"), ["особенн"])
+        self.assertEqual(search_terms("двора"), ["двор"])
+        self.assertEqual(search_terms("ул Мира д 5"), ["ул", "мира", "5"])
+        self.assertEqual(search_terms("Ленина, 15А"), ["лени", "15а"])
+
+
+class SearchRequestsTest(DatabaseTestCase):
+    """Полнотекстовый индекс заявок: триггеры, заполнение при миграции и ранжирование."""
+
+    def setUp(self):
+        super().setUp()
+        with self.connect() as conn:
+            self.user_id = self.add_user(conn, 300)
+
+    def insert(self, conn, address, description):
+        return conn.execute("INSERT INTO requests (user_id, category, address, description) VALUES (?, ?, ?, ?)",
+                            (self.user_id, "Вывоз ТКО", address, description)).lastrowid
+
+    async def found(self, text, **kwargs):
+        requests, _ = await search_requests(text, limit=50, **kwargs)
+        return [request["request_id"] for request in requests]
+
+    async def test_triggers_follow_insert_update_delete(self):
+        with self.connect() as conn:
+            request_id = self.insert(conn, "ул. Ленина, д. 5", "Переполнен контейнер")
+        self.assertEqual(await self.found("контейнер"), [request_id])
+        self.assertEqual(await self.found("Ленина 5"), [request_id])
+
+        with self.connect() as conn:
+            conn.execute("UPDATE requests SET description = ?, address = ? WHERE id = ?",
+                         ("Не вывезен мусор", "ул. Мира, д. 7", request_id))
+        self.assertEqual(await self.found("контейнер"), [])
+        self.assertEqual(await self.found("Ленина"), [])
+        self.assertEqual(await self.found("мусор Мира"), [request_id])
+
+        with self.connect() as conn:
+            conn.execute("DELETE FROM requests WHERE id = ?", (request_id,))
+        self.assertEqual(await self.found("мусор"), [])
+
+    async def test_backfill_indexes_existing_requests(self):
+        with self.connect() as conn:
+            ids = [self.insert(conn, f"ул. Ленина, д. {number}", "Контейнер") for number in range(7)]
+            # Индекс как до миграции: заявки есть, записей в индексе нет
+            conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('delete-all')")
+        self.assertEqual(await self.found("контейнер"), [])
+
+        with self.connect() as conn:
+            _backfill_requests_fts(conn, batch_size=3)
+            conn.execute("INSERT INTO requests_fts (requests_fts) VALUES ('integrity-check')")
+        self.assertEqual(sorted(await self.found("контейнер")), ids)
+
+    async def test_bm25_order_within_window(self):
+        with self.connect() as conn:
+            old_address_match = self.insert(conn, "ул. Ленина, д. 1", "Контейнер")
+            description_matches = [self.insert(conn, "ул. Мира, д. 2", "Контейнер у дома по улице Ленина сломан, "
+                                                                        "крышка не закрывается уже неделю")
+                                   for _ in range(3)]
+            address_match = self.insert(conn, "ул. Ленина, д. 3", "Контейнер")
+
+        # Совпадение в адресе весит больше, при равном счёте новые заявки идут первыми
+        self.assertEqual(await self.found("Ленина"),
+                         [address_match, old_address_match, *reversed(description_matches)])
+
+        # Ранжируются только max_matches самых новых совпадений
+        self.assertEqual(await self.found("Ленина", max_matches=3),
+                         [address_match, *reversed(description_matches[1:])])
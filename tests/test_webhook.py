@@ -0,0 +1,124 @@
+import asyncio
+import time
+import unittest
+
+from aiohttp import ClientSession
+from aiogram import Bot, Dispatcher
+
+from webhook import WebhookServer
+from tests.helpers import free_port
+
+SECRET = "test-secret"
+
+
+def make_update(update_id, chat_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+            "text": str(update_id),
+        },
+    }
+
+
+class WebhookServerTest(unittest.IsolatedAsyncioTestCase):
+    """Приём обновлений webhook-сервером на свободном порту."""
+
+    async def asyncSetUp(self):
+        self.dp = Dispatcher()
+        self.bot = Bot(token="123456:TEST")
+        self.handled = []
+        self.server = None
+
+    async def asyncTearDown(self):
+        if self.server is not None:
+            await self.server.stop()
+        await self.bot.session.close()
+
+    async def start(self, **kwargs):
+        port = free_port()
+        self.server = WebhookServer(self.dp, self.bot, secret=SECRET, **kwargs)
+        await self.server.start("127.0.0.1", port)
+        self.url = f"http://127.0.0.1:{port}{self.server.path}"
+
+    async def post(self, session, update, secret=SECRET):
+        async with session.post(self.url, json=update,
+                                headers={"X-Telegram-Bot-Api-Secret-Token": secret}) as response:
+            return response.status
+
+    async def test_update_accepted_and_handled(self):
+        done = asyncio.Event()
+
+        @self.dp.message()
+        async def handle(message):
+            self.handled.append(message.message_id)
+            done.set()
+
+        await self.start()
+        async with ClientSession() as session:
+            self.assertEqual(await self.post(session, make_update(1, 10)), 200)
+        await asyncio.wait_for(done.wait(), 5)
+        self.assertEqual(self.handled, [1])
+
+    async def test_wrong_secret_rejected(self):
+        @self.dp.message()
+        async def handle(message):
+            self.handled.append(message.message_id)
+
+        await self.start()
+        async with ClientSession() as session:
+            self.assertEqual(await self.post(session, make_update(1, 10), secret="wrong"), 403)
+            self.assertEqual(await self.post(session, make_update(2, 10), secret=""), 403)
+        await self.server.stop()
+        self.server = None
+        self.assertEqual(self.handled, [])
+
+    async def test_full_queue_returns_503(self):
+        """Единственный обработчик занят, его очередь на одно обновление заполнена — следующее отклоняется."""
+        started, release = asyncio.Event(), asyncio.Event()
+
+        @self.dp.message()
+        async def handle(message):
+            started.set()
+            await release.wait()
+            self.handled.append(message.message_id)
+
+        await self.start(workers=1, queue_size=1)
+        async with ClientSession() as session:
+            self.assertEqual(await self.post(session, make_update(1, 10)), 200)
+            await asyncio.wait_for(started.wait(), 5)
+            self.assertEqual(await self.post(session, make_update(2, 10)), 200)
+            self.assertEqual(await self.post(session, make_update(3, 10)), 503)
+        release.set()
+        await self.server.stop()
+        self.server = None
+        self.assertEqual(self.handled, [1, 2])
+
+    async def test_updates_of_one_chat_handled_in_order(self):
+        """Обновления разных чатов обрабатываются параллельно, одного чата — в порядке поступления."""
+        by_chat = {}
+
+        @self.dp.message()
+        async def handle(message):
+            # Разная длительность обработки перемешивает чаты между обработчиками
+            await asyncio.sleep(0.001 * (message.message_id % 3))
+            by_chat.setdefault(message.chat.id, []).append(message.message_id)
+
+        await self.start(workers=4, queue_size=1000)
+        chats, per_chat = 8, 20
+
+        async def send_chat(session, chat_id):
+            for i in range(per_chat):
+                self.assertEqual(await self.post(session, make_update(chat_id * 1000 + i, chat_id)), 200)
+
+        async with ClientSession() as session:
+            await asyncio.gather(*(send_chat(session, chat_id) for chat_id in range(1, chats + 1)))
+        await self.server.stop()
+        self.server = None
+
+        self.assertEqual(len(by_chat), chats)
+        for chat_id, ids in by_chat.items():
+            self.assertEqual(ids, [chat_id * 1000 + i for i in range(per_chat)])
@@ -0,0 +1,77 @@
+import html
+import logging
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.fsm.context import FSMContext
+
+from admin_requests import REQUESTS_PAGE_SIZE, DESCRIPTION_PREVIEW, STATUS_TITLES
+from keyboards import history_page_keyboard
+from work_database import get_user_data, get_user_requests_page
+
+
+logger = logging.getLogger(__name__)
+
+
+def format_history_page(requests):
+    """Формирует текст страницы истории заявок пользователя"""
+    if not requests:
+        return "<b>Мои заявки</b>\nВы ещё не подавали заявок."
+
+    lines = ["<b>Мои заявки</b>"]
+    for request in requests:
+        description = request["description"] or "—"
+        if len(description) > DESCRIPTION_PREVIEW:
+            description = description[:DESCRIPTION_PREVIEW] + "…"
+        status = STATUS_TITLES.get(request["status"], request["status"] or "—")
+        lines.append(
+            f"\n<b>№{request['request_id']}</b> · {status}\n"
+            f"{html.escape(request['category'] or '—')} · {request['created_at']}\n"
+            f"Адрес: {html.escape(request['address'] or '—')}\n"
+            f"{html.escape(description)}"
+        )
+    return "\n".join(lines)
+
+
+async def _render_page(user_id, before=None, after=None):
+    """Возвращает текст и клавиатуру страницы истории заявок."""
+    requests, has_older, has_newer = await get_user_requests_page(user_id, before=before, after=after,
+                                                                  limit=REQUESTS_PAGE_SIZE)
+    markup = None
+    if requests:
+        markup = history_page_keyboard(requests[0]["request_id"], requests[-1]["request_id"],
+                                       has_newer=has_newer, has_older=has_older)
+    return format_history_page(requests), markup
+
+
+async def handle_my_requests(message: types.Message, state: FSMContext):
+    """Обработчик для кнопки '📋 Мои заявки': последние заявки пользователя и их статусы"""
+    user_data = await get_user_data(message.from_user.id)
+    if not user_data:
+        await message.answer("Вы не зарегистрированы. Отправьте /start, чтобы начать.")
+        return
+
+    logger.info("Пользователь %s открыл историю заявок.", message.from_user.id)
+
+    text, markup = await _render_page(user_data["id"])
+    await message.answer(text, parse_mode="html", reply_markup=markup)
+
+
+async def handle_history_page(query: types.CallbackQuery):
+    """Обработчик кнопок перехода по истории заявок (callback_data вида history:<before|after>:<ID заявки>)"""
+    user_data = await get_user_data(query.from_user.id)
+    if not user_data:
+        await query.answer("Вы не зарегистрированы.", show_alert=True)
+        return
+
+    _, direction, request_id = query.data.split(":")
+    if direction == "before":
+        text, markup = await _render_page(user_data["id"], before=int(request_id))
+    else:
+        text, markup = await _render_page(user_data["id"], after=int(request_id))
+
+    try:
+        await query.message.edit_text(text, parse_mode="html", reply_markup=markup)
+    except TelegramBadRequest as e:
+        logger.debug("Страница истории заявок не обновлена: %s", e)
+    await query.answer()
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import secrets
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+import config
+
+
+logger = logging.getLogger(__name__)
+
+# Необязательные настройки из config.py
+WEBHOOK_URL = getattr(config, "WEBHOOK_URL", None)  # Публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = getattr(config, "WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = getattr(config, "WEBHOOK_SECRET", None)  # Секрет для заголовка X-Telegram-Bot-Api-Secret-Token
+WEBHOOK_HOST = getattr(config, "WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = getattr(config, "WEBHOOK_PORT", 8080)
+WEBHOOK_WORKERS = getattr(config, "WEBHOOK_WORKERS", 4)  # Количество обработчиков очереди
+WEBHOOK_QUEUE_SIZE = getattr(config, "WEBHOOK_QUEUE_SIZE", 1000)  # Общий размер очередей обработчиков
+
+
+def get_update_chat_id(update: Update):
+    """Возвращает ID чата (или пользователя), к которому относится обновление."""
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class WebhookServer:
+    """
+    Приём обновлений Telegram через webhook.
+    Обновления раскладываются по ограниченным очередям обработчиков по ID чата,
+    поэтому сообщения одного пользователя обрабатываются строго по порядку.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret=WEBHOOK_SECRET, path=WEBHOOK_PATH,
+                 workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret = secret
+        self.path = path
+        self.queues = [asyncio.Queue(maxsize=max(queue_size // workers, 1)) for _ in range(workers)]
+        self.handled = [0] * workers
+        self._workers = []
+        self._runner = None
+
+    def create_app(self):
+        """Создаёт aiohttp-приложение с обработчиком webhook."""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request: web.Request):
+        """Проверяет секрет и ставит обновление в очередь обработчика его чата."""
+        if self.secret and not secrets.compare_digest(
+                request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), self.secret):
+            logger.warning(f"Запрос к webhook с неверным секретом от {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.error(f"Некорректное обновление в webhook: {e}")
+            return web.Response(status=400)
+
+        queue = self.queues[hash(get_update_chat_id(update)) % len(self.queues)]
+        try:
+            queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram повторит доставку позже
+            logger.warning(f"Очередь обработки переполнена, обновление {update.update_id} отклонено")
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def _worker(self, index):
+        queue = self.queues[index]
+        while True:
+            update = await queue.get()
+            try:
+                await self.dispatcher.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.update_id}: {e}")
+            finally:
+                self.handled[index] += 1
+                queue.task_done()
+
+    def stats(self):
+        """Возвращает глубину очередей и количество обработанных обновлений по обработчикам."""
+        return [{"worker": i, "queue_depth": queue.qsize(), "handled": self.handled[i]}
+                for i, queue in enumerate(self.queues)]
+
+    async def start(self, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        """Запускает обработчики очередей и HTTP-сервер."""
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(len(self.queues))]
+        self._runner = web.AppRunner(self.create_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook-сервер запущен на {host}:{port}{self.path}, обработчиков: {len(self.queues)}")
+
+    async def stop(self):
+        """Останавливает приём, дожидается обработки очередей и завершает обработчики."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        for queue in self.queues:
+            await queue.join()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Webhook-сервер остановлен")
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot):
+    """Запускает бота в режиме webhook и работает до отмены."""
+    if not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook необходимо задать WEBHOOK_URL в config.py")
+
+    server = WebhookServer(dispatcher, bot)
+    await dispatcher.emit_startup(bot=bot, dispatcher=dispatcher, bots=(bot,), **dispatcher.workflow_data)
+    await server.start()
+    await bot.set_webhook(f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET,
+                          allowed_updates=dispatcher.resolve_used_update_types())
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+        await dispatcher.emit_shutdown(bot=bot, dispatcher=dispatcher, bots=(bot,), **dispatcher.workflow_data)
+        await bot.session.close()
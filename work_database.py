@@ -1,36 +1,120 @@
-import sqlite3
 import logging
+import re
+import sys
+import time
 
-from config import *
+import config
+from cache import TTLCache, MISSING
+from db_connection import db
+from metrics import DB_QUERY_SECONDS
 
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(filename)s - %(message)s')
 logger = logging.getLogger(__name__)
-
-
-def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False):
+query_logger = logging.getLogger(f"{__name__}.queries")  # Частые сообщения о запросах, см. LOG_SAMPLING
+
+# Кэш профилей пользователей по telegram_id (None — пользователь не зарегистрирован)
+user_cache = TTLCache(maxsize=getattr(config, "USER_CACHE_SIZE", 1024), ttl=getattr(config, "USER_CACHE_TTL", 300))
+# Страницы истории заявок по ID пользователя: {(before, after): страница}.
+# Сбрасываются при подаче и закрытии заявки; в другом процессе BOT_PROCESSES устаревают не дольше TTL
+user_requests_cache = TTLCache(maxsize=getattr(config, "USER_CACHE_SIZE", 1024),
+                               ttl=getattr(config, "USER_REQUESTS_CACHE_TTL", 60))
+
+USER_COLUMNS = "id, username, telegram_id, fio, phone, email, role"
+
+# Запросы горячих путей. Вынесены в константы, чтобы migrations.check_query_plans проверял планы
+# именно тех запросов, которые выполняет бот.
+REQUEST_DETAILS_QUERY = """
+    SELECT 
+        u.id AS user_id, u.username, u.telegram_id, u.fio AS user_fio, u.phone AS user_phone, 
+        u.email AS user_email, u.role,
+        r.id AS request_id, r.category, r.address, r.description, r.status, r.created_at,
+        media.id AS media_id, media.file_path, media.created_at AS media_created_at,
+        media.file_id, media.file_unique_id, media.mime_type, media.file_size
+    FROM requests r
+    JOIN users u ON r.user_id = u.id
+    LEFT JOIN media ON media.request_id = r.id
+    WHERE r.id = ?
+"""
+
+AVAILABLE_ADMIN_QUERY = """
+    SELECT l.admin_id, u.telegram_id 
+    FROM admin_load l 
+    JOIN users u ON u.id = l.admin_id 
+    ORDER BY l.open_requests ASC, l.last_assigned_at ASC 
+    LIMIT 1
+"""
+
+ADMINS_QUERY = "SELECT telegram_id FROM users WHERE role = 'admin'"
+
+USER_DATA_QUERY = f"SELECT {USER_COLUMNS} FROM users WHERE telegram_id = ?"
+
+# Выгрузка заявок в Excel (export_requests), {filter_condition} — условие отбора
+EXPORT_REQUESTS_QUERY = """
+    SELECT r.id, u.fio, u.phone, u.email, r.category, r.address, r.description,
+           r.status, r.created_at, a.fio AS admin_fio
+    FROM requests r
+    JOIN users u ON r.user_id = u.id
+    LEFT JOIN users a ON r.admin_id = a.id
+    WHERE {filter_condition}
+"""
+
+# Страница очереди открытых заявок, {conditions} — условия из open_requests_page_query
+OPEN_REQUESTS_PAGE_QUERY = """
+    SELECT r.id, r.admin_id, r.category, r.address, r.description, r.created_at, u.fio, a.fio
+    FROM requests r
+    JOIN users u ON u.id = r.user_id
+    LEFT JOIN users a ON a.id = r.admin_id
+    WHERE {conditions}
+    ORDER BY r.admin_id, r.id
+    LIMIT ?
+"""
+
+USER_REQUESTS_OLDER_QUERY = """
+    SELECT id, category, address, description, status, created_at 
+    FROM requests 
+    WHERE user_id = ? AND id < COALESCE(?, 9223372036854775807) 
+    ORDER BY id DESC 
+    LIMIT ?
+"""
+
+USER_REQUESTS_NEWER_QUERY = """
+    SELECT id, category, address, description, status, created_at 
+    FROM requests 
+    WHERE user_id = ? AND id > ? 
+    ORDER BY id ASC 
+    LIMIT ?
+"""
+
+# {placeholders} — по одному «?» на путь, параметры передаются дважды
+REFERENCED_MEDIA_QUERY = """
+    SELECT file_path FROM media WHERE file_path IN ({placeholders}) 
+    UNION 
+    SELECT attachment_path FROM email_outbox 
+    WHERE status = 'pending' AND attachment_path IN ({placeholders})
+"""
+
+REQUEST_STATS_QUERY = """
+    SELECT s.category, s.status, s.admin_id, a.fio, SUM(s.requests_count) 
+    FROM request_stats_daily s 
+    LEFT JOIN users a ON a.id = s.admin_id 
+    WHERE s.day >= DATE('now', '+3 hours', ?) 
+    GROUP BY s.category, s.status, s.admin_id
+"""
+
+
+def _execute(conn, query, params, fetchone, fetchall, commit):
     """
-    Выполняет SQL-запрос к базе данных.
+    Выполняет SQL-запрос на переданном соединении.
     """
     result = None
     last_row_id = None
 
-    # Используем контекстный менеджер для открытия и закрытия соединения с базой данных
-    with sqlite3.connect(DATABASE_PATH) as conn:
-        cursor = conn.cursor()
-
-        try:
-            cursor.execute(query, params)
-            if commit:
-                conn.commit()  # Применяем изменения в базе
-                logger.info(f"Запрос выполнен")
-            else:
-                logger.info(f"Запрос выполнен (без commit)")
-        except Exception as e:
-            logger.error(f"Ошибка выполнения запроса: {e}")
-            conn.rollback()  # Отменяем изменения в случае ошибки
-            return None
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(query, params)
 
+        # Результат читаем до commit, чтобы поддержать INSERT/UPDATE ... RETURNING
         if fetchone:
             result = cursor.fetchone()
         elif fetchall:
@@ -38,33 +122,45 @@ def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False):
 
         if commit:
             last_row_id = cursor.lastrowid
+            conn.commit()  # Применяем изменения в базе
+    except Exception as e:
+        logger.error("Ошибка выполнения запроса: %s", e)
+        conn.rollback()  # Отменяем изменения в случае ошибки
+        return None
+    finally:
+        cursor.close()
 
-    # Контекстный менеджер автоматически закроет соединение по выходу из блока
-    return result if not commit else last_row_id
+    return result if not commit or fetchone or fetchall else last_row_id
 
 
-def get_request_details(request_id):
+async def execute_db(query, params=(), fetchone=False, fetchall=False, commit=False, name=None):
     """
-    Получает детали заявки по её ID.
+    Выполняет SQL-запрос к базе данных.
+    Запросы с commit уходят единственному писателю, остальные — в пул читателей.
+    С commit возвращает ID последней вставленной строки, если не запрошены fetchone/fetchall.
+    Время запроса попадает в метрику bot_db_query_seconds с меткой name (по умолчанию — имя вызывающей функции).
     """
-    logger.info(f"Получение данных по заявке с ID {request_id}")
+    name = name or sys._getframe(1).f_code.co_name
+    run = db.run_write if commit else db.run_read
+    started = time.perf_counter()
+    try:
+        return await run(_execute, query, params, fetchone, fetchall, commit)
+    finally:
+        elapsed = time.perf_counter() - started
+        DB_QUERY_SECONDS.observe(elapsed, name)
+        query_logger.info("Запрос %s выполнен за %.2f мс", name, elapsed * 1000)
 
-    query = '''
-        SELECT 
-            u.id AS user_id, u.username, u.telegram_id, u.fio AS user_fio, u.phone AS user_phone, 
-            u.email AS user_email, u.role,
-            r.id AS request_id, r.category, r.address, r.description, r.status, r.created_at,
-            media.id AS media_id, media.file_path, media.created_at AS media_created_at
-        FROM requests r
-        JOIN users u ON r.user_id = u.id
-        LEFT JOIN media ON media.request_id = r.id
-        WHERE r.id = ?
-    '''
 
-    result = execute_db(query, (request_id,), fetchall=True)
+async def get_request_details(request_id):
+    """
+    Получает детали заявки по её ID.
+    """
+    logger.debug("Получение данных по заявке с ID %s", request_id)
+
+    result = await execute_db(REQUEST_DETAILS_QUERY, (request_id,), fetchall=True)
 
     if not result:
-        logger.warning(f"Заявка с ID {request_id} не найдена.")
+        logger.warning("Заявка с ID %s не найдена.", request_id)
         return None
 
     # Формируем структуру данных
@@ -88,165 +184,621 @@ def get_request_details(request_id):
     }
 
     for row in result:
-        media_id, file_path, media_created_at = row[13:16]
+        media_id, file_path, media_created_at, file_id, file_unique_id, mime_type, file_size = row[13:20]
 
         if media_id:
             request_info["media"].append({
                 "media_id": media_id,
                 "file_path": file_path,
-                "created_at": media_created_at
+                "created_at": media_created_at,
+                "file_id": file_id,
+                "file_unique_id": file_unique_id,
+                "mime_type": mime_type,
+                "file_size": file_size
             })
 
-    logger.info(f"Данные по заявке с ID {request_id} получены.")
+    logger.debug("Данные по заявке с ID %s получены.", request_id)
     return request_info
 
 
-def get_available_admin_id():
+async def get_available_admin_id():
     """
     Получает администратора с наименьшим количеством открытых заявок.
+    Счётчики в admin_load поддерживаются триггерами, поэтому выбор не зависит от размера истории заявок.
     """
-    logger.info("Получение доступного администратора.")
+    logger.debug("Получение доступного администратора.")
 
-    query = """
-    SELECT u.id, u.telegram_id 
-    FROM users u 
-    LEFT JOIN requests r ON u.id = r.admin_id AND r.status = 'open' 
-    WHERE u.role = 'admin'
-    GROUP BY u.id 
-    ORDER BY COUNT(r.id) ASC, COALESCE(MAX(r.created_at), '1970-01-01') ASC 
-    LIMIT 1;
-    """
-    admin_id = execute_db(query, fetchone=True)
+    admin_id = await execute_db(AVAILABLE_ADMIN_QUERY, fetchone=True)
 
     if admin_id:
-        logger.info(f"Найден доступный администратор: {admin_id[0]}")
+        logger.debug("Найден доступный администратор: %s", admin_id[0])
         return admin_id[0], admin_id[1]
     else:
         logger.warning("Доступных администраторов не найдено.")
         return None
 
 
-def get_admins():
+async def get_admins():
     """
     Возвращает список Telegram ID администраторов.
     """
-    logger.info("Получение списка администраторов.")
+    logger.debug("Получение списка администраторов.")
 
-    admins = execute_db("SELECT telegram_id FROM users WHERE role = 'admin'", fetchall=True)
+    admins = await execute_db(ADMINS_QUERY, fetchall=True)
 
     if admins:
-        logger.info(f"Найдено {len(admins)} администраторов.")
+        logger.debug("Найдено %s администраторов.", len(admins))
     else:
         logger.warning("Администраторы не найдены.")
 
     return [admin[0] for admin in admins] if admins else []
 
 
-def user_exists(telegram_id):
+async def user_exists(telegram_id):
     """
     Проверяет, существует ли пользователь в БД.
     """
-    logger.info(f"Проверка существования пользователя с Telegram ID {telegram_id}.")
-
-    exists = execute_db("SELECT id FROM users WHERE telegram_id = ?", (telegram_id,), fetchone=True)
+    logger.debug("Проверка существования пользователя с Telegram ID %s.", telegram_id)
 
-    if exists:
-        logger.info(f"Пользователь найден: {telegram_id}")
+    # Профиль читается через кэш, следующий за проверкой get_user_data не обращается к БД
+    if await get_user_data(telegram_id):
+        logger.debug("Пользователь найден: %s", telegram_id)
         return True
     else:
-        logger.warning(f"Пользователь не найден: {telegram_id}")
+        logger.warning("Пользователь не найден: %s", telegram_id)
         return False
 
 
-def get_user_data(telegram_id):
+def _user_row_to_dict(data):
+    """Преобразует строку таблицы users в словарь профиля."""
+    return {
+        "id": data[0],
+        "username": data[1],
+        "telegram_id": data[2],
+        "fio": data[3],
+        "phone": data[4],
+        "email": data[5],
+        "role": data[6]
+    }
+
+
+async def get_user_data(telegram_id):
     """
     Получает данные пользователя по его Telegram ID.
+    Результат (в том числе отсутствие пользователя) кэшируется до изменения профиля.
     """
-    logger.info(f"Получение данных пользователя с Telegram ID {telegram_id}.")
+    logger.debug("Получение данных пользователя с Telegram ID %s.", telegram_id)
+
+    cached = user_cache.get(telegram_id)
+    if cached is not MISSING:
+        return dict(cached) if cached else None
 
-    data = execute_db("SELECT id, username, telegram_id, fio, phone, email, role FROM users WHERE telegram_id = ?",
-                      (telegram_id,), fetchone=True)
+    data = await execute_db(USER_DATA_QUERY, (telegram_id,), fetchone=True)
 
     if data:
-        logger.info(f"Данные пользователя {telegram_id} получены.")
-        return {
-            "id": data[0],
-            "username": data[1],
-            "telegram_id": data[2],
-            "fio": data[3],
-            "phone": data[4],
-            "email": data[5],
-            "role": data[6]
-        }
-
-    logger.warning(f"Пользователь с Telegram ID {telegram_id} не найден.")
+        logger.debug("Данные пользователя %s получены.", telegram_id)
+        user_data = _user_row_to_dict(data)
+        user_cache.set(telegram_id, user_data)
+        return dict(user_data)
+
+    logger.warning("Пользователь с Telegram ID %s не найден.", telegram_id)
+    user_cache.set(telegram_id, None)
     return None
 
 
-def save_user_data(telegram_id, user_data, username):
+async def save_user_data(telegram_id, user_data, username):
     """
     Сохраняет или обновляет данные пользователя в БД.
+    Сохранённый профиль сразу записывается в кэш.
     """
-    logger.info(f"Сохранение данных пользователя с Telegram ID {telegram_id}.")
+    logger.debug("Сохранение данных пользователя с Telegram ID %s.", telegram_id)
 
     try:
-        execute_db(
-            """INSERT INTO users (telegram_id, fio, phone, email, username, role) 
+        data = await execute_db(
+            f"""INSERT INTO users (telegram_id, fio, phone, email, username, role) 
                VALUES (?, ?, ?, ?, ?, ?) 
                ON CONFLICT(telegram_id) 
-               DO UPDATE SET fio=excluded.fio, phone=excluded.phone, email=excluded.email, role=excluded.role""",
+               DO UPDATE SET fio=excluded.fio, phone=excluded.phone, email=excluded.email, role=excluded.role
+               RETURNING {USER_COLUMNS}""",
             (telegram_id, user_data["fio"], user_data["phone"], user_data["email"], username, user_data['role']),
-            commit=True
+            fetchone=True, commit=True
         )
-        logger.info(f"Данные пользователя {telegram_id} сохранены.")
+        if data:
+            user_cache.set(telegram_id, _user_row_to_dict(data))
+            logger.info("Данные пользователя %s сохранены.", telegram_id)
+        else:
+            user_cache.invalidate(telegram_id)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении данных пользователя {telegram_id}: {e}")
+        user_cache.invalidate(telegram_id)
+        logger.error("Ошибка при сохранении данных пользователя %s: %s", telegram_id, e)
 
 
-def save_request_data(user_id, request_data, admin_id):
+async def save_request_data(user_id, request_data, admin_id):
     """
     Сохраняет данные заявки в БД.
     """
-    logger.info(f"Сохранение данных заявки пользователя с ID {user_id}.")
+    logger.debug("Сохранение данных заявки пользователя с ID %s.", user_id)
 
     try:
-        last_row_id = execute_db(
+        last_row_id = await execute_db(
             """INSERT INTO requests (user_id, admin_id, category, address, description, status) 
                VALUES (?, ?, ?, ?, ?, ?)""",
             (user_id, admin_id, request_data["category"], request_data.get("address", "-"),
              request_data["description"], request_data['status']), commit=True)
-        logger.info(f"Заявка пользователя с ID {user_id} сохранена, ID заявки: {last_row_id}.")
+        user_requests_cache.invalidate(user_id)
+        logger.info("Заявка пользователя с ID %s сохранена, ID заявки: %s.", user_id, last_row_id)
         return last_row_id
     except Exception as e:
-        logger.error(f"Ошибка при сохранении заявки пользователя с ID {user_id}: {e}")
+        logger.error("Ошибка при сохранении заявки пользователя с ID %s: %s", user_id, e)
         return None
 
 
-def update_request_status_to_closed(request_id):
+def _submit_request(conn, user_id, request_data, media_files):
     """
-    Обновляет статус заявки на 'закрыта'.
+    Единица работы подачи заявки: выбор администратора, вставка заявки и медиафайлов.
+    Выполняется внутри транзакции писателя.
     """
-    logger.info(f"Обновление статуса заявки с ID {request_id}.")
+    admin = conn.execute(AVAILABLE_ADMIN_QUERY).fetchone()
+    admin_id, admin_telegram_id = admin if admin else (None, None)
+
+    cursor = conn.execute(
+        """INSERT INTO requests (user_id, admin_id, category, address, description, status) 
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        (user_id, admin_id, request_data["category"], request_data.get("address", "-"),
+         request_data["description"], request_data['status']))
+    request_id = cursor.lastrowid
+
+    conn.executemany(
+        """INSERT INTO media (request_id, file_path, file_id, file_unique_id, mime_type, file_size) 
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [(request_id, media["path"], media["file_id"], media["file_unique_id"], media["mime_type"],
+          media["file_size"]) for media in media_files])
+
+    return request_id, admin_id, admin_telegram_id
+
+
+async def submit_request(user_id, request_data, media_files=()):
+    """
+    Подаёт заявку одной транзакцией: выбирает администратора, сохраняет заявку и записи о медиафайлах.
+    media_files — описания уже сохранённых медиафайлов (см. save_media.get_message_media).
+    Возвращает (ID заявки, ID администратора, Telegram ID администратора) или None при ошибке.
+    """
+    logger.debug("Подача заявки пользователя с ID %s.", user_id)
 
     try:
-        execute_db("""UPDATE requests SET status = 'closed' WHERE id = ?""", (request_id,), commit=True)
-        logger.info(f"Статус заявки с ID {request_id} обновлён на 'закрыта'.")
+        result = await db.run_transaction(_submit_request, user_id, request_data, list(media_files))
+        user_requests_cache.invalidate(user_id)
+        logger.info("Заявка пользователя с ID %s сохранена, ID заявки: %s, администратор: %s.",
+                    user_id, result[0], result[1])
+        return result
     except Exception as e:
-        logger.error(f"Ошибка при обновлении статуса заявки с ID {request_id}: {e}")
+        logger.error("Ошибка при подаче заявки пользователя с ID %s: %s", user_id, e)
+        return None
 
 
-def save_media_to_db(request_id, file_path):
+async def update_request_status_to_closed(request_id):
+    """
+    Обновляет статус заявки на 'закрыта' и сбрасывает кэш истории заявок её автора.
+    """
+    logger.debug("Обновление статуса заявки с ID %s.", request_id)
+
+    try:
+        row = await execute_db("""UPDATE requests SET status = 'closed' WHERE id = ? RETURNING user_id""",
+                               (request_id,), fetchone=True, commit=True)
+        if row:
+            user_requests_cache.invalidate(row[0])
+        logger.info("Статус заявки с ID %s обновлён на 'закрыта'.", request_id)
+    except Exception as e:
+        logger.error("Ошибка при обновлении статуса заявки с ID %s: %s", request_id, e)
+
+
+def open_requests_page_query(after, limit, admin_id=None):
+    """Возвращает запрос и параметры страницы очереди открытых заявок (см. get_open_requests_page)."""
+    conditions = ["r.status = 'open'"]
+    params = []
+    if admin_id is not None:
+        conditions.append("r.admin_id = ?")
+        params.append(admin_id)
+        if after is not None:
+            conditions.append("r.id > ?")
+            params.append(after[1])
+    elif after is not None:
+        if after[0] is None:
+            # Заявки без администратора идут первыми, за ними — все назначенные
+            conditions.append("(r.admin_id IS NULL AND r.id > ? OR r.admin_id IS NOT NULL)")
+            params.append(after[1])
+        else:
+            conditions.append("(r.admin_id, r.id) > (?, ?)")
+            params.extend(after)
+
+    return OPEN_REQUESTS_PAGE_QUERY.format(conditions=" AND ".join(conditions)), (*params, limit + 1)
+
+
+async def get_open_requests_page(after=None, limit=5, admin_id=None):
+    """
+    Возвращает страницу открытых заявок в порядке (admin_id, id) и признак наличия следующей страницы.
+    after — ключ (admin_id, id) последней заявки предыдущей страницы, None — первая страница.
+    С admin_id возвращаются только заявки этого администратора.
+    Страница читается по индексу (status, admin_id) без OFFSET, поэтому её время не зависит от номера страницы.
+    """
+    logger.debug("Получение страницы открытых заявок после %s (администратор %s).", after, admin_id)
+
+    query, params = open_requests_page_query(after, limit, admin_id)
+    rows = await execute_db(query, params, fetchall=True)
+
+    requests = [
+        {"request_id": row[0], "admin_id": row[1], "category": row[2], "address": row[3],
+         "description": row[4], "created_at": row[5], "user_fio": row[6], "admin_fio": row[7]}
+        for row in rows or []
+    ]
+    return requests[:limit], len(requests) > limit
+
+
+async def get_user_requests_page(user_id, before=None, after=None, limit=5):
+    """
+    Возвращает страницу истории заявок пользователя (новые первыми) и признаки наличия
+    более старых и более новых заявок: (заявки, has_older, has_newer).
+    before — ID заявки, старше которой читается страница (None — самые новые заявки);
+    after — ID заявки, новее которой читается страница (переход назад).
+    Страница читается по индексу (user_id, id) и кэшируется до изменения заявок пользователя.
+    """
+    pages = user_requests_cache.get(user_id)
+    if pages is MISSING:
+        pages = {}
+        user_requests_cache.set(user_id, pages)
+    elif (before, after) in pages:
+        return pages[(before, after)]
+
+    logger.debug("Получение истории заявок пользователя с ID %s (до %s, после %s).", user_id, before, after)
+
+    if after is not None:
+        rows = await execute_db(USER_REQUESTS_NEWER_QUERY, (user_id, after, limit + 1), fetchall=True)
+        if rows is not None and len(rows) <= limit:
+            # Дошли до самых новых заявок — показываем первую страницу целиком
+            return await get_user_requests_page(user_id, limit=limit)
+        has_older, has_newer = True, True
+    else:
+        rows = await execute_db(USER_REQUESTS_OLDER_QUERY, (user_id, before, limit + 1), fetchall=True)
+        has_older, has_newer = rows is not None and len(rows) > limit, before is not None
+
+    if rows is None:
+        # Ошибка запроса не кэшируется
+        return [], False, False
+
+    rows = rows[:limit]
+    if after is not None:
+        rows.reverse()
+    requests = [
+        {"request_id": row[0], "category": row[1], "address": row[2], "description": row[3],
+         "status": row[4], "created_at": row[5]}
+        for row in rows
+    ]
+    pages[(before, after)] = (requests, has_older, has_newer)
+    return requests, has_older, has_newer
+
+
+def search_terms(text):
+    """
+    Возвращает префиксы слов текста поиска, которые затем ищутся как префиксы (см. build_search_query).
+    Вместо стемминга у слов из букв отбрасывается окончание: у слов из 6 и более букв — две последние буквы,
+    у слов из 5 букв — одна («особенную» → «особенн», находит «особенная»; «двора» → «двор»), слова до 4 букв
+    остаются целыми. Однобуквенные слова вроде «д» и «г» пропускаются, числа не меняются.
+    Стеммеры FTS5 (porter) работают только с английским, поэтому окончания отбрасываются здесь.
+    """
+    terms = []
+    for word in re.findall(r"\w+", text.lower()):
+        if word.isalpha():
+            if len(word) < 2:
+                continue
+            if len(word) >= 5:
+                word = word[:-2] if len(word) >= 6 else word[:-1]
+        terms.append(word)
+    return terms
+
+
+def build_search_query(text):
+    """
+    Преобразует текст поиска в запрос FTS5: слова ищутся как префиксы, числа (номера домов, заявок) — точно,
+    все они должны встретиться в описании или адресе. Возвращает None, если слов нет.
+    """
+    terms = search_terms(text)
+    return " ".join(f'"{term}"' if term.isdigit() else f'"{term}"*' for term in terms) if terms else None
+
+
+async def search_requests(text, page=0, limit=5, max_matches=1000):
+    """
+    Ищет заявки по словам в описании и адресе.
+    Ранжирует (bm25, совпадения в адресе весят вдвое больше) не более max_matches самых новых совпадений,
+    поэтому время поиска не растёт с размером истории заявок.
+    Возвращает страницу результатов и признак наличия следующей страницы.
+    """
+    match = build_search_query(text)
+    if not match:
+        return [], False
+
+    logger.debug("Поиск заявок: %s, страница %s.", match, page)
+
+    rows = await execute_db(
+        """WITH matches AS (
+               SELECT rowid AS id, bm25(requests_fts, 1.0, 2.0) AS score
+               FROM requests_fts
+               WHERE requests_fts MATCH ?
+               ORDER BY rowid DESC
+               LIMIT ?
+           )
+           SELECT r.id, r.category, r.address, r.description, r.status, r.created_at
+           FROM matches m
+           JOIN requests r ON r.id = m.id
+           ORDER BY m.score, m.id DESC
+           LIMIT ? OFFSET ?""",
+        (match, max_matches, limit + 1, page * limit), fetchall=True)
+
+    requests = [
+        {"request_id": row[0], "category": row[1], "address": row[2], "description": row[3],
+         "status": row[4], "created_at": row[5]}
+        for row in rows or []
+    ]
+    return requests[:limit], len(requests) > limit
+
+
+async def select_open_requests(request_ids=None, text=None, limit=200):
+    """
+    Выбирает для массового ответа открытые заявки по списку ID или по словам в описании и адресе
+    вместе с контактами их авторов. Возвращает не более limit заявок в порядке ID.
+    """
+    columns = "r.id, r.category, r.address, u.telegram_id, u.email, u.role"
+    if request_ids:
+        request_ids = list(dict.fromkeys(request_ids))[:limit]
+        placeholders = ", ".join("?" * len(request_ids))
+        rows = await execute_db(
+            f"""SELECT {columns} 
+                FROM requests r 
+                JOIN users u ON u.id = r.user_id 
+                WHERE r.status = 'open' AND r.id IN ({placeholders}) 
+                ORDER BY r.id""",
+            request_ids, fetchall=True)
+    else:
+        match = build_search_query(text or "")
+        if not match:
+            return []
+        rows = await execute_db(
+            f"""SELECT {columns} 
+                FROM requests_fts f 
+                JOIN requests r ON r.id = f.rowid 
+                JOIN users u ON u.id = r.user_id 
+                WHERE requests_fts MATCH ? AND r.status = 'open' 
+                ORDER BY r.id 
+                LIMIT ?""",
+            (match, limit), fetchall=True)
+
+    return [
+        {"request_id": row[0], "category": row[1], "address": row[2],
+         "telegram_id": row[3], "email": row[4], "role": row[5]}
+        for row in rows or []
+    ]
+
+
+def _close_requests(conn, request_ids, sender_id, text, emails):
+    """
+    Единица работы массового ответа: закрытие ещё открытых заявок, сохранение ответа по каждой
+    и постановка писем в очередь. Выполняется внутри транзакции писателя.
+    """
+    placeholders = ", ".join("?" * len(request_ids))
+    closed = conn.execute(
+        f"""UPDATE requests SET status = 'closed' 
+            WHERE status = 'open' AND id IN ({placeholders}) 
+            RETURNING id, user_id""",
+        list(request_ids)).fetchall()
+
+    conn.executemany("""INSERT INTO messages (request_id, sender_id, message) VALUES (?, ?, ?)""",
+                     [(request_id, sender_id, text) for request_id, _ in closed])
+    conn.executemany(
+        """INSERT INTO email_outbox (recipient, subject, body, next_attempt_at) 
+           VALUES (?, ?, ?, strftime('%s', 'now'))""",
+        [emails[request_id] for request_id, _ in closed if request_id in emails])
+    return closed
+
+
+async def close_requests(request_ids, sender_id, text, emails=None):
+    """
+    Закрывает открытые заявки из request_ids одной транзакцией, сохраняет по каждой ответ text
+    и ставит в очередь письма emails ({ID заявки: (адрес, тема, текст)}).
+    Заявки, закрытые к этому моменту, пропускаются. Возвращает ID закрытых заявок или None при ошибке.
+    """
+    if not request_ids:
+        return []
+
+    logger.debug("Массовое закрытие заявок: %s.", len(request_ids))
+
+    try:
+        closed = await db.run_transaction(_close_requests, list(request_ids), sender_id, text, emails or {})
+    except Exception as e:
+        logger.error("Ошибка при массовом закрытии заявок: %s", e)
+        return None
+
+    for _, user_id in closed:
+        user_requests_cache.invalidate(user_id)
+    logger.info("Закрыто заявок: %s из %s.", len(closed), len(request_ids))
+    return [request_id for request_id, _ in closed]
+
+
+async def save_media_to_db(request_id, file_path):
     """
     Сохраняет путь к медиафайлу в БД.
     """
-    logger.info(f"Сохранение пути к файлу для заявки с ID {request_id}.")
+    logger.debug("Сохранение пути к файлу для заявки с ID %s.", request_id)
 
     try:
-        execute_db(
+        await execute_db(
             """INSERT INTO media (request_id, file_path) VALUES (?, ?)""",
             (request_id, file_path),
             commit=True
         )
-        logger.info(f"Путь к файлу {file_path} сохранён.")
+        logger.info("Путь к файлу %s сохранён.", file_path)
+    except Exception as e:
+        logger.error("Ошибка при сохранении пути к файлу %s для заявки с ID %s: %s", file_path, request_id, e)
+
+
+def _save_message(conn, request_id, sender_id, text, media):
+    cursor = conn.execute("""INSERT INTO messages (request_id, sender_id, message) VALUES (?, ?, ?)""",
+                          (request_id, sender_id, text))
+    message_id = cursor.lastrowid
+    if media and media.get("path"):
+        conn.execute(
+            """INSERT INTO media (message_id, file_path, file_id, file_unique_id, mime_type, file_size) 
+               VALUES (?, ?, ?, ?, ?, ?)""",
+            (message_id, media["path"], media["file_id"], media["file_unique_id"], media["mime_type"],
+             media["file_size"]))
+    return message_id
+
+
+async def save_message(request_id, sender_id, text, media=None):
+    """
+    Сохраняет сообщение по заявке (например, ответ администратора) и его медиафайл одной транзакцией.
+    """
+    logger.debug("Сохранение сообщения по заявке с ID %s.", request_id)
+
+    try:
+        return await db.run_transaction(_save_message, request_id, sender_id, text, media)
     except Exception as e:
-        logger.error(f"Ошибка при сохранении пути к файлу {file_path} для заявки с ID {request_id}: {e}")
+        logger.error("Ошибка при сохранении сообщения по заявке с ID %s: %s", request_id, e)
+        return None
+
+
+async def get_cached_address(key):
+    """
+    Возвращает закэшированный адрес по ключу округлённых координат.
+    """
+    row = await execute_db("SELECT address FROM geocode_cache WHERE coordinates = ?", (key,), fetchone=True)
+    return row[0] if row else None
+
+
+async def save_cached_address(key, address):
+    """
+    Сохраняет адрес для ключа округлённых координат.
+    """
+    await execute_db("INSERT OR REPLACE INTO geocode_cache (coordinates, address) VALUES (?, ?)",
+                     (key, address), commit=True)
+
+
+async def enqueue_email(recipient, subject, body, attachment_path=None):
+    """
+    Ставит письмо в очередь на отправку (таблица email_outbox).
+    """
+    logger.debug("Постановка письма для %s в очередь: %s.", recipient, subject)
+
+    return await execute_db(
+        """INSERT INTO email_outbox (recipient, subject, body, attachment_path, next_attempt_at) 
+           VALUES (?, ?, ?, ?, strftime('%s', 'now'))""",
+        (recipient, subject, body, attachment_path), commit=True)
+
+
+async def get_due_emails(limit):
+    """
+    Возвращает письма из очереди, время отправки которых наступило.
+    """
+    rows = await execute_db(
+        """SELECT id, recipient, subject, body, attachment_path, attempts 
+           FROM email_outbox 
+           WHERE status = 'pending' AND next_attempt_at <= strftime('%s', 'now') 
+           ORDER BY next_attempt_at 
+           LIMIT ?""",
+        (limit,), fetchall=True)
+
+    return [
+        {"id": row[0], "recipient": row[1], "subject": row[2], "body": row[3],
+         "attachment_path": row[4], "attempts": row[5]}
+        for row in rows or []
+    ]
+
+
+async def mark_email_sent(email_id):
+    """
+    Отмечает письмо как отправленное.
+    """
+    await execute_db("""UPDATE email_outbox SET status = 'sent', sent_at = DATETIME('now', '+3 hours') WHERE id = ?""",
+                     (email_id,), commit=True)
+
+
+async def mark_email_retry(email_id, error, delay, give_up=False):
+    """
+    Откладывает повторную отправку письма на delay секунд или отмечает его как неотправленное.
+    """
+    await execute_db(
+        """UPDATE email_outbox 
+           SET attempts = attempts + 1, last_error = ?, 
+               status = CASE WHEN ? THEN 'failed' ELSE 'pending' END, 
+               next_attempt_at = strftime('%s', 'now') + ? 
+           WHERE id = ?""",
+        (str(error), give_up, delay, email_id), commit=True)
+
+
+async def get_email_queue_depth():
+    """
+    Возвращает количество писем, ожидающих отправки.
+    """
+    row = await execute_db("SELECT COUNT(*) FROM email_outbox WHERE status = 'pending'", fetchone=True)
+    return row[0] if row else 0
+
+
+async def get_request_stats(days=1):
+    """
+    Возвращает количество заявок по статусам, категориям и администраторам за последние days дней
+    (включая сегодняшний) из ежедневной статистики, не обращаясь к таблице заявок.
+    """
+    logger.debug("Получение статистики заявок за %s дн.", days)
+
+    rows = await execute_db(REQUEST_STATS_QUERY, (f"-{int(days) - 1} days",), fetchall=True)
+
+    stats = {"total": 0, "status": {}, "category": {}, "admin": {}}
+    for category, status, admin_id, admin_fio, count in rows or []:
+        if not count:
+            continue
+        admin = admin_fio or ("—" if not admin_id else f"ID {admin_id}")
+        stats["total"] += count
+        stats["status"][status or "—"] = stats["status"].get(status or "—", 0) + count
+        stats["category"][category or "—"] = stats["category"].get(category or "—", 0) + count
+        stats["admin"][admin] = stats["admin"].get(admin, 0) + count
+
+    return stats
+
+
+async def get_referenced_media_paths(paths):
+    """
+    Возвращает те пути из paths, на которые ссылаются медиафайлы в БД или письма в очереди отправки.
+    """
+    if not paths:
+        return set()
+
+    placeholders = ", ".join("?" * len(paths))
+    rows = await execute_db(REFERENCED_MEDIA_QUERY.format(placeholders=placeholders), (*paths, *paths), fetchall=True)
+    if rows is None:
+        # Ошибка запроса: считаем все файлы используемыми, чтобы ничего не удалить по ошибке
+        return set(paths)
+    return {row[0] for row in rows}
+
+
+async def get_evictable_media(after_id, limit):
+    """
+    Возвращает (ID, путь) медиафайлов закрытых заявок после after_id в порядке добавления.
+    Файлы, на которые ссылаются открытые заявки или неотправленные письма, не возвращаются:
+    их копия на диске ещё нужна.
+    """
+    rows = await execute_db(
+        """SELECT m.id, m.file_path 
+           FROM media m 
+           LEFT JOIN messages msg ON msg.id = m.message_id 
+           JOIN requests r ON r.id = COALESCE(m.request_id, msg.request_id) 
+           WHERE m.id > ? AND r.status = 'closed' AND m.file_id IS NOT NULL 
+             AND NOT EXISTS (
+                 SELECT 1 FROM media o 
+                 LEFT JOIN messages om ON om.id = o.message_id 
+                 JOIN requests orq ON orq.id = COALESCE(o.request_id, om.request_id) 
+                 WHERE o.file_path = m.file_path AND orq.status != 'closed') 
+             AND NOT EXISTS (
+                 SELECT 1 FROM email_outbox e 
+                 WHERE e.status = 'pending' AND e.attachment_path = m.file_path) 
+           ORDER BY m.id 
+           LIMIT ?""",
+        (after_id, limit), fetchall=True)
+    return rows or []